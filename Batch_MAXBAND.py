@@ -0,0 +1,311 @@
+import argparse
+import json
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from os import cpu_count, listdir
+from os.path import basename, dirname, isabs, isdir, join, splitext
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from config import Config
+from Presolve_MAXBAND import check_batch
+from Result_Cache import ResultCache
+from Result_Store import ResultStore, store_results
+from Run_MAXBAND import Corridor, RunMaxband, status_dict
+from Scenario_File import read_scenarios
+from Solver_Backends import backends, get_backend
+from Solver_Telemetry import write_telemetry
+
+
+def find_scenario_files(source: str) -> List[str]:
+    """Lists the .ini scenario files in a directory, or the files named in a manifest (one path per line)"""
+    if isdir(source):
+        return sorted(join(source, f) for f in listdir(source) if f.endswith('.ini'))
+    paths = []
+    with open(source) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            paths.append(line if isabs(line) else join(dirname(source), line))  # relative to the manifest
+    return paths
+
+
+def load_scenario(path: str) -> dict:
+    cfg = Config(path)
+    if not cfg.exist:
+        raise FileNotFoundError(f'Scenario file {path} does not exist')
+    return cfg.get_run_inputs()
+
+
+def solve_scenario(name: str, inputs: dict, solver=None, backend='cbc', cache: Optional[ResultCache] = None,
+                   time_limit: Optional[float] = None, threads: Optional[int] = None,
+                   input_warnings: Optional[List[str]] = None) -> dict:
+    """Solves one scenario, a failing scenario is recorded with its error instead of stopping the batch. A backend
+    given by name (without a solver) is created with the time limit [s] and threads, as part of the scenario, so a
+    backend that cannot be created fails the scenario as well. The input warnings of a validated scenario
+    (validate_scenarios) spare RunMaxband checking the inputs again."""
+    try:
+        if isinstance(backend, str) and solver is None:
+            backend = get_backend(backend, time_limit=time_limit, threads=threads)
+        runner = RunMaxband(inputs, solver, backend, cache, input_warnings=input_warnings)
+        outputs, status = runner.run_maxband()
+    except Exception as e:
+        return error_record(name, e)
+    record = {'scenario': name}
+    record['status'] = status
+    record['status_text'] = status_dict.get(status, 'Undefined')
+    record['outputs'] = outputs
+    record['telemetry'] = runner.telemetry
+    return record
+
+
+def error_record(name: str, error: Exception) -> dict:
+    """The record of a scenario that failed with the error"""
+    return {'scenario': name, 'status': None, 'error': f'{type(error).__name__}: {error}'}
+
+
+def threads_per_worker(workers: int) -> int:
+    """Splits the cores evenly over the workers, so the CBC threads of all workers together do not oversubscribe"""
+    return max(1, (cpu_count() or 1) // workers)
+
+
+def _solve_in_worker(name: str, inputs: dict, threads: int, timeout: Optional[float], backend: str,
+                     input_warnings: Optional[List[str]] = None) -> dict:
+    # The solver is created inside the worker process, so nothing but plain dicts cross the process boundary
+    return solve_scenario(name, inputs, backend=backend, time_limit=timeout, threads=threads,
+                          input_warnings=input_warnings)
+
+
+def validate_scenarios(scenarios: Iterable[dict], chunk_size: int = 1000) -> Iterator[dict]:
+    """Parses loaded scenarios and checks them with Presolve_MAXBAND.check_batch, chunk_size scenarios at a time, so
+    no scenario without a solution gets to a solver. Only errors reject a scenario: a valid scenario is passed on with
+    its Corridor and the warnings about its inputs under 'warnings' (a list, empty without), which mark it as checked
+    for the solve. One that cannot be parsed is yielded as a record with status None and the error, one without a
+    solution as a record with status -1 and the reasons in telemetry['infeasible_inputs'] and the warnings in
+    telemetry['input_warnings'], as RunMaxband gives them. Records passed in (scenarios that failed to load) are passed
+    on."""
+    scenarios = iter(scenarios)
+    while True:
+        chunk = list(islice(scenarios, chunk_size))
+        if not chunk:
+            return
+        parsed = []
+        for scenario in chunk:
+            if 'status' in scenario:
+                yield scenario
+                continue
+            try:
+                corridor = scenario.get('corridor') or Corridor.from_inputs(scenario['inputs'])
+            except (ValueError, KeyError, TypeError) as e:
+                yield dict(scenario_fields(scenario), status=None, error=f'{type(e).__name__}: {e}')
+                continue
+            parsed.append(dict(scenario, corridor=corridor))
+        problems, warnings = check_batch([scenario['corridor'].params() for scenario in parsed])
+        for scenario, scenario_problems, scenario_warnings in zip(parsed, problems, warnings):
+            if scenario_problems:
+                record = dict(scenario_fields(scenario), status=-1, status_text=status_dict[-1], outputs=dict(),
+                              telemetry={'status': -1, 'infeasible_inputs': scenario_problems})
+                yield with_warnings(record, scenario_warnings)
+            else:
+                yield dict(scenario, warnings=scenario_warnings)
+
+
+def with_warnings(record: dict, warnings: Optional[List[str]]) -> dict:
+    """The record with the warnings about the inputs of its scenario in telemetry['input_warnings']"""
+    if warnings:
+        record.setdefault('telemetry', dict())['input_warnings'] = warnings
+    return record
+
+
+def scenario_fields(scenario: dict) -> dict:
+    """The name and path of a loaded scenario, without its inputs"""
+    return {key: value for key, value in scenario.items() if key not in ('inputs', 'corridor', 'warnings')}
+
+
+def solve_batch(inputs_list: Sequence[dict], names: Optional[Sequence[str]] = None, workers: Optional[int] = None,
+                timeout: Optional[float] = None, backend: str = 'cbc', cache: Optional[ResultCache] = None,
+                validate: bool = True) -> Iterator[dict]:
+    """Solves a list of input dicts (or Corridors) in a pool of worker processes and yields each record as soon as
+    it finishes, so not in input order. The timeout [s] is passed to the solver per scenario, which then returns its
+    best solution. With a cache, cached scenarios are answered directly and identical scenarios are solved only once.
+    With validate the inputs are checked first (validate_scenarios), those without a solution are answered without
+    taking up a worker. A worker that fails (e.g. the process is killed) gives a record with status None and the
+    error for the scenarios it solved, the others are solved on."""
+    if names is not None and len(names) != len(inputs_list):
+        raise ValueError(f'{len(names)} names for {len(inputs_list)} scenarios')
+    names = names or [str(i) for i in range(len(inputs_list))]
+    scenarios = ({'scenario': name, 'inputs': inputs} for name, inputs in zip(names, inputs_list))
+    if validate:
+        scenarios = validate_scenarios(scenarios)
+    for _, record in solve_in_pool(scenarios, workers or cpu_count() or 1, timeout, backend, cache):
+        yield record
+
+
+def solve_in_pool(scenarios: Iterable[dict], workers: int, timeout: Optional[float] = None, backend: str = 'cbc',
+                  cache: Optional[ResultCache] = None, window: Optional[int] = None) -> Iterator[Tuple[dict, dict]]:
+    """Solves scenarios ({'scenario', 'inputs'} or validated ones with their Corridor) in a pool of worker processes
+    and yields every scenario with its record as soon as it finishes. At most window solves (default: twice the
+    workers) are in flight, the scenarios are read on as solves finish, so a long stream of scenarios is solved from
+    the start and never held in memory as a whole. Records passed in are yielded as they are. With a cache, cached
+    scenarios are answered directly and scenarios with the inputs of one in flight wait for its record."""
+    window = window or 2 * workers
+    threads = threads_per_worker(workers)
+    in_flight = dict()  # key -> scenarios with these inputs
+    futures = dict()  # future -> key
+
+    def finish(done: Iterable) -> Iterator[Tuple[dict, dict]]:
+        for future in done:
+            key = futures.pop(future)
+            group = in_flight.pop(key)
+            try:
+                record = future.result()
+            except Exception as e:  # the worker process died, as BrokenProcessPool
+                record = error_record(group[0]['scenario'], e)
+            if cache is not None and 'outputs' in record:
+                cache.put(key, record['outputs'], record['status'], record.get('telemetry'))
+            for scenario in group:
+                yield scenario, with_warnings(dict(record, scenario=scenario['scenario']), scenario.get('warnings'))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for index, scenario in enumerate(scenarios):
+            if 'status' in scenario:
+                yield scenario, scenario
+                continue
+            name, inputs = scenario['scenario'], scenario.get('corridor', scenario.get('inputs'))
+            try:
+                key = cache.key(inputs, backend) if cache is not None else str(index)
+            except Exception:
+                key = str(index)  # unparsable inputs, the worker records the error
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                outputs, status = cached
+                record = {'scenario': name, 'status': status, 'status_text': status_dict.get(status, 'Undefined'),
+                          'outputs': outputs, 'telemetry': {'backend': backend, 'cache_hit': True, 'status': status}}
+                yield scenario, with_warnings(record, scenario.get('warnings'))
+                continue
+            if key in in_flight:
+                in_flight[key].append(scenario)
+                continue
+            in_flight[key] = [scenario]
+            futures[pool.submit(_solve_in_worker, name, inputs, threads, timeout, backend,
+                                scenario.get('warnings'))] = key
+            while len(futures) >= window:
+                yield from finish(wait(futures, return_when=FIRST_COMPLETED).done)
+        while futures:
+            yield from finish(wait(futures, return_when=FIRST_COMPLETED).done)
+
+
+def load_scenarios(paths: Iterable[str]) -> Iterator[dict]:
+    """Loads .ini scenario files as {'scenario', 'path', 'inputs'}, a file that cannot be loaded as
+    {'scenario', 'path', 'status': None, 'error'}"""
+    for path in paths:
+        name = splitext(basename(path))[0]
+        try:
+            yield {'scenario': name, 'path': path, 'inputs': load_scenario(path)}
+        except Exception as e:
+            yield {'scenario': name, 'path': path, 'status': None, 'error': f'{type(e).__name__}: {e}'}
+
+
+def run_batch(paths: Iterable[str], workers: int = 1, timeout: Optional[float] = None, backend: str = 'cbc',
+              cache: Optional[ResultCache] = None, keep_inputs: bool = False) -> Iterator[dict]:
+    """Loads and solves scenario files, see run_scenarios"""
+    return run_scenarios(load_scenarios(paths), workers, timeout, backend, cache, keep_inputs)
+
+
+def run_scenarios(scenarios: Iterable[dict], workers: int = 1, timeout: Optional[float] = None, backend: str = 'cbc',
+                  cache: Optional[ResultCache] = None, keep_inputs: bool = False) -> Iterator[dict]:
+    """Solves loaded scenarios (load_scenarios, Scenario_File.read_scenarios), in the calling process for one worker,
+    otherwise in a pool of worker processes (solve_in_pool) while the scenarios are still being read. Scenarios that
+    failed to load are passed on as they are, the others are checked by validate_scenarios before they are solved.
+    With keep_inputs every record holds the inputs of its scenario as well."""
+    if workers > 1:
+        for scenario, record in solve_in_pool(validate_scenarios(scenarios), workers, timeout, backend, cache):
+            yield scenario_record(scenario, record, keep_inputs)
+        return
+    for scenario in validate_scenarios(scenarios):
+        if 'status' in scenario:
+            yield scenario
+            continue
+        record = solve_scenario(scenario['scenario'], scenario['corridor'], backend=backend, cache=cache,
+                                time_limit=timeout, input_warnings=scenario['warnings'])
+        yield scenario_record(scenario, with_warnings(record, scenario.get('warnings')), keep_inputs)
+
+
+def scenario_record(scenario: dict, record: dict, keep_inputs: bool = False) -> dict:
+    """The record of a solved scenario with its name and path, and with keep_inputs its inputs"""
+    if record is scenario:  # a scenario that failed to load or validate
+        return record
+    record.update(scenario=scenario['scenario'], path=scenario['path'])
+    if keep_inputs:
+        record['inputs'] = scenario['inputs']
+    return record
+
+
+def write_results(records: Iterable[dict], path: str, fmt: str = 'jsonl') -> int:
+    """Writes the result records as JSON lines (streamed) or as a single JSON list, returns the number written"""
+    count = 0
+    with open(path, 'w') as out:
+        if fmt == 'jsonl':
+            for record in records:
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                count += 1
+        elif fmt == 'json':
+            records = list(records)
+            json.dump(records, out, indent=2)
+            count = len(records)
+        else:
+            raise ValueError(f'Unknown output format {fmt}')
+    return count
+
+
+def emit_telemetry(records: Iterable[dict], path: str) -> Iterator[dict]:
+    """Passes the records on, appending the telemetry of each to a JSON lines file on the way"""
+    for record in records:
+        if 'telemetry' in record:
+            write_telemetry(path, {'scenario': record['scenario'], **record['telemetry']})
+        yield record
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Solve MAXBAND scenarios without the GUI.')
+    parser.add_argument('source', help='Directory with .ini scenario files, a manifest listing one file per line, or a '
+                                       '.jsonl scenario file (Scenario_File)')
+    parser.add_argument('-o', '--output', default='results.jsonl', help='Result file (default: results.jsonl)')
+    parser.add_argument('-f', '--format', choices=['jsonl', 'json'], default='jsonl', help='Result file format')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='Time limit [s] of the solver per scenario, after which it returns its best solution; '
+                             'not a wall-clock timeout, building the model and starting the solver come on top')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes (default: 1)')
+    parser.add_argument('-b', '--backend', choices=list(backends), default='cbc', help='Solver backend (default: cbc)')
+    parser.add_argument('--cache-dir', default=None, help='Directory of the on-disk result cache, shared between runs')
+    parser.add_argument('--telemetry', default=None, help='Append phase timings and solver progress per scenario '
+                                                          'to this JSON lines file')
+    parser.add_argument('--store', default=None, help='Also append inputs, outputs, status and telemetry of every '
+                                                      'scenario to the columnar result store in this directory')
+    parser.add_argument('--store-format', choices=['npy', 'parquet'], default='npy',
+                        help='Format of a new result store (default: npy)')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    if args.source.endswith('.jsonl'):
+        scenarios = read_scenarios(args.source)
+    else:
+        scenarios = load_scenarios(find_scenario_files(args.source))
+    cache = ResultCache(directory=args.cache_dir) if args.cache_dir else ResultCache()
+    records = run_scenarios(scenarios, args.workers, args.time_limit, args.backend, cache,
+                            keep_inputs=args.store is not None)
+    if args.telemetry is not None:
+        records = emit_telemetry(records, args.telemetry)
+    if args.store is not None:
+        records = store_results(records, ResultStore(args.store, fmt=args.store_format))
+    count = write_results(records, args.output, args.format)
+    print(f'Solved {count} scenarios, results written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
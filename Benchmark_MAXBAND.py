@@ -0,0 +1,215 @@
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+import pulp as lp
+
+from Maxband_Matrix import MaxbandMatrix, MultibandMatrix, solve_milp
+from Robust_MAXBAND import RobustMaxband, demand_scenarios
+from Run_MAXBAND import MaxbandModel, constraint_flags, parse_inputs
+from Solver_Backends import backends, get_backend
+from Solver_Telemetry import parse_cbc_log
+
+
+def make_corridor(nsignals: int, seed: int = 0, selections: Optional[dict] = None, volumes: bool = False) -> dict:
+    """A synthetic arterial in the input layout of the GUI, with realistic distances and splits. The left turn of
+    one direction always fits in the red of the other direction. With volumes every link gets an outbound and an
+    inbound volume [veh/h] for the multiband model."""
+    rng = np.random.default_rng(seed)
+    outbound_r = rng.uniform(0.35, 0.55, nsignals)
+    inbound_r = np.clip(outbound_r + rng.uniform(-0.05, 0.05, nsignals), 0.3, 0.6)
+    outbound_tau = rng.uniform(0.0, 0.05, nsignals)
+    inbound_tau = rng.uniform(0.0, 0.05, nsignals)
+    outbound_tau[0] = 0.0  # no queue clearance at the first intersection of either direction
+    inbound_tau[-1] = 0.0
+    distances = rng.integers(200, 600, nsignals - 1)
+
+    def fmt(values):
+        return [f'{v:.3f}' for v in values]
+    corridor = {
+        'SingleInputs': {'nsignals': str(nsignals), 'c_min': '60', 'c_max': '120', 'v_min': '30', 'v_max': '60',
+                         'inv_dv_min': '0.05', 'inv_dv_max': '0.05', 'k': '1'},
+        'SegmentInputs': {'outbound_d': [str(d) for d in distances], 'inbound_d': [str(d) for d in distances]},
+        'SignalInputs': {'outbound_r': fmt(outbound_r), 'inbound_r': fmt(inbound_r),
+                         'outbound_l': fmt(rng.uniform(0.05, 0.25) * inbound_r),
+                         'inbound_l': fmt(rng.uniform(0.05, 0.25) * outbound_r),
+                         'outbound_tau': fmt(outbound_tau), 'inbound_tau': fmt(inbound_tau)},
+        'Selections': selections if selections is not None else dict.fromkeys(constraint_flags, False)
+    }
+    if volumes:
+        corridor['SegmentInputs']['outbound_volume'] = [f'{v:.0f}' for v in rng.uniform(200, 1500, nsignals - 1)]
+        corridor['SegmentInputs']['inbound_volume'] = [f'{v:.0f}' for v in rng.uniform(200, 1500, nsignals - 1)]
+    return corridor
+
+
+def best_time(function, repeat: int) -> float:
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def print_row(row: dict) -> None:
+    """Prints a row of a benchmark as key=value pairs, floats to 4 significant digits"""
+    print(', '.join(f'{key}={value:.4g}' if isinstance(value, float) else f'{key}={value}'
+                    for key, value in row.items()))
+
+
+def benchmark_scaling(sizes: List[int], backend_names: List[str], time_limit: Optional[float] = None,
+                      seed: int = 0, leftturnleadlag: bool = False) -> List[dict]:
+    """Build and solve time per corridor length, build times are the best of 5"""
+    rows = []
+    for nsignals in sizes:
+        selections = dict.fromkeys(constraint_flags, False)
+        selections['leftturnleadlag'] = leftturnleadlag
+        params = parse_inputs(make_corridor(nsignals, seed, selections))
+        row = {'nsignals': nsignals,
+               'build_pulp_ms': 1e3 * best_time(lambda: MaxbandModel(params), 5),
+               'build_matrix_ms': 1e3 * best_time(lambda: MaxbandMatrix(params), 5)}
+        for name in backend_names:
+            backend = get_backend(name, time_limit=time_limit)
+            start = time.perf_counter()
+            outputs, status = backend.solve(params)
+            row[f'{name}_solve_s'] = time.perf_counter() - start
+            row[f'{name}_status'] = status
+            row[f'{name}_band'] = outputs['OB_band']
+        rows.append(row)
+        print_row(row)
+    return rows
+
+
+def benchmark_multiband(sizes: List[int], time_limit: Optional[float] = None, seed: int = 0) -> List[dict]:
+    """Size and solve time of the multiband model against MAXBAND (both with scipy's HiGHS) per corridor length, on
+    corridors with random link volumes"""
+    rows = []
+    for nsignals in sizes:
+        params = parse_inputs(make_corridor(nsignals, seed, volumes=True))
+        row = {'nsignals': nsignals}
+        for name, matrix in [('maxband', MaxbandMatrix(params)), ('multiband', MultibandMatrix(params))]:
+            start = time.perf_counter()
+            outputs, status = matrix.solve(time_limit)
+            row[f'{name}_solve_s'] = time.perf_counter() - start
+            row[f'{name}_columns'] = matrix.n_columns
+            row[f'{name}_rows'] = matrix.n_rows
+            row[f'{name}_status'] = status
+            row[f'{name}_band'] = outputs['OB_band']
+        rows.append(row)
+        print_row(row)
+    return rows
+
+
+def solve_cbc_nodes(model: MaxbandModel, time_limit: Optional[float] = None) -> dict:
+    """Solves the model with CBC, returns the solve time and the objective and node count from its log"""
+    descriptor, log_path = tempfile.mkstemp(suffix='.log')
+    os.close(descriptor)
+    try:
+        start = time.perf_counter()
+        status = model.solve(lp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, logPath=log_path))
+        elapsed = time.perf_counter() - start
+        with open(log_path) as f:
+            progress = parse_cbc_log(f.read())
+    finally:
+        os.remove(log_path)
+    return {'solve_s': elapsed, 'status': status, 'objective': progress['objective'], 'nodes': progress['nodes']}
+
+
+def benchmark_presolve(sizes: List[int], time_limit: Optional[float] = None, seed: int = 0,
+                       leftturnleadlag: bool = False) -> List[dict]:
+    """Solve time and branch-and-bound nodes of CBC and scipy's HiGHS per corridor length, with the offsets free and
+    with the presolve bounds on them"""
+    rows = []
+    for nsignals in sizes:
+        selections = dict.fromkeys(constraint_flags, False)
+        selections['leftturnleadlag'] = leftturnleadlag
+        params = parse_inputs(make_corridor(nsignals, seed, selections))
+        row = {'nsignals': nsignals}
+        for presolve in [False, True]:
+            label = 'bounded' if presolve else 'free'
+            cbc = solve_cbc_nodes(MaxbandModel(params, presolve), time_limit)
+            row[f'cbc_{label}_solve_s'] = cbc['solve_s']
+            row[f'cbc_{label}_nodes'] = cbc['nodes']
+            mat, info = MaxbandMatrix(params, presolve), dict()
+            start = time.perf_counter()
+            solve_milp(mat.c, mat.A, mat.senses, mat.rhs, mat.lower, mat.upper, mat.integrality, time_limit, info)
+            row[f'highs_{label}_solve_s'] = time.perf_counter() - start
+            row[f'highs_{label}_nodes'] = info['nodes']
+        rows.append(row)
+        print_row(row)
+    return rows
+
+
+def benchmark_robust(counts: List[int], nsignals: int, time_limit: Optional[float] = None, seed: int = 0,
+                     leftturnleadlag: bool = False) -> List[dict]:
+    """Size and solve time (scipy's HiGHS) of the robust model of one corridor per number of demand scenarios, for
+    the expected and the worst-case bandwidth"""
+    selections = dict.fromkeys(constraint_flags, False)
+    selections['leftturnleadlag'] = leftturnleadlag
+    params = parse_inputs(make_corridor(nsignals, seed, selections))
+    rows = []
+    for count in counts:
+        scenarios = demand_scenarios(params, count, seed=seed)
+        row = {'scenarios': count}
+        for objective in ['expected', 'worst']:
+            start = time.perf_counter()
+            model = RobustMaxband(scenarios, objective=objective)
+            build = time.perf_counter()
+            results, status = model.solve(time_limit)
+            row[f'{objective}_build_s'] = build - start
+            row[f'{objective}_solve_s'] = time.perf_counter() - build
+            row[f'{objective}_status'] = status
+            row[f'{objective}_band'] = results[f'{objective}_band']
+        row['columns'] = model.n_columns
+        row['rows'] = model.n_rows
+        rows.append(row)
+        print_row(row)
+    return rows
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark MAXBAND model build and solve time against corridor '
+                                                 'length.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 10, 20, 30, 40, 50, 60])
+    parser.add_argument('--backends', nargs='+', choices=list(backends), default=['cbc'])
+    parser.add_argument('--time-limit', type=float, default=60, help='Solver time limit per instance [s]')
+    parser.add_argument('--leftturnleadlag', action='store_true', help='Optimize the left-turn patterns as well')
+    parser.add_argument('--multiband', action='store_true',
+                        help='Compare the multiband model with MAXBAND instead of the backends')
+    parser.add_argument('--presolve', action='store_true',
+                        help='Compare the node counts with and without the offset bounds instead of the backends')
+    parser.add_argument('--robust', type=int, default=None, metavar='NSIGNALS',
+                        help='Benchmark the robust model of a corridor of this length against the number of demand '
+                             'scenarios instead of the backends')
+    parser.add_argument('--scenarios', type=int, nargs='+', default=[1, 2, 5, 10, 20, 30, 40, 50],
+                        help='Numbers of demand scenarios for --robust')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None, help='Also write the table as CSV')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    if args.multiband:
+        rows = benchmark_multiband(args.sizes, args.time_limit, args.seed)
+    elif args.robust is not None:
+        rows = benchmark_robust(args.scenarios, args.robust, args.time_limit, args.seed, args.leftturnleadlag)
+    elif args.presolve:
+        rows = benchmark_presolve(args.sizes, args.time_limit, args.seed, args.leftturnleadlag)
+    else:
+        rows = benchmark_scaling(args.sizes, args.backends, args.time_limit, args.seed, args.leftturnleadlag)
+    if args.output is not None:
+        with open(args.output, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from os.path import abspath, dirname, join
+from typing import Dict, List, Optional, Tuple
+
+import Batch_MAXBAND
+from Benchmark_MAXBAND import make_corridor
+from Result_Store import ResultStore
+from Run_MAXBAND import RunMaxband, constraint_flags
+from Scenario_File import write_scenarios
+from Solver_Backends import backends, get_backend
+from Solver_Telemetry import proven_results
+
+# Left-turn modes: no left-turn optimization, free patterns, or patterns restricted by one of the lt flags
+left_turn_modes = [None, 'leftturnleadlag', 'lt_leadlag_flag', 'lt_leadlead_flag', 'lt_laglag_flag']
+other_flags = ['mi_mj_max_1_flag', 'm_max_1_flag', 'tau_cstr_flag', 'tau_sum_flag', 'w_0_flag', 'w_mono_flag']
+
+# Flag combinations for the longer corridors, where every combination would take too long
+core_combinations = [(), ('leftturnleadlag',), ('leftturnleadlag', 'lt_leadlag_flag'), ('tau_cstr_flag',),
+                     ('tau_sum_flag', 'w_mono_flag'), ('w_0_flag',), ('mi_mj_max_1_flag',), ('m_max_1_flag',)]
+
+synthetic_sizes = [3, 5, 10, 20, 40, 60]
+full_grid_max_signals = 7  # corridors up to this length are solved for every flag combination
+
+# Import budgets of the entry modules: the most time [s] a fresh interpreter may take to import each, and the heavy
+# packages it must not load, so library users of the solver core do not pay for the GUI and plotting
+import_budgets = {
+    'Run_MAXBAND': (0.5, ['matplotlib', 'scipy', 'tkinter']),
+    'Process_Results': (0.4, ['matplotlib', 'pulp', 'tkinter']),
+    'Batch_MAXBAND': (0.6, ['matplotlib', 'scipy', 'tkinter']),
+    'MB_GUI': (0.8, ['matplotlib', 'scipy']),
+}
+
+# The Almere arterial of the original settings, the only measured corridor
+almere = {
+    'SingleInputs': {'nsignals': '7', 'c_min': '66', 'c_max': '100', 'v_min': '30', 'v_max': '50',
+                     'inv_dv_min': '0.05', 'inv_dv_max': '0.05', 'k': '1'},
+    'SegmentInputs': {'outbound_d': ['374', '265', '277', '305', '260', '270'],
+                      'inbound_d': ['374', '265', '277', '305', '260', '270']},
+    'SignalInputs': {'outbound_r': ['0.586', '0.585', '0.621', '0.566', '0.647', '0.495', '0.497'],
+                     'inbound_r': ['0.619', '0.589', '0.680', '0.576', '0.482', '0.520', '0.557'],
+                     'outbound_l': ['0.103', '0.101', '0.113', '0.095', '0.000', '0.091', '0.084'],
+                     'inbound_l': ['0.104', '0.104', '0.106', '0.099', '0.429', '0.099', '0.097'],
+                     'outbound_tau': ['0.000', '0.030', '0.023', '0.044', '0.038', '0.069', '0.035'],
+                     'inbound_tau': ['0.024', '0.038', '0.019', '0.044', '0.020', '0.025', '0.000']}
+}
+
+
+def flag_combinations() -> List[Tuple[str, ...]]:
+    """Every valid combination of the Selections flags, the lt flags only apply with left-turn optimization"""
+    combinations = []
+    for mode in left_turn_modes:
+        left_turn = () if mode is None else ('leftturnleadlag',) + (() if mode == 'leftturnleadlag' else (mode,))
+        for values in itertools.product([False, True], repeat=len(other_flags)):
+            combinations.append(left_turn + tuple(flag for flag, on in zip(other_flags, values) if on))
+    return combinations
+
+
+def selections(flags: Tuple[str, ...]) -> dict:
+    selection = dict.fromkeys(constraint_flags, False)
+    selection.update(dict.fromkeys(flags, True))
+    return selection
+
+
+def reference_instances() -> Dict[str, dict]:
+    """The corridors of the suite without selections, the Almere arterial and synthetic corridors of 3 to 60
+    signals"""
+    instances = {'almere': almere}
+    for nsignals in synthetic_sizes:
+        corridor = make_corridor(nsignals, seed=nsignals)
+        del corridor['Selections']
+        instances[f'synthetic_{nsignals}'] = corridor
+    return instances
+
+
+def suite_cases(full: bool = False) -> Dict[str, dict]:
+    """Case name -> inputs. Short corridors get every flag combination, longer ones the core combinations"""
+    cases = dict()
+    for name, instance in reference_instances().items():
+        nsignals = int(instance['SingleInputs']['nsignals'])
+        combinations = flag_combinations() if full or nsignals <= full_grid_max_signals else core_combinations
+        for flags in combinations:
+            cases[f"{name}[{'+'.join(flags) or 'none'}]"] = dict(instance, Selections=selections(flags))
+    return cases
+
+
+def run_case(inputs: dict, backend: str, time_limit: Optional[float]) -> dict:
+    """Build and solve time [s] of RunMaxband, status and objective; proven tells whether the solver proved the
+    objective optimal, only then it serves as correctness oracle"""
+    runner = RunMaxband(inputs, backend=get_backend(backend, time_limit=time_limit))
+    outputs, status = runner.run_maxband()
+    phases = runner.telemetry.get('phases', {})
+    objective = None
+    if status in (1, 2) and outputs.get('OB_band') is not None:
+        objective = outputs['OB_band'] + float(inputs['SingleInputs']['k']) * outputs['IB_band']
+    result = runner.telemetry.get('result')
+    if result is None:  # the in-process backends report optimality in the status
+        proven = status in (1, -1)
+    else:  # CBC reports status 1 for a run stopped on the time limit as well
+        proven = result in proven_results
+    return {'status': status, 'objective': objective, 'proven': proven,
+            'build_s': sum(phases.get(phase, 0.0) for phase in ['parse', 'presolve', 'build']),
+            'solve_s': sum(phases.get(phase, 0.0) for phase in ['write_launch', 'solve', 'extract'])}
+
+
+def run_suite(cases: Dict[str, dict], backend: str = 'cbc', time_limit: Optional[float] = 60,
+              verbose: bool = True) -> Dict[str, dict]:
+    results = dict()
+    for name, inputs in cases.items():
+        results[name] = run_case(inputs, backend, time_limit)
+        if verbose:
+            result = results[name]
+            objective = 'None' if result['objective'] is None else f"{result['objective']:.6f}"
+            print(f"{name}: status={result['status']} objective={objective} build={1e3 * result['build_s']:.1f} ms "
+                  f"solve={1e3 * result['solve_s']:.1f} ms")
+    return results
+
+
+def compare_to_baseline(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float = 1.5,
+                        slack: float = 0.05, objective_tolerance: float = 1e-5) -> List[str]:
+    """Failures against the baseline: a changed status, a changed proven optimum, or a case or the suite as a whole
+    slower than tolerance times the baseline plus the slack [s], which keeps timer noise of fast cases and of short
+    suites from failing."""
+    failures = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]
+        if result['status'] != reference['status'] and result['proven'] and reference['proven']:
+            failures.append(f"{name}: status changed from {reference['status']} to {result['status']}")
+        elif result['proven'] and reference['proven'] and result['objective'] is not None \
+                and reference['objective'] is not None \
+                and abs(result['objective'] - reference['objective']) > objective_tolerance:
+            failures.append(f"{name}: optimum changed from {reference['objective']:.6f} to "
+                            f"{result['objective']:.6f}")
+        for key in ['build_s', 'solve_s']:
+            if result[key] > tolerance * reference[key] + slack:
+                failures.append(f'{name}: {key[:-2]} time {result[key]:.3f} s against {reference[key]:.3f} s in the '
+                                f'baseline')
+    for key in ['build_s', 'solve_s']:
+        total = sum(result[key] for name, result in results.items() if name in baseline)
+        reference = sum(baseline[name][key] for name in results if name in baseline)
+        if total > tolerance * reference + slack:
+            failures.append(f'suite: total {key[:-2]} time {total:.3f} s against {reference:.3f} s in the baseline')
+    return failures
+
+
+def measure_import(module: str, repeat: int = 3) -> Tuple[float, List[str]]:
+    """Best import time [s] of a module in a fresh interpreter over repeat runs, and the top-level packages it
+    loads"""
+    code = (f'import json, sys, time; start = time.perf_counter(); import {module}; '
+            f'print(json.dumps([time.perf_counter() - start, sorted({{name.split(".")[0] for name in sys.modules}})]))')
+    best, packages = float('inf'), []
+    for _ in range(repeat):
+        run = subprocess.run([sys.executable, '-c', code], cwd=dirname(abspath(__file__)), capture_output=True,
+                             text=True, check=True)
+        elapsed, packages = json.loads(run.stdout.strip().splitlines()[-1])
+        best = min(best, elapsed)
+    return best, packages
+
+
+def check_imports(budgets: Optional[Dict[str, tuple]] = None, verbose: bool = True) -> List[str]:
+    """Failures against the import budgets: a module too slow to import, loading a package it must not, or not
+    importable at all"""
+    failures = []
+    for module, (budget, forbidden) in (budgets or import_budgets).items():
+        try:
+            elapsed, packages = measure_import(module)
+        except subprocess.CalledProcessError as e:
+            failures.append(f"{module}: import failed: {(e.stderr.strip().splitlines() or ['?'])[-1]}")
+            continue
+        if verbose:
+            print(f'import {module}: {1e3 * elapsed:.0f} ms (budget {1e3 * budget:.0f} ms)')
+        if elapsed > budget:
+            failures.append(f'{module}: import takes {1e3 * elapsed:.0f} ms, the budget is {1e3 * budget:.0f} ms')
+        loaded = [package for package in forbidden if package in packages]
+        if loaded:
+            failures.append(f'{module}: import loads {", ".join(loaded)}')
+    return failures
+
+
+def check_batch_store(verbose: bool = True) -> List[str]:
+    """Failures of a batch run over a scenario file with a valid and a rejected scenario (no cycle time) into a
+    result store: both must have their record, and the reasons of the rejected one must read back from the store"""
+    rejected = make_corridor(5, 1, selections(()))
+    rejected['SingleInputs']['c_min'] = '150'
+    with tempfile.TemporaryDirectory() as directory:
+        scenario_path, store_path = join(directory, 'scenarios.jsonl'), join(directory, 'store')
+        write_scenarios([('valid', make_corridor(5, 0, selections(()))), ('rejected', rejected)], scenario_path)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                Batch_MAXBAND.main([scenario_path, '-o', join(directory, 'results.jsonl'), '--store', store_path])
+            data = ResultStore(store_path).read(['scenario', 'status', 'telemetry.infeasible_inputs'])
+        except Exception as e:
+            return [f'batch store: {type(e).__name__}: {e}']
+    records = {name: (status, reasons) for name, status, reasons in
+               zip(data['scenario'], data['status'], data['telemetry.infeasible_inputs'])}
+    failures = []
+    if records.get('valid', (None,))[0] != 1:
+        failures.append(f"batch store: the valid scenario has {records.get('valid')}, not status 1")
+    if records.get('rejected', (None,))[0] != -1 or not records['rejected'][1]:
+        failures.append(f"batch store: the rejected scenario has {records.get('rejected')}, not status -1 with its "
+                        f"reasons")
+    if verbose and not failures:
+        print(f"batch store: rejected scenario stored with {records['rejected'][1]}")
+    return failures
+
+
+def load_baseline(path: str) -> Dict[str, dict]:
+    with open(path) as f:
+        return json.load(f)['cases']
+
+
+def save_baseline(path: str, results: Dict[str, dict], backend: str) -> None:
+    cases = {name: {key: round(value, 6) if key.endswith('_s') else value for key, value in result.items()}
+             for name, result in results.items()}
+    baseline = {'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'backend': backend,
+                'python': platform.python_version(), 'machine': platform.machine(), 'cases': cases}
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Run the reference corridors and compare build time, solve time and '
+                                                 'optima against a stored baseline.')
+    parser.add_argument('--baseline', default='benchmarks/baseline.json', help='Baseline JSON file')
+    parser.add_argument('--update-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--full', action='store_true', help='Every flag combination on every corridor')
+    parser.add_argument('-k', '--filter', default=None, help='Only run the cases whose name contains this text')
+    parser.add_argument('-b', '--backend', choices=list(backends), default='cbc')
+    parser.add_argument('--time-limit', type=float, default=60, help='Solver time limit per case [s]')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='Allowed slowdown factor (default: 1.5)')
+    parser.add_argument('--slack', type=float, default=0.05,
+                        help='Allowed absolute slowdown per case and of the suite total [s] (default: 0.05)')
+    parser.add_argument('-o', '--output', default=None, help='Also write the results as JSON')
+    parser.add_argument('--imports-only', action='store_true', help='Only check the import time budgets')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    failures = check_imports(verbose=not args.quiet)
+    if args.imports_only:
+        return report_failures(failures, 'the import budgets')
+    failures += check_batch_store(verbose=not args.quiet)
+    cases = suite_cases(args.full)
+    if args.filter is not None:
+        cases = {name: inputs for name, inputs in cases.items() if args.filter in name}
+    results = run_suite(cases, args.backend, args.time_limit, not args.quiet)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.update_baseline:
+        save_baseline(args.baseline, results, args.backend)
+        print(f'Baseline of {len(results)} cases written to {args.baseline}')
+        return 0
+
+    failures += compare_to_baseline(results, load_baseline(args.baseline), args.tolerance, args.slack)
+    if not failures:
+        print(f'{len(results)} cases match the baseline')
+    return report_failures(failures, args.baseline)
+
+
+def report_failures(failures: List[str], reference: str) -> int:
+    if not failures:
+        return 0
+    print(f'{len(failures)} REGRESSIONS against {reference}:', file=sys.stderr)
+    for failure in failures:
+        print('  ' + failure, file=sys.stderr)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
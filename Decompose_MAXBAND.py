@@ -0,0 +1,240 @@
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pulp as lp
+
+from config import Config
+from Run_MAXBAND import MaxbandModel, parse_inputs
+
+# Inputs with one value per signal, sliced per window
+signal_inputs = ['r', 'r_', 'l', 'l_', 'tau', 'tau_']
+
+
+def split_windows(nSignals: int, window: int, overlap: int) -> List[Tuple[int, int]]:
+    """Overlapping (start, stop) signal ranges that cover the corridor, successive windows share overlap signals"""
+    if window >= nSignals:
+        return [(0, nSignals)]
+    if not 0 <= overlap < window - 1:
+        raise ValueError(f'The overlap must be between 0 and the window size minus 2, not {overlap}')
+    step = window - overlap
+    starts = list(range(0, nSignals - window, step)) + [nSignals - window]
+    return [(start, start + window) for start in starts]
+
+
+def window_params(params: dict, start: int, stop: int) -> dict:
+    """The inputs of the sub-arterial of signals start up to stop.
+
+    The start band constraint belongs to the ends of the full corridor and is left to the stitch and polish steps.
+    With tau_sum_flag the queue clearances are summed within the window only."""
+    sub = dict(params)
+    sub['nSignals'] = stop - start
+    sub['d'] = params['d'][start:stop] - params['d'][start]
+    sub['d_'] = params['d_'][start:stop] - params['d_'][start]
+    for key in signal_inputs:
+        sub[key] = list(params[key][start:stop])
+    sub['w_0_flag'] = False
+    return sub
+
+
+def owning_windows(windows: List[Tuple[int, int]], n: int) -> List[int]:
+    """For each of n signals (or segments) the window in which it lies farthest from the window edges, so boundary
+    effects of the sub-arterials do not end up in the stitched solution"""
+    owners = []
+    for g in range(n):
+        margins = [min(g - start, stop - 1 - g) if start <= g < stop else -1 for start, stop in windows]
+        owners.append(int(np.argmax(margins)))
+    return owners
+
+
+def objective_value(params: dict, outputs: dict) -> Optional[float]:
+    if outputs.get('OB_band') is None or outputs.get('IB_band') is None:
+        return None
+    return outputs['OB_band'] + params['k'] * outputs['IB_band']
+
+
+def set_initial_values(model: MaxbandModel, outputs: dict) -> None:
+    """Sets the solution in outputs as MIP start of the model, requires a solver created with warmStart=True"""
+    values = [(model.b, outputs['OB_band']), (model.b_, outputs['IB_band']), (model.z, outputs['inv_CT'])]
+    for variables, key in [(model.t, 'OB_t'), (model.t_, 'IB_t'), (model.w, 'OB_w'), (model.w_, 'IB_w'),
+                           (model.m, 'offsets')]:
+        values += [(variables[i], value) for i, value in enumerate(outputs[key])]
+    if model.params['leftturnleadlag']:
+        values += [(model.delta[i], value) for i, value in enumerate(outputs['OB_delta'])]
+        values += [(model.delta_[i], value) for i, value in enumerate(outputs['IB_delta'])]
+    for variable, value in values:
+        variable.setInitialValue(round(value) if variable.cat == lp.LpInteger else value, check=False)
+
+
+def _solve_window(params: dict, time_limit: Optional[float], threads: Optional[int]) -> Tuple[dict, int]:
+    model = MaxbandModel(params)
+    status = model.solve(lp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, threads=threads))
+    return model.get_results(), status
+
+
+class RollingHorizonSolver:
+    """Solves long corridors by decomposition: the corridor is split into overlapping sub-arterials that are solved
+    in parallel, their integer offsets m (and left-turn patterns) are fixed in the full model, which then is an LP
+    (the stitch), and finally the full MILP is polished from the stitched solution as MIP start.
+
+    window and overlap are numbers of signals. The time limits are per window and for the polish step [s], a polish
+    time limit of 0 returns the stitched solution."""
+
+    def __init__(self, window: int = 12, overlap: int = 4, workers: Optional[int] = None,
+                 window_time_limit: Optional[float] = 30, polish_time_limit: Optional[float] = 30,
+                 threads: Optional[int] = None, msg: bool = False):
+        self.window = window
+        self.overlap = overlap
+        self.workers = workers
+        self.window_time_limit = window_time_limit
+        self.polish_time_limit = polish_time_limit
+        self.threads = threads
+        self.msg = msg
+        self.report = dict()
+
+    def solve_windows(self, params: dict, windows: List[Tuple[int, int]]) -> List[Tuple[dict, int]]:
+        subs = [window_params(params, start, stop) for start, stop in windows]
+        if len(subs) == 1 or self.workers == 1:
+            return [_solve_window(sub, self.window_time_limit, self.threads) for sub in subs]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(_solve_window, sub, self.window_time_limit, 1) for sub in subs]
+            return [future.result() for future in futures]
+
+    def fix_integers(self, model: MaxbandModel, windows: List[Tuple[int, int]], results: List[Tuple[dict, int]]):
+        """Fixes m of every segment and delta, delta_ of every signal to the value of its owning window"""
+        fixed = []
+        segment_windows = [(start, stop - 1) for start, stop in windows]  # a window of n signals has n - 1 segments
+        for i, owner in enumerate(owning_windows(segment_windows, model.nSegments)):
+            value = results[owner][0]['offsets'][i - windows[owner][0]]
+            fixed.append((model.m[i], round(value)))
+        if model.params['leftturnleadlag']:
+            for i, owner in enumerate(owning_windows(windows, model.nSignals)):
+                for variable, key in [(model.delta[i], 'OB_delta'), (model.delta_[i], 'IB_delta')]:
+                    fixed.append((variable, round(results[owner][0][key][i - windows[owner][0]])))
+        bounds = [(variable, variable.lowBound, variable.upBound) for variable, _ in fixed]
+        for variable, value in fixed:
+            variable.lowBound = value
+            variable.upBound = value
+        return bounds
+
+    def stitch(self, model: MaxbandModel, windows: List[Tuple[int, int]],
+               results: List[Tuple[dict, int]]) -> Optional[dict]:
+        """Solves the full model as LP with the integers of the windows fixed, None if that combination is
+        infeasible"""
+        bounds = self.fix_integers(model, windows, results)
+        status = model.solve(lp.PULP_CBC_CMD(msg=self.msg))
+        for variable, low, up in bounds:
+            variable.lowBound = low
+            variable.upBound = up
+        return model.get_results() if status == 1 else None
+
+    def solve(self, params: dict) -> Tuple[dict, int]:
+        """Returns the output_dict and status of the polished solution, details of every step are in self.report"""
+        report = {'windows': split_windows(params['nSignals'], self.window, self.overlap)}
+        windows = report['windows']
+
+        start_time = time.perf_counter()
+        results = self.solve_windows(params, windows)
+        report['window_status'] = [status for _, status in results]
+        report['window_cycle_times'] = [1 / outputs['inv_CT'] if status == 1 else None for outputs, status in results]
+        cycle_times = [c for c in report['window_cycle_times'] if c is not None]
+        pinned = None
+        if len(windows) > 1 and len(cycle_times) == len(windows) and max(cycle_times) > 1.01 * min(cycle_times):
+            # Offsets chosen for different cycle times rarely fit together, so the windows are solved again with
+            # the cycle time of all of them pinned to the median one
+            cycle_time = float(np.median(cycle_times))
+            pinned = self.solve_windows(dict(params, c_min=cycle_time, c_max=cycle_time), windows)
+            report['pinned_cycle_time'] = cycle_time
+        report['window_s'] = time.perf_counter() - start_time
+
+        model = MaxbandModel(params)
+        start_time = time.perf_counter()
+        start, report['stitch_objective'] = None, None
+        for candidate in [results, pinned]:
+            # Nothing to stitch for a single window or a window without solution, the full model is solved directly
+            if len(windows) == 1 or candidate is None or any(status != 1 for _, status in candidate):
+                continue
+            outputs = self.stitch(model, windows, candidate)
+            value = objective_value(params, outputs) if outputs is not None else None
+            if value is not None and (start is None or value > report['stitch_objective']):
+                start, report['stitch_objective'] = outputs, value
+        report['stitch_s'] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        if start is not None and self.polish_time_limit == 0:
+            report.update(polish_s=0.0, polish_objective=report['stitch_objective'])
+            report['total_s'] = report['window_s'] + report['stitch_s']
+            self.report = report
+            return start, 2
+        if start is not None:
+            set_initial_values(model, start)
+        solver = lp.PULP_CBC_CMD(msg=self.msg, warmStart=start is not None, timeLimit=self.polish_time_limit,
+                                 threads=self.threads)
+        status = model.solve(solver)
+        if status == 1 and model.coor.sol_status == lp.LpSolutionIntegerFeasible:
+            status = 2  # stopped on the time limit, not proven optimal
+        outputs = model.get_results()
+        if start is not None and (status not in (1, 2) or objective_value(params, outputs) is None
+                                  or objective_value(params, outputs) < report['stitch_objective']):
+            outputs, status = start, 2  # the polish found nothing better than the stitched solution
+        report['polish_s'] = time.perf_counter() - start_time
+        report['polish_objective'] = objective_value(params, outputs)
+        report['total_s'] = report['window_s'] + report['stitch_s'] + report['polish_s']
+        self.report = report
+        return outputs, status
+
+    def compare(self, params: dict, time_limit: Optional[float] = None) -> dict:
+        """Solves the full model directly as well, and adds its objective and the gap of the stitched and polished
+        solutions to it (relative, 0 is as good as the monolithic solve) to the report"""
+        start_time = time.perf_counter()
+        model = MaxbandModel(params)
+        status = model.solve(lp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, threads=self.threads))
+        report = self.report
+        report['monolithic_s'] = time.perf_counter() - start_time
+        report['monolithic_status'] = status
+        report['monolithic_objective'] = objective_value(params, model.get_results()) if status == 1 else None
+        for step in ['stitch', 'polish']:
+            value, best = report[f'{step}_objective'], report['monolithic_objective']
+            report[f'{step}_gap'] = None if value is None or not best else (best - value) / best
+        return report
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Solve a long corridor by decomposition into overlapping '
+                                                 'sub-arterials.')
+    parser.add_argument('scenario', help='Scenario .ini file')
+    parser.add_argument('--window', type=int, default=12, help='Signals per sub-arterial (default: 12)')
+    parser.add_argument('--overlap', type=int, default=4, help='Signals shared by successive sub-arterials')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Worker processes for the sub-arterials')
+    parser.add_argument('--window-time-limit', type=float, default=30, help='Time limit per sub-arterial [s]')
+    parser.add_argument('--polish-time-limit', type=float, default=30, help='Time limit of the polish step [s], 0 skips it')
+    parser.add_argument('--compare', type=float, default=None, metavar='TIME_LIMIT',
+                        help='Also solve the full model directly, with this time limit [s], and report the gap')
+    parser.add_argument('-o', '--output', default=None, help='Write outputs and report as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    inputs = Config(args.scenario).get_run_inputs()
+    if inputs is None:
+        return 1
+    params = parse_inputs(inputs)
+    solver = RollingHorizonSolver(args.window, args.overlap, args.workers, args.window_time_limit,
+                                  args.polish_time_limit)
+    outputs, status = solver.solve(params)
+    report = solver.compare(params, args.compare) if args.compare is not None else solver.report
+    for key, value in report.items():
+        print(f'{key}: {value}')
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump({'status': status, 'outputs': outputs, 'report': report}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from os.path import abspath, dirname, join
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from Benchmark_MAXBAND import make_corridor
+
+
+class Connection:
+    """A kept-alive HTTP/1.1 connection to the solve service"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, payload=None) -> Tuple[int, dict]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = b'' if payload is None else json.dumps(payload).encode()
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n'
+                          f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await self.writer.drain()
+        code = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        return code, json.loads(await self.reader.readexactly(length))
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def wait_for_service(host: str, port: int, timeout: float = 30) -> None:
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f'No service on {host}:{port} after {timeout:.0f} s')
+            await asyncio.sleep(0.1)
+
+
+async def run_load(host: str, port: int, corridors: List[dict], requests: int, concurrency: int,
+                   seed: int = 0) -> dict:
+    """Sends requests /solve requests for corridors drawn at random from concurrency kept-alive connections at once,
+    and reports the latency percentiles [ms] and the throughput [requests/s]"""
+    rng = np.random.default_rng(seed)
+    queue = asyncio.Queue()
+    for index in rng.integers(0, len(corridors), requests):
+        queue.put_nowait(corridors[index])
+    latencies, codes, statuses = [], [], []
+    coalesced = 0
+
+    async def user() -> None:
+        nonlocal coalesced
+        connection = Connection(host, port)
+        try:
+            while not queue.empty():
+                corridor = queue.get_nowait()
+                start = time.perf_counter()
+                code, record = await connection.request('POST', '/solve', corridor)
+                latencies.append(time.perf_counter() - start)
+                codes.append(code)
+                statuses.append(record.get('status'))
+                coalesced += bool(record.get('coalesced'))
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[user() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    connection = Connection(host, port)
+    _, service_status = await connection.request('GET', '/status')
+    connection.close()
+    latencies = 1e3 * np.array(latencies)
+    return {'requests': requests, 'concurrency': concurrency, 'distinct_corridors': len(corridors),
+            'elapsed_s': elapsed, 'throughput_per_s': requests / elapsed,
+            'p50_ms': float(np.percentile(latencies, 50)), 'p90_ms': float(np.percentile(latencies, 90)),
+            'p99_ms': float(np.percentile(latencies, 99)), 'max_ms': float(latencies.max()),
+            'http_errors': sum(code != 200 for code in codes), 'failed_solves': sum(s is None for s in statuses),
+            'coalesced': coalesced, 'service': service_status}
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Load test the MAXBAND solve service, reporting p50/p99 latency and '
+                                                 'throughput.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('-n', '--requests', type=int, default=200)
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='Requests in flight at once')
+    parser.add_argument('--distinct', type=int, default=20,
+                        help='Number of different corridors, fewer means more duplicate requests to coalesce')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[7, 10, 15], help='Signals per corridor')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start-service', action='store_true', help='Start Service_MAXBAND.py for the test')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Workers of a started service')
+    parser.add_argument('-o', '--output', default=None, help='Also write the report as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    corridors = [make_corridor(args.sizes[i % len(args.sizes)], args.seed + i) for i in range(args.distinct)]
+    service = None
+    if args.start_service:
+        command = [sys.executable, join(dirname(abspath(__file__)), 'Service_MAXBAND.py'), '--host', args.host,
+                   '--port', str(args.port)]
+        if args.workers is not None:
+            command += ['--workers', str(args.workers)]
+        service = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    try:
+        asyncio.run(wait_for_service(args.host, args.port))
+        report = asyncio.run(run_load(args.host, args.port, corridors, args.requests, args.concurrency, args.seed))
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+    print(f"{report['requests']} requests ({report['distinct_corridors']} distinct corridors, concurrency "
+          f"{report['concurrency']}) in {report['elapsed_s']:.2f} s: {report['throughput_per_s']:.1f} requests/s")
+    print(f"latency p50 {report['p50_ms']:.1f} ms, p90 {report['p90_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms, "
+          f"max {report['max_ms']:.1f} ms")
+    print(f"{report['coalesced']} coalesced, {report['http_errors']} HTTP errors, {report['failed_solves']} failed "
+          f"solves, {report['service']['workers']} service workers")
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
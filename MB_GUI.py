@@ -1,27 +1,13 @@
 import tkinter as tk
 from tkinter import ttk
-import matplotlib.pyplot as plt
-from Run_MAXBAND import RunMaxband
-from Process_Results import ProcessResults
+from Run_MAXBAND import status_dict
+from Process_Results import MaxbandPlot, ProcessResults
+from Result_Cache import ResultCache
+from Solve_Worker import SolveWorker
 from config import Config
 from Utilities import create_tooltip, tooltips
-import matplotlib as matplotlib
-matplotlib.use('TkAgg')
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import (
-    FigureCanvasTkAgg,
-    NavigationToolbar2Tk
-)
-
-Cfg = Config()
-
-status_dict = {
-    2: 'Solution Found',  # Indicating that the problem is solvable, but potentially a local optimum
-    1: 'Optimal Solution Found',  # Global optimum, problem solved
-    0: 'No Solution Found',  # Still working on the problem
-    -1: 'No Solution Exists',  # The problem is infeasible
-    -2: 'Solution is Unbounded'  # The problem is unbounded
-}
+# matplotlib and its Tk backend are imported on the first plot, see create_plot_frame, so the window opens without
+# waiting for them
 
 
 def check_float(new_val) -> bool:
@@ -70,12 +56,21 @@ class MaxbandGUI(tk.Tk):
         self.constraint_checkbuttons: dict = dict.fromkeys(self.constraint_flags)
         self.constraint_checkbutton_labels: dict = dict.fromkeys(self.constraint_flags)
 
+        self.cfg = Config()  # config.ini, read when the GUI starts rather than when the module is imported
         self.inputs: dict = {}
         self.outputs: dict = {}
         self.status = None
         self.run_counter = 0
+        self.result_cache = ResultCache()  # unchanged inputs are not solved again
+        self.worker = None  # SolveWorker of the run in progress
+        self.run_key = None  # result cache key of the inputs of that run
+        self.poll_interval = 200  # [ms] between progress updates of a running solve
 
         self.print_labels: dict = {}
+        self.run_button = None
+        self.cancel_button = None
+        self.progress_label = None
+        self.maxband_plot = None
         self.figure_canvas = None
         self.figure_toolbar = None
 
@@ -96,6 +91,8 @@ class MaxbandGUI(tk.Tk):
 
     def quit_program(self) -> None:
         print('Shutting down')
+        if self.worker is not None:
+            self.worker.cancel()
         self.quit()
         self.destroy()
 
@@ -232,8 +229,12 @@ class MaxbandGUI(tk.Tk):
             self.constraint_checkbutton_labels[flag] = ttk.Label(master=self, text=flag)
 
     def create_run_maxband_button(self) -> None:
-        run_maxband_button = ttk.Button(self, text='Run Maxband', command=self.maxband_process)
-        run_maxband_button.grid(column=2, row=13)
+        self.run_button = ttk.Button(self, text='Run Maxband', command=self.maxband_process)
+        self.run_button.grid(column=2, row=13)
+        self.cancel_button = ttk.Button(self, text='Cancel', command=self.cancel_maxband, state='disabled')
+        self.cancel_button.grid(column=2, row=14)
+        self.progress_label = ttk.Label(self, text='')
+        self.progress_label.grid(column=2, row=15)
 
     def draw_widgets(self) -> None:
         single_inputs_header = ttk.Label(self, text='Single Inputs', font='Helvetica 12 bold')
@@ -265,25 +266,25 @@ class MaxbandGUI(tk.Tk):
             self.constraint_checkbutton_labels[check_button].grid(column=0, row=i+10)
 
     def fill_from_config(self) -> None:
-        if not Cfg.check_for_config_file():  # There is no config to fill from
+        if not self.cfg.check_for_config_file():  # There is no config to fill from
             return
-        single_input_dict = Cfg.get_single_input_config()
+        single_input_dict = self.cfg.get_single_input_config()
         for key in self.single_entry_variables:
             self.single_entry_variables[key].set(single_input_dict[key])
 
-        segment_input_dict = Cfg.get_segment_input_config()
+        segment_input_dict = self.cfg.get_segment_input_config()
         for key in self.segment_entry_variables:
             segment_input_list = list(segment_input_dict[key].strip("['']").split("', '"))
             for segment in range(self.current_nsignals-1):
                 self.segment_entry_variables[key][segment].set(segment_input_list[segment])
 
-        signal_input_dict = Cfg.get_signal_input_config()
+        signal_input_dict = self.cfg.get_signal_input_config()
         for key in self.signal_entry_variables:
             signal_input_list = list(signal_input_dict[key].strip("['']").split("', '"))
             for signal in range(self.current_nsignals):
                 self.signal_entry_variables[key][signal].set(signal_input_list[signal])
 
-        selection_input_dict = Cfg.get_selection_input_config()
+        selection_input_dict = self.cfg.get_selection_input_config()
         for key in self.checkbutton_variables:
             self.checkbutton_variables[key].set(selection_input_dict[key])
 
@@ -395,21 +396,84 @@ class MaxbandGUI(tk.Tk):
             create_tooltip(self.constraint_checkbutton_labels[label], tooltips[label])
 
     def maxband_process(self) -> None:
-        """"Handles the run_maxband button press, destroying previous results, gathering all input, saving input to
-        config, running maxband and finally printing and plotting the new results"""
-        self.destroy_previous_print_results()
-        self.destroy_previous_plot_frame()
+        """"Handles the run_maxband button press, gathering all input, saving input to config and starting maxband in
+        a worker process. The previous results stay until the new ones are there, see show_results"""
+        if self.worker is not None:  # a run is in progress
+            return
         self.inputs = self.get_all_inputs()
-        Cfg.store_dict_into_config_file(self.inputs)
-        rm = RunMaxband(self.inputs)
-        self.outputs, self.status = rm.run_maxband()
+        self.cfg.store_dict_into_config_file(self.inputs)
+        key = self.result_cache.key(self.inputs, 'cbc')
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            self.show_results(*cached)
+            return
+        self.run_key = key
+        self.worker = SolveWorker(self.inputs)
+        self.worker.start()
+        self.run_button.configure(state='disabled')
+        self.cancel_button.configure(state='normal')
+        self.progress_label.configure(text='Solving...')
+        self.after(self.poll_interval, self.poll_worker)
+
+    def poll_worker(self) -> None:
+        """Shows the progress of the running solve, until it is done"""
+        if self.worker is None:  # cancelled
+            return
+        result = self.worker.result()
+        if result is None:
+            self.progress_label.configure(text=self.progress_text(self.worker.progress()))
+            self.after(self.poll_interval, self.poll_worker)
+            return
+        worker, self.worker = self.worker, None
+        self.run_button.configure(state='normal')
+        self.cancel_button.configure(state='disabled')
+        if result[0] == 'error':
+            self.progress_label.configure(text='Solver failed')
+            print(result[1])
+            return
+        _, outputs, status, telemetry = result
+        if telemetry.get('input_warnings'):  # odd inputs that are solved all the same
+            print('\n'.join(telemetry['input_warnings']))
+        if telemetry.get('infeasible_inputs'):  # found without starting the solver
+            self.progress_label.configure(text='Infeasible inputs')
+            print('\n'.join(telemetry['infeasible_inputs']))
+        else:
+            self.progress_label.configure(text=f'Solved in {worker.elapsed():.1f} s')
+        self.result_cache.put(self.run_key, outputs, status, telemetry)
+        self.show_results(outputs, status)
+
+    @staticmethod
+    def progress_text(progress: dict) -> str:
+        text = f'Solving... {progress["elapsed_s"]:.1f} s'
+        if progress.get('objective') is not None:
+            text += f', incumbent {progress["objective"]:.3f}'
+        if progress.get('gap') is not None:
+            text += f', gap {100 * progress["gap"]:.1f}%'
+        return text
+
+    def cancel_maxband(self) -> None:
+        """Handles the cancel button press, ending the solver process, the previous results stay"""
+        if self.worker is None:
+            return
+        self.worker.cancel()
+        self.worker = None
+        self.run_button.configure(state='normal')
+        self.cancel_button.configure(state='disabled')
+        self.progress_label.configure(text='Cancelled')
+
+    def show_results(self, outputs: dict, status: int) -> None:
+        """Replaces the previous results by the new ones, printing and plotting them"""
+        self.destroy_previous_print_results()
+        self.outputs, self.status = outputs, status
         self.run_counter += 1
+        if int(self.status) != 1:  # without a solution there is nothing to process
+            self.create_print_labels(None)
+            self.draw_print_labels()
+            self.hide_plot_frame()
+            return
         PR = ProcessResults(self.inputs, self.outputs)
-        processed_results = PR.get_processed_results_dict()
-        self.create_print_labels(processed_results)
+        self.create_print_labels(PR.get_processed_results_dict())
         self.draw_print_labels()
-        if int(self.status) != 1:
-            return
         self.create_plot_frame(PR)
         self.draw_plot_frame()
 
@@ -444,24 +508,29 @@ class MaxbandGUI(tk.Tk):
         self.print_labels: dict = {}
 
     def create_plot_frame(self, PR) -> None:
+        """Creates the figure, canvas and toolbar on the first plot, later plots update the same artists in place"""
         # TODO: implement a way to enter intersection names dynamically
         # intersection_names = ['2016', '2017', '2018', '2019', '2020', '2021', '2024']
-        fig = Figure(figsize=(8, 5))
-        # fig.patch.set_facecolor('skyblue')  # this can set the color around the plot, inside the frame
-        # TODO: Implement some plot customization options
-        PR.plot_MAXBAND(fig)
-        fig.tight_layout()
-        self.figure_canvas = FigureCanvasTkAgg(fig, self)
-        self.figure_toolbar = NavigationToolbar2Tk(self.figure_canvas, self, pack_toolbar=False)
+        if self.figure_canvas is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+            fig = Figure(figsize=(8, 5))
+            # fig.patch.set_facecolor('skyblue')  # this can set the color around the plot, inside the frame
+            # TODO: Implement some plot customization options
+            self.maxband_plot = MaxbandPlot(fig)
+            self.figure_canvas = FigureCanvasTkAgg(fig, self)
+            self.figure_toolbar = NavigationToolbar2Tk(self.figure_canvas, self, pack_toolbar=False)
+        self.maxband_plot.update(PR)
+        self.figure_toolbar.update()  # the new plot is the home view of the toolbar
+        self.figure_canvas.figure.tight_layout()
+        self.figure_canvas.draw_idle()
 
     def draw_plot_frame(self) -> None:
         self.figure_canvas.get_tk_widget().grid(column=3, row=12, columnspan=50, rowspan=28, sticky='NSEW')
         self.figure_toolbar.grid(columns=3, row=12+28, columnspan=50)
 
-    def destroy_previous_plot_frame(self) -> None:
-        if self.run_counter == 0:
+    def hide_plot_frame(self) -> None:
+        if self.figure_canvas is None:  # Nothing plotted yet
             return
-        self.figure_canvas.get_tk_widget().destroy()
-        self.figure_canvas = None
-        self.figure_toolbar.destroy()
-        self.figure_toolbar = None
+        self.figure_canvas.get_tk_widget().grid_remove()
+        self.figure_toolbar.grid_remove()
@@ -0,0 +1,373 @@
+import numpy as np
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, milp
+from typing import Optional, Tuple
+
+from Presolve_MAXBAND import offset_bounds
+
+# scipy.optimize.milp status -> status code of status_dict in Run_MAXBAND
+milp_status = {0: 1, 1: 0, 2: -1, 3: -2, 4: 0}
+
+
+def row_bounds(senses: np.ndarray, rhs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Senses and right-hand sides as lower <= A @ x <= upper"""
+    row_lower = np.where(senses == 'L', -np.inf, rhs)
+    row_upper = np.where(senses == 'G', np.inf, rhs)
+    return row_lower, row_upper
+
+
+def solve_milp(c: np.ndarray, A: sparse.spmatrix, senses: np.ndarray, rhs: np.ndarray, lower: np.ndarray,
+               upper: np.ndarray, integrality: np.ndarray,
+               time_limit: Optional[float] = None, info: Optional[dict] = None) -> Tuple[Optional[np.ndarray], int]:
+    """Maximizes c @ x with scipy's HiGHS MILP, returns the solution (None without one) and the status code. A
+    given info dict is filled with the MIP progress: objective, best bound, gap and node count."""
+    row_lower, row_upper = row_bounds(senses, rhs)
+    options = {} if time_limit is None else {'time_limit': time_limit}
+    res = milp(-c, constraints=LinearConstraint(A, row_lower, row_upper), bounds=Bounds(lower, upper),
+               integrality=integrality, options=options)
+    status = milp_status.get(res.status, 0)
+    if res.status == 1 and res.x is not None:
+        status = 2  # stopped on a limit with a feasible solution
+    if info is not None:
+        info['objective'] = None if res.x is None else -res.fun
+        info['best_bound'] = None if getattr(res, 'mip_dual_bound', None) is None else -res.mip_dual_bound
+        info['gap'] = getattr(res, 'mip_gap', None)
+        info['nodes'] = getattr(res, 'mip_node_count', None)
+    return res.x, status
+
+
+class MaxbandMatrix:
+    """The MAXBAND MILP of MaxbandModel assembled directly as sparse arrays from the parsed inputs, without PuLP
+    objects: maximize c @ x subject to A @ x (senses) rhs, lower <= x <= upper and integrality.
+
+    The columns are laid out as b, b_, z, t, t_, w, w_, m and, with left-turn optimization, delta, delta_."""
+
+    def __init__(self, params: dict, presolve: bool = True):
+        self.params = params
+        self.nSignals = params['nSignals']
+        self.nSegments = self.nSignals - 1
+        # TODO: Create an input for the Deltas, for now they are all set to 0
+        self.Deltas = np.zeros(self.nSignals)
+
+        self.columns = dict()
+        self.n_columns = 0
+        for name, size in self.column_sizes():
+            self.add_columns(name, size)
+        if params['leftturnleadlag']:
+            self.add_columns('delta', self.nSignals)
+            self.add_columns('delta_', self.nSignals)
+
+        self.lower = np.zeros(self.n_columns)
+        self.upper = np.full(self.n_columns, np.inf)
+        self.integrality = np.zeros(self.n_columns)
+        self.lower[self.columns['m']] = -np.inf  # the offsets are free integers
+        self.integrality[self.columns['m']] = 1
+        if presolve:  # see Presolve_MAXBAND.offset_bounds
+            self.lower[self.columns['m'][:-1]], self.upper[self.columns['m'][:-1]] = offset_bounds(params)
+        if params['leftturnleadlag']:
+            for name in ['delta', 'delta_']:
+                self.upper[self.columns[name]] = 1
+                self.integrality[self.columns[name]] = 1
+
+        self.c = self.objective()
+
+        self._rows, self._cols, self._vals, self._rhs, self._senses = [], [], [], [], []
+        self.row_groups = []  # (name, first row, end row) of every block of rows
+        self.n_rows = 0
+        self.build_rows()
+        self.A = sparse.csr_matrix((np.concatenate(self._vals), (np.concatenate(self._rows), np.concatenate(self._cols))),
+                                   shape=(self.n_rows, self.n_columns))
+        self.rhs = np.concatenate(self._rhs)
+        self.senses = np.concatenate(self._senses)
+
+    def column_sizes(self) -> list:
+        return [('b', 1), ('b_', 1), ('z', 1), ('t', self.nSegments), ('t_', self.nSegments), ('w', self.nSignals),
+                ('w_', self.nSignals), ('m', self.nSignals)]
+
+    def objective(self) -> np.ndarray:
+        c = np.zeros(self.n_columns)
+        c[self.columns['b']] = 1
+        c[self.columns['b_']] = self.params['k']
+        return c
+
+    def add_columns(self, name: str, size: int) -> None:
+        self.columns[name] = np.arange(self.n_columns, self.n_columns + size)
+        self.n_columns += size
+
+    def col(self, name: str, index=None) -> np.ndarray:
+        if index is None:
+            return self.columns[name]
+        return self.columns[name][index]
+
+    def add_rows(self, name: str, terms: list, sense: str, rhs) -> None:
+        """Adds a block of rows, terms is a list of (columns, coefficients) with one entry per row in every array,
+        sense is one of 'L' (<=), 'G' (>=) or 'E' (==)"""
+        n = max(np.size(array) for term in terms for array in term)
+        if any(np.size(columns) == 0 for columns, _ in terms):
+            return
+        rows = np.arange(self.n_rows, self.n_rows + n)
+        for columns, coefficients in terms:
+            self._rows.append(rows)
+            self._cols.append(np.broadcast_to(columns, (n,)))
+            self._vals.append(np.broadcast_to(np.asarray(coefficients, dtype=float), (n,)))
+        self._rhs.append(np.broadcast_to(np.asarray(rhs, dtype=float), (n,)))
+        self._senses.append(np.full(n, sense))
+        self.row_groups.append((name, self.n_rows, self.n_rows + n))
+        self.n_rows += n
+
+    def build_rows(self) -> None:
+        for group in ['favored', 'cycle', 'bandwidth', 'speed', 'speed_diff', 'offset', 'start_band', 'start_offset',
+                      'left_turn', 'offset_limit']:
+            getattr(self, group + '_rows')()
+
+    def signal_arrays(self) -> tuple:
+        p = self.params
+        return tuple(np.asarray(p[key], dtype=float) for key in ['r', 'r_', 'l', 'l_', 'tau', 'tau_'])
+
+    def inbound_tau_sum(self) -> np.ndarray:
+        """sum(tau_[:nSignals - 1 - i]) per signal"""
+        tau_ = np.asarray(self.params['tau_'], dtype=float)
+        return np.concatenate((np.cumsum(tau_[:self.nSignals - 1])[::-1], [0.0]))
+
+    def favored_rows(self) -> None:
+        # Favored direction constraint
+        k, b, b_ = self.params['k'], self.col('b'), self.col('b_')
+        if k != 1:
+            self.add_rows('Favor bandwidth direction', [(b_, [1 - k]), (b, [-(1 - k) * k])], 'G', 0)
+        elif k == 1:
+            self.add_rows('Equal bandwidths', [(b, [1]), (b_, [-1])], 'E', 0)
+
+    def cycle_rows(self) -> None:
+        # Max. and Min. cycle time constraints, 'reversed logic' since z is the inverse of C (cycle time)
+        p, z = self.params, self.col('z')
+        self.add_rows('Maximum cycle time', [(z, [p['c_max']])], 'G', 1)
+        self.add_rows('Minimum cycle time', [(z, [p['c_min']])], 'L', 1)
+
+    def bandwidth_rows(self) -> None:
+        p, col = self.params, self.col
+        r, r_, l, l_, tau, tau_ = self.signal_arrays()
+        b, b_ = col('b'), col('b_')
+
+        # Bandwidth constraints without requiring enough time for tau, tail of band could hit red
+        if not p['tau_cstr_flag'] and not p['tau_sum_flag']:
+            self.add_rows('Outbound Bandwidth constraint', [(col('w'), 1), (b, 1)], 'L', 1 - r)
+            self.add_rows('Inbound Bandwidth constraint', [(col('w_'), 1), (b_, 1)], 'L', 1 - r_)
+
+        # Bandwidth constraints that require enough time for BOTH the band and queue clearance
+        if p['tau_cstr_flag']:
+            self.add_rows('Outbound Bandwidth queue clearance constraint', [(col('w'), 1), (b, 1)], 'L', 1 - r - tau)
+            self.add_rows('Inbound Bandwidth constraint', [(col('w_'), 1), (b_, 1)], 'L', 1 - r_)
+            self.add_rows('Inbound Bandwidth queue clearance constraint', [(col('w_'), 1)], 'G', tau_)
+
+        # Bandwidth constraints that require enough time for BOTH the band and all previous queue clearances
+        if p['tau_sum_flag']:
+            self.add_rows('Outbound Bandwidth sum tau constraint', [(col('w'), 1), (b, 1)], 'L', 1 - r - np.cumsum(tau))
+            if not p['tau_cstr_flag']:  # otherwise already added with the queue clearance constraints
+                self.add_rows('Inbound Bandwidth constraint', [(col('w_'), 1), (b_, 1)], 'L', 1 - r_)
+            self.add_rows('Inbound Bandwidth sum tau constraint', [(col('w_'), 1)], 'G', self.inbound_tau_sum())
+
+    def speed_rows(self) -> None:
+        # Min. and Max. speed constraints
+        p, col, z = self.params, self.col, self.col('z')
+        dist, dist_ = np.diff(p['d']), np.diff(p['d_'])
+        self.add_rows('Outbound Maximum speed', [(z, dist), (col('t'), -p['v_max'])], 'L', 0)
+        self.add_rows('Outbound Minimum speed', [(z, -dist), (col('t'), p['v_min'])], 'L', 0)
+        self.add_rows('Inbound Maximum speed', [(z, dist_), (col('t_'), -p['v_max'])], 'L', 0)
+        self.add_rows('Inbound Minimum speed', [(z, -dist_), (col('t_'), p['v_min'])], 'L', 0)
+
+    def speed_diff_rows(self) -> None:
+        # Min. and Max. speed difference constraints
+        p, col, z = self.params, self.col, self.col('z')
+        a, c = np.arange(self.nSegments - 1), np.arange(1, self.nSegments)  # successive segments
+        for direction, t_name, seg in [('Outbound', 't', np.diff(p['d'])), ('Inbound', 't_', np.diff(p['d_']))]:
+            disti, distj = seg[:-1], seg[1:]
+            self.add_rows(direction + ' Max speed diff', [(z, -disti * distj * p['inv_dv_max']),
+                                                          (col(t_name, a), distj), (col(t_name, c), -disti)], 'L', 0)
+            self.add_rows(direction + ' Min speed diff', [(z, disti * distj * p['inv_dv_min']),
+                                                          (col(t_name, a), distj), (col(t_name, c), -disti)], 'G', 0)
+
+    def offset_rows(self) -> None:
+        # Offset constraints
+        p, col = self.params, self.col
+        r, r_, l, l_, tau, tau_ = self.signal_arrays()
+        i, j = np.arange(self.nSegments), np.arange(1, self.nSignals)  # upstream and downstream signal of every segment
+        offset_terms = [(col('w', i), 1), (col('w_', i), 1), (col('w', j), -1), (col('w_', j), -1),
+                        (col('t'), 1), (col('t_'), 1), (col('m', i), -1)]
+        if p['leftturnleadlag']:
+            offset_terms += [(col('delta', i), l[i]), (col('delta_', i), -l_[i]),
+                             (col('delta', j), -l[j]), (col('delta_', j), l_[j])]
+            self.add_rows('Offset constraint', offset_terms, 'E', r[j] - r[i] + tau_[i] + tau[j])
+        elif not p['leftturnleadlag']:
+            self.add_rows('Offset constraint', offset_terms, 'E', 0.5 * (r[j] + r_[j]) - 0.5 * (r[i] + r_[i]) +
+                          (tau_[i] + tau[j]) - self.Deltas[i] + self.Deltas[j])
+
+    def start_band_rows(self) -> None:
+        # Start band constraint requires that first second of green on first intersection is part of the band
+        if self.params['w_0_flag']:
+            r, r_, l, l_, tau, tau_ = self.signal_arrays()
+            n, col = self.nSignals, self.col
+            self.add_rows('Outbound start band constraint', [(col('w', [0]), 1)], 'E', tau[0])
+            self.add_rows('Inbound start band constraint', [(col('w_', [n - 1]), 1), (col('b_'), 1)], 'E',
+                          1 - r_[n - 1])
+
+    def start_offset_rows(self) -> None:
+        # Start offset constraints requires that distance from red to band be ever increasing downstream the arterial
+        if self.params['w_mono_flag']:
+            r_, col = np.asarray(self.params['r_'], dtype=float), self.col
+            i, j = np.arange(self.nSegments), np.arange(1, self.nSignals)
+            self.add_rows('Outbound increasing start offset constraint', [(col('w', i), 1), (col('w', j), -1)], 'L', 0)
+            self.add_rows('Inbound increasing start offset constraint', [(col('w_', j), 1), (col('w_', i), -1)], 'G',
+                          r_[i] - r_[j])
+
+    def left_turn_rows(self) -> None:
+        # Left-turn lead/lag constraints
+        p, col = self.params, self.col
+        if p['lt_leadlag_flag']:
+            self.add_rows('Left-turn lead/lag', [(col('delta'), 1), (col('delta_'), 1)], 'E', 1)
+        if p['lt_leadlead_flag']:
+            self.add_rows('Left-turn lead/lead', [(col('delta'), 1), (col('delta_'), -1)], 'E', 0)
+        if p['lt_laglag_flag']:
+            self.add_rows('Left-turn lag/lag', [(col('delta'), 1), (col('delta_'), 1)], 'E', 2)
+
+    def offset_limit_rows(self) -> None:
+        # Gerbens offset constraint: Maximum 1 cycle offset between successive TLC's
+        p, col = self.params, self.col
+        i, j = np.arange(self.nSegments), np.arange(1, self.nSignals)
+        if p['mi_mj_max_1_flag']:
+            self.add_rows('Gerbens successive offset contraint', [(col('m', i), 1), (col('m', j), 1)], 'L', 1)
+        if p['m_max_1_flag']:
+            self.add_rows('Gerbens offset contraint', [(col('m'), 1)], 'L', 1)
+
+    def row_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The senses and right-hand sides as lower <= A @ x <= upper"""
+        return row_bounds(self.senses, self.rhs)
+
+    def solve(self, time_limit: Optional[float] = None) -> Tuple[dict, int]:
+        """Solves the matrix with scipy's HiGHS MILP, in-process, returns the output_dict and status like RunMaxband"""
+        x, status = solve_milp(self.c, self.A, self.senses, self.rhs, self.lower, self.upper, self.integrality,
+                               time_limit)
+        return self.get_results(x), status
+
+    def get_results(self, x: Optional[np.ndarray]) -> dict:
+        """Maps a solution vector back onto the output_dict of MaxbandModel.get_results"""
+        if x is None:
+            x = np.full(self.n_columns, np.nan)
+        x = np.where(self.integrality == 1, np.round(x), x)
+
+        def values(name, count=None):
+            return [None if np.isnan(v) else float(v) for v in x[self.columns[name][:count]]]
+        output_dict = dict()
+        output_dict['OB_w'] = values('w')
+        output_dict['IB_w'] = values('w_')
+        output_dict['OB_t'] = values('t')
+        output_dict['IB_t'] = values('t_')
+        output_dict['offsets'] = values('m', self.nSegments)
+        output_dict['OB_band'] = values('b')[0]
+        output_dict['IB_band'] = values('b_')[0]
+        output_dict['inv_CT'] = values('z')[0]
+        if self.params['leftturnleadlag']:
+            output_dict['OB_delta'] = values('delta')
+            output_dict['IB_delta'] = values('delta_')
+        return output_dict
+
+
+class MultibandMatrix(MaxbandMatrix):
+    """The multiband extension of the MAXBAND matrix: every link (segment) has a band of its own in each direction,
+    b[s] and b_[s], instead of one band for the whole arterial. A band is centred on the centre line of the
+    progression, so w and w_ are the distances from the end of red to the band centre, and it has to fit in the
+    green of both signals of its link. The offset, speed and cycle time constraints are those of MAXBAND.
+
+    The objective is the mean over the links of a[s] * b[s] + a_[s] * b_[s], with the weights (V / S) ** power
+    from the link volumes V and V_ [veh/h] of the parsed inputs and the saturation flow S [veh/h], so the links
+    with heavy traffic get the widest bands. The target ratio of every link is V_[s] / V[s]. Without volumes the
+    weights are 1 and k and the ratio is k, as in MAXBAND."""
+
+    def __init__(self, params: dict, power: float = 2.0, saturation: float = 1800.0, presolve: bool = True):
+        self.power = power
+        self.saturation = saturation
+        super().__init__(params, presolve)
+
+    def column_sizes(self) -> list:
+        sizes = super().column_sizes()
+        return [(name, self.nSegments if name in ('b', 'b_') else size) for name, size in sizes]
+
+    def volumes(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        V, V_ = self.params.get('V'), self.params.get('V_')
+        if V is None or V_ is None:
+            return None, None
+        return np.asarray(V, dtype=float), np.asarray(V_, dtype=float)
+
+    def link_ratios(self) -> np.ndarray:
+        """The target ratio k of every link, V_ / V where the outbound volume is positive"""
+        V, V_ = self.volumes()
+        k = np.full(self.nSegments, float(self.params['k']))
+        if V is None:
+            return k
+        return np.where(V > 0, V_ / np.where(V > 0, V, 1.0), k)
+
+    def objective(self) -> np.ndarray:
+        c = np.zeros(self.n_columns)
+        V, V_ = self.volumes()
+        if V is None:
+            c[self.columns['b']] = 1
+            c[self.columns['b_']] = self.params['k']
+        else:
+            c[self.columns['b']] = (V / self.saturation) ** self.power
+            c[self.columns['b_']] = (V_ / self.saturation) ** self.power
+        return c / self.nSegments
+
+    def favored_rows(self) -> None:
+        # Favored direction constraint per link
+        k, b, b_ = self.link_ratios(), self.col('b'), self.col('b_')
+        equal = np.isclose(k, 1)
+        self.add_rows('Favor bandwidth direction', [(b_[~equal], 1 - k[~equal]),
+                                                    (b[~equal], -(1 - k[~equal]) * k[~equal])], 'G', 0)
+        self.add_rows('Equal bandwidths', [(b[equal], 1), (b_[equal], -1)], 'E', 0)
+
+    def bandwidth_rows(self) -> None:
+        # The band of every link fits in the green of its upstream and its downstream signal, the green available
+        # to the band shrinks by the queue clearance times the flags ask for
+        p = self.params
+        r, r_, l, l_, tau, tau_ = self.signal_arrays()
+        upper, upper_ = 1 - r, 1 - r_
+        lower, lower_ = np.zeros(self.nSignals), np.zeros(self.nSignals)
+        if p['tau_cstr_flag']:
+            upper = np.minimum(upper, 1 - r - tau)
+            lower_ = np.maximum(lower_, tau_)
+        if p['tau_sum_flag']:
+            upper = np.minimum(upper, 1 - r - np.cumsum(tau))
+            lower_ = np.maximum(lower_, self.inbound_tau_sum())
+        links = np.arange(self.nSegments)
+        for direction, w, b, high, low in [('Outbound', 'w', 'b', upper, lower), ('Inbound', 'w_', 'b_', upper_, lower_)]:
+            for end in [links, links + 1]:  # the upstream and downstream signal of every link
+                self.add_rows(direction + ' link bandwidth constraint', [(self.col(w, end), 1), (self.col(b), 0.5)],
+                              'L', high[end])
+                self.add_rows(direction + ' link bandwidth start constraint', [(self.col(w, end), 1),
+                                                                               (self.col(b), -0.5)], 'G', low[end])
+
+    def start_band_rows(self) -> None:
+        # Start band constraint requires that first second of green on first intersection is part of the band
+        if self.params['w_0_flag']:
+            r, r_, l, l_, tau, tau_ = self.signal_arrays()
+            n, col = self.nSignals, self.col
+            self.add_rows('Outbound start band constraint', [(col('w', [0]), 1), (col('b', [0]), -0.5)], 'E', tau[0])
+            self.add_rows('Inbound start band constraint', [(col('w_', [n - 1]), 1), (col('b_', [n - 2]), 0.5)], 'E',
+                          1 - r_[n - 1])
+
+    def get_results(self, x: Optional[np.ndarray]) -> dict:
+        """The output_dict of MAXBAND, in which OB_band and IB_band are the narrowest link bands and OB_w and IB_w the
+        start of a band of that width around the centre line, so it runs through the whole arterial as ProcessResults
+        draws it. OB_link_bands and IB_link_bands hold the band of every link."""
+        output_dict = super().get_results(x)
+        if x is None:
+            x = np.full(self.n_columns, np.nan)
+
+        def values(array):
+            return [None if np.isnan(v) else float(v) for v in array]
+        for direction, w, b in [('OB', 'w', 'b'), ('IB', 'w_', 'b_')]:
+            bands = x[self.columns[b]]
+            narrowest = np.min(bands)
+            output_dict[f'{direction}_link_bands'] = values(bands)
+            output_dict[f'{direction}_band'] = values([narrowest])[0]
+            output_dict[f'{direction}_w'] = values(x[self.columns[w]] - 0.5 * narrowest)
+        return output_dict
@@ -0,0 +1,219 @@
+import argparse
+import json
+import sys
+from collections import deque
+from os.path import dirname, isabs, join
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from config import Config
+from Maxband_Matrix import MaxbandMatrix, solve_milp
+from Run_MAXBAND import parse_inputs
+
+
+class NetworkMaxband:
+    """MAXBAND for a network of arterials that share intersections, solved as one MILP with a common cycle time.
+
+    Every arterial keeps its own MaxbandMatrix block, only the inverse cycle time z is shared. The time at which the
+    outbound red of signal j ends follows from the one of the upstream signal i as w_i + t_i - w_j - tau_j plus an
+    integer number of cycles. Around every closed loop of the network these link times, together with the fixed
+    offsets between the arterials at the shared intersections, must add up to an integer number of cycles: the
+    network loop constraints, one per fundamental cycle of the intersection graph.
+
+    arterials maps a name to inputs in the GUI layout. intersections maps a name to {'signals': [[arterial, signal
+    index], ...], 'offsets': [...]}, where offset k is the end of the outbound red of signals[k] minus the one of
+    signals[0] [cycles]. Without offsets a two-phase crossing is assumed: the red of signals[k] ends when the outbound
+    green of signals[0] ends, so the offset is 1 - r of signals[0]."""
+
+    def __init__(self, arterials: Dict[str, dict], intersections: Dict[str, dict],
+                 weights: Optional[Dict[str, float]] = None):
+        self.names = list(arterials)
+        self.weights = {name: 1.0 for name in self.names}
+        self.weights.update(weights or {})
+        self.blocks = {name: MaxbandMatrix(parse_inputs(inputs)) for name, inputs in arterials.items()}
+
+        # Global columns: z first, then every arterial block without its own z, then one integer per loop
+        self.column_maps = dict()
+        n_columns = 1
+        for name in self.names:
+            block = self.blocks[name]
+            z = block.columns['z'][0]
+            local = np.arange(block.n_columns)
+            self.column_maps[name] = np.where(local == z, 0, n_columns + local - (local > z))
+            n_columns += block.n_columns - 1
+
+        self.nodes, self.node_offsets = self.map_signals_to_nodes(intersections)
+        self.loops = self.find_loops()
+        self.loop_columns = np.arange(n_columns, n_columns + len(self.loops))
+        self.n_columns = n_columns + len(self.loops)
+        self.build()
+
+    def map_signals_to_nodes(self, intersections: Dict[str, dict]) -> Tuple[dict, dict]:
+        """Every (arterial, signal) gets the intersection it belongs to and its red end relative to that node"""
+        nodes, node_offsets = dict(), dict()
+        for name, intersection in intersections.items():
+            signals = [tuple(signal) for signal in intersection['signals']]
+            offsets = intersection.get('offsets')
+            for k, (arterial, signal) in enumerate(signals):
+                if arterial not in self.blocks or not 0 <= signal < self.blocks[arterial].nSignals:
+                    raise ValueError(f'Intersection {name} refers to unknown signal {signal} of arterial {arterial}')
+                if (arterial, signal) in nodes:
+                    raise ValueError(f'Signal {signal} of arterial {arterial} belongs to more than one intersection')
+                nodes[(arterial, signal)] = name
+                if k == 0:
+                    node_offsets[(arterial, signal)] = 0.0
+                elif offsets is not None:
+                    node_offsets[(arterial, signal)] = float(offsets[k])
+                else:
+                    first_arterial, first_signal = signals[0]
+                    node_offsets[(arterial, signal)] = 1 - self.blocks[first_arterial].params['r'][first_signal]
+        for name in self.names:
+            for signal in range(self.blocks[name].nSignals):
+                nodes.setdefault((name, signal), (name, signal))  # signals of a single arterial are their own node
+                node_offsets.setdefault((name, signal), 0.0)
+        return nodes, node_offsets
+
+    def link_terms(self, arterial: str, i: int) -> Tuple[dict, float]:
+        """Time from the end of the outbound red at node of signal i to the one at the node of signal i + 1, as
+        global column coefficients and a constant [cycles]"""
+        block, columns = self.blocks[arterial], self.column_maps[arterial]
+        j = i + 1
+        terms = {columns[block.col('w', i)]: 1.0, columns[block.col('t', i)]: 1.0, columns[block.col('w', j)]: -1.0}
+        constant = -block.params['tau'][j] + self.node_offsets[(arterial, i)] - self.node_offsets[(arterial, j)]
+        return terms, constant
+
+    def find_loops(self) -> List[Tuple[dict, float]]:
+        """The fundamental cycles of the intersection graph, from a breadth-first spanning tree, as the sum of the
+        link times around each of them"""
+        adjacency = dict()
+        links = []
+        for name in self.names:
+            for i in range(self.blocks[name].nSegments):
+                u, v = self.nodes[(name, i)], self.nodes[(name, i + 1)]
+                links.append((u, v, name, i))
+                adjacency.setdefault(u, []).append((len(links) - 1, v, 1))
+                adjacency.setdefault(v, []).append((len(links) - 1, u, -1))
+
+        potentials = dict()  # node -> (terms, constant) of the path from the root of its tree
+        tree_links = set()
+        for root in adjacency:
+            if root in potentials:
+                continue
+            potentials[root] = (dict(), 0.0)
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                for link, neighbour, direction in adjacency[node]:
+                    if neighbour in potentials:
+                        continue
+                    terms, constant = self.link_terms(*links[link][2:])
+                    path_terms, path_constant = potentials[node]
+                    new_terms = dict(path_terms)
+                    for column, coefficient in terms.items():
+                        new_terms[column] = new_terms.get(column, 0.0) + direction * coefficient
+                    potentials[neighbour] = (new_terms, path_constant + direction * constant)
+                    tree_links.add(link)
+                    queue.append(neighbour)
+
+        loops = []
+        for link, (u, v, name, i) in enumerate(links):
+            if link in tree_links:
+                continue
+            terms, constant = self.link_terms(name, i)
+            loop_terms, loop_constant = dict(terms), constant
+            for node, sign in [(u, 1), (v, -1)]:
+                for column, coefficient in potentials[node][0].items():
+                    loop_terms[column] = loop_terms.get(column, 0.0) + sign * coefficient
+                loop_constant += sign * potentials[node][1]
+            loops.append(({column: c for column, c in loop_terms.items() if c != 0}, loop_constant))
+        return loops
+
+    def build(self) -> None:
+        rows, cols, vals, rhs, senses = [], [], [], [], []
+        n_rows = 0
+        self.c = np.zeros(self.n_columns)
+        self.lower = np.zeros(self.n_columns)
+        self.upper = np.full(self.n_columns, np.inf)
+        self.integrality = np.zeros(self.n_columns)
+        for name in self.names:
+            block, columns = self.blocks[name], self.column_maps[name]
+            A = block.A.tocoo()
+            rows.append(A.row + n_rows)
+            cols.append(columns[A.col])
+            vals.append(A.data)
+            rhs.append(block.rhs)
+            senses.append(block.senses)
+            n_rows += block.n_rows
+            np.add.at(self.c, columns, self.weights[name] * block.c)
+            self.lower[columns] = block.lower
+            self.upper[columns] = block.upper
+            self.integrality[columns] = block.integrality
+
+        # Network loop constraints: sum of the link times around the loop - n_loop == - sum of the constants
+        for loop_column, (terms, constant) in zip(self.loop_columns, self.loops):
+            loop_cols = np.array(list(terms) + [loop_column])
+            rows.append(np.full(len(loop_cols), n_rows))
+            cols.append(loop_cols)
+            vals.append(np.array(list(terms.values()) + [-1.0]))
+            rhs.append(np.array([-constant]))
+            senses.append(np.array(['E']))
+            n_rows += 1
+        self.lower[self.loop_columns] = -np.inf
+        self.integrality[self.loop_columns] = 1
+
+        self.n_rows = n_rows
+        self.A = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                                   shape=(self.n_rows, self.n_columns))
+        self.rhs = np.concatenate(rhs)
+        self.senses = np.concatenate(senses)
+
+    def solve(self, time_limit: Optional[float] = None) -> Tuple[dict, int]:
+        """Returns {'arterials': {name: output_dict}, 'loop_integers': [...], 'inv_CT': z} and the status"""
+        x, status = solve_milp(self.c, self.A, self.senses, self.rhs, self.lower, self.upper, self.integrality,
+                               time_limit)
+        return self.get_results(x), status
+
+    def get_results(self, x: Optional[np.ndarray]) -> dict:
+        if x is None:
+            x = np.full(self.n_columns, np.nan)
+        results = {'arterials': {name: self.blocks[name].get_results(x[self.column_maps[name]]) for name in self.names},
+                   'loop_integers': [None if np.isnan(v) else float(round(v)) for v in x[self.loop_columns]],
+                   'inv_CT': None if np.isnan(x[0]) else float(x[0])}
+        return results
+
+
+def load_network(path: str) -> Tuple[Dict[str, dict], Dict[str, dict], Dict[str, float]]:
+    """Reads a network JSON file: {"arterials": {name: scenario .ini path or inputs}, "intersections": {...},
+    "weights": {...}}, scenario paths are relative to the network file"""
+    with open(path) as f:
+        network = json.load(f)
+    arterials = dict()
+    for name, arterial in network['arterials'].items():
+        if isinstance(arterial, str):
+            arterial_path = arterial if isabs(arterial) else join(dirname(path), arterial)
+            arterial = Config(arterial_path).get_run_inputs()
+            if arterial is None:
+                raise FileNotFoundError(f'Scenario file {arterial_path} of arterial {name} does not exist')
+        arterials[name] = arterial
+    return arterials, network.get('intersections', {}), network.get('weights', {})
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Solve a network of arterials with shared intersections.')
+    parser.add_argument('network', help='Network JSON file')
+    parser.add_argument('-o', '--output', default='network_results.json')
+    parser.add_argument('--time-limit', type=float, default=None, help='Solver time limit [s]')
+    args = parser.parse_args(argv)
+    network = NetworkMaxband(*load_network(args.network))
+    results, status = network.solve(args.time_limit)
+    with open(args.output, 'w') as f:
+        json.dump({'status': status, **results}, f, indent=2)
+    print(f'{len(network.names)} arterials, {len(network.loops)} loops, status {status}, '
+          f'results written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+import pulp as lp
+
+from config import Config
+from Decompose_MAXBAND import set_initial_values
+from Run_MAXBAND import MaxbandModel, parse_inputs
+
+
+def collinear(a: dict, b: dict, c: dict, tolerance: float) -> bool:
+    """Whether point b lies on the line from a to c in the (IB_band, OB_band) plane"""
+    if c['IB_band'] - a['IB_band'] <= 0:
+        return abs(b['OB_band'] - a['OB_band']) <= tolerance
+    fraction = (b['IB_band'] - a['IB_band']) / (c['IB_band'] - a['IB_band'])
+    return abs(a['OB_band'] + fraction * (c['OB_band'] - a['OB_band']) - b['OB_band']) <= tolerance
+
+
+def integer_solution(point: dict) -> tuple:
+    """Offsets and left-turn patterns of a point"""
+    outputs = point['outputs']
+    return tuple(round(value) for key in ['offsets', 'OB_delta', 'IB_delta'] for value in outputs.get(key, []))
+
+
+def breakpoints(points: List[dict], tolerance: float = 1e-6) -> List[dict]:
+    """The nondominated points, ordered by inbound bandwidth, where the frontier changes slope or jumps. segment tells
+    how the frontier continues to the next point."""
+    points = sorted(points, key=lambda point: (point['IB_band'], -point['OB_band']))
+    front = []
+    for point in points:  # with increasing inbound bandwidth the outbound bandwidth of the front decreases
+        while front and front[-1]['OB_band'] <= point['OB_band'] + tolerance:
+            front.pop()  # dominated, or a duplicate of this point
+        front.append(point)
+    kept = front[:1]
+    for i in range(1, len(front) - 1):
+        if not collinear(kept[-1], front[i], front[i + 1], tolerance) \
+                or integer_solution(kept[-1]) != integer_solution(front[i + 1]):
+            kept.append(front[i])
+    kept += front[1:][-1:]
+    # Between points with the same integer solution the frontier is linear, between others it steps down at the
+    # inbound bandwidth of the next point
+    for point, following in zip(kept, kept[1:] + [None]):
+        if following is None:
+            point['segment'] = None
+        else:
+            point['segment'] = 'linear' if integer_solution(point) == integer_solution(following) else 'step'
+    return kept
+
+
+class BandwidthFrontier:
+    """The trade-off between outbound and inbound bandwidth, as the points where the Pareto frontier changes slope.
+
+    Epsilon constraint method: the model maximizes the outbound bandwidth (plus a tiny multiple of the inbound one,
+    so only nondominated points come out) subject to the inbound bandwidth being at least epsilon. The favored
+    direction constraint of k is left out. The frontier is traced by bisection on epsilon until it is linear between
+    the solved points, or they are closer than resolution [cycles]. The model is built once, only the right-hand side
+    of the epsilon constraint changes between solves, and every solve starts from the integer solution of the
+    nearest solved point."""
+
+    def __init__(self, params: dict, resolution: float = 0.002, time_limit: Optional[float] = None,
+                 augmentation: float = 1e-4, threads: Optional[int] = None):
+        self.params = dict(params, k=0.0)  # k = 0 makes the favored direction constraint b_ >= 0
+        self.resolution = resolution
+        self.augmentation = augmentation
+        self.model = MaxbandModel(self.params)
+        self.epsilon = lp.LpConstraint(lp.LpAffineExpression({self.model.b_: 1}), sense=lp.LpConstraintGE,
+                                       name='Inbound bandwidth floor', rhs=0)
+        self.model.coor += self.epsilon
+        self.solver = lp.PULP_CBC_CMD(msg=False, warmStart=True, timeLimit=time_limit, threads=threads)
+        self.points: Dict[float, dict] = dict()  # epsilon -> solved point
+        self.solves = 0
+
+    def set_objective(self, outbound: bool) -> None:
+        b, b_ = (self.model.b, self.model.b_) if outbound else (self.model.b_, self.model.b)
+        self.model.coor.setObjective(b + self.augmentation * b_)
+
+    def solve_point(self, epsilon: float) -> Optional[dict]:
+        """The nondominated point with the largest outbound bandwidth at an inbound bandwidth of at least epsilon,
+        None if there is none"""
+        self.epsilon.constant = -epsilon
+        if self.points:
+            nearest = min(self.points, key=lambda solved: abs(solved - epsilon))
+            set_initial_values(self.model, self.points[nearest]['outputs'])
+        status = self.model.solve(self.solver)
+        self.solves += 1
+        if status != 1:
+            return None
+        outputs = self.model.get_results()
+        point = {'epsilon': epsilon, 'OB_band': outputs['OB_band'], 'IB_band': outputs['IB_band'],
+                 'cycle_time': 1 / outputs['inv_CT'], 'proven': self.model.coor.sol_status == lp.LpSolutionOptimal,
+                 'outputs': outputs}
+        self.points[epsilon] = point
+        return point
+
+    def refine(self, low: dict, high: dict) -> None:
+        if high['epsilon'] - low['epsilon'] <= self.resolution or high['IB_band'] - low['IB_band'] <= self.resolution:
+            return
+        point = self.solve_point(0.5 * (low['epsilon'] + high['epsilon']))
+        if point is None:
+            return
+        interior = low['IB_band'] + self.resolution < point['IB_band'] < high['IB_band'] - self.resolution
+        if interior and integer_solution(low) == integer_solution(high) \
+                and collinear(low, point, high, 0.1 * self.resolution):
+            # For a fixed integer solution the frontier is concave, so a midpoint on the chord means it is linear
+            return
+        self.refine(low, point)
+        self.refine(point, high)
+
+    def compute(self) -> List[dict]:
+        """The breakpoints of the frontier from the largest outbound to the largest inbound bandwidth, each with its
+        cycle time and the outputs (offsets, left-turn patterns) of that solution"""
+        self.set_objective(outbound=False)
+        inbound_end = self.solve_point(0.0)
+        if inbound_end is None:
+            return []
+        self.points.clear()  # solved for the other objective, only kept as MIP start of the first point
+        self.set_objective(outbound=True)
+        outbound_end = self.solve_point(0.0)
+        last = self.solve_point(inbound_end['IB_band'])
+        if last is None:  # numerically just out of reach, the inbound end is a point of the frontier as well
+            last = dict(inbound_end, epsilon=inbound_end['IB_band'])
+            self.points[last['epsilon']] = last
+        self.refine(outbound_end, last)
+        return breakpoints(list(self.points.values()), 0.1 * self.resolution)
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Compute the trade-off curve of outbound against inbound bandwidth.')
+    parser.add_argument('scenario', help='Scenario .ini file, its k is not used')
+    parser.add_argument('--resolution', type=float, default=0.002,
+                        help='Smallest inbound bandwidth step between solved points [cycles] (default: 0.002)')
+    parser.add_argument('--time-limit', type=float, default=None, help='Solver time limit per point [s]')
+    parser.add_argument('-o', '--output', default='frontier.json', help='Breakpoints with their solutions')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    inputs = Config(args.scenario).get_run_inputs()
+    if inputs is None:
+        return 1
+    start_time = time.perf_counter()
+    frontier = BandwidthFrontier(parse_inputs(inputs), args.resolution, args.time_limit)
+    points = frontier.compute()
+    elapsed = time.perf_counter() - start_time
+    for point in points:
+        print(f"outbound {point['OB_band']:.4f}  inbound {point['IB_band']:.4f} [cycles]  "
+              f"cycle time {point['cycle_time']:.1f} s")
+    with open(args.output, 'w') as f:
+        json.dump(points, f, indent=2)
+    print(f'{len(points)} breakpoints from {frontier.solves} solves in {elapsed:.2f} s, written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
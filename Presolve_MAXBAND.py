@@ -0,0 +1,172 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Margin [cycles] on the offset bounds, so rounding in the solver never cuts off a solution on the bound
+bound_tolerance = 1e-6
+# The inputs stack_params stacks, by kind
+stacked_scalars = ['c_min', 'c_max', 'v_min', 'v_max']
+stacked_arrays = ['d', 'd_', 'r', 'r_', 'l', 'l_', 'tau', 'tau_']
+stacked_flags = ['leftturnleadlag', 'mi_mj_max_1_flag', 'm_max_1_flag', 'tau_cstr_flag', 'tau_sum_flag', 'w_0_flag']
+
+# The bounds below take the inputs of one corridor, or those of corridors with the same number of signals stacked
+# along a first axis by stack_params: the scalars and flags as columns, the distances and timings as rows.
+
+
+def travel_time_bounds(params: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Lowest and highest outbound and inbound travel time t of every segment [cycles]: the distance at the maximum
+    speed in the longest cycle, and at the minimum speed in the shortest cycle"""
+    p = params
+    dist, dist_ = np.diff(p['d'], axis=-1), np.diff(p['d_'], axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (dist / (p['v_max'] * p['c_max']), dist / (p['v_min'] * p['c_min']),
+                dist_ / (p['v_max'] * p['c_max']), dist_ / (p['v_min'] * p['c_min']))
+
+
+def regular_inputs(params: dict) -> np.ndarray:
+    """Whether the cycle time and speed bounds are positive ranges, the distances positive and the signal timings
+    fractions between 0 and 1, which the offset bounds assume"""
+    p = params
+    regular = (p['c_min'] > 0) & (p['c_min'] <= p['c_max']) & (p['v_min'] > 0) & (p['v_min'] <= p['v_max'])
+    for key in ['d', 'd_']:
+        regular = regular & np.all(np.diff(p[key], axis=-1) > 0, axis=-1, keepdims=True)
+    for key in ['r', 'r_', 'l', 'l_', 'tau', 'tau_']:
+        values = np.asarray(p[key], dtype=float)
+        regular = regular & np.all((values >= 0) & (values <= 1), axis=-1, keepdims=True)
+    return regular
+
+
+def band_start_bounds(params: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Lowest and highest outbound and inbound distance w from the end of red to the band of every signal [cycles],
+    from the green that is left after the red and the queue clearance times the flags ask for"""
+    p = params
+    r, r_, tau, tau_ = (np.asarray(p[key], dtype=float) for key in ['r', 'r_', 'tau', 'tau_'])
+    w_low, w_high = np.zeros_like(r), 1 - r
+    w_low_, w_high_ = np.zeros_like(r_), 1 - r_
+    w_high = np.where(p['tau_cstr_flag'], np.minimum(w_high, 1 - r - tau), w_high)
+    w_low_ = np.where(p['tau_cstr_flag'], np.maximum(w_low_, tau_), w_low_)
+    tau_sum_ = np.concatenate((np.cumsum(tau_[..., :-1], axis=-1)[..., ::-1], np.zeros_like(tau_[..., :1])), axis=-1)
+    w_high = np.where(p['tau_sum_flag'], np.minimum(w_high, 1 - r - np.cumsum(tau, axis=-1)), w_high)
+    w_low_ = np.where(p['tau_sum_flag'], np.maximum(w_low_, tau_sum_), w_low_)
+    w_low[..., :1] = np.where(p['w_0_flag'], np.maximum(w_low[..., :1], tau[..., :1]), w_low[..., :1])
+    w_high[..., :1] = np.where(p['w_0_flag'], np.minimum(w_high[..., :1], tau[..., :1]), w_high[..., :1])
+    return w_low, w_high, w_low_, w_high_
+
+
+def offset_bounds(params: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Lowest and highest integer offset m of every segment, from the offset constraint
+    m[i] = w[i] + w_[i] - w[i + 1] - w_[i + 1] + t[i] + t_[i] (+ left-turn terms) - rhs[i]
+    with every variable at the end of its range that gives the extreme. Without these bounds m is a free integer,
+    as it stays for inputs that are not regular_inputs."""
+    p = params
+    r, r_, l, l_, tau, tau_ = (np.asarray(p[key], dtype=float) for key in ['r', 'r_', 'l', 'l_', 'tau', 'tau_'])
+    with np.errstate(invalid='ignore'):  # inf - inf of inputs that are not regular, their bounds are not used
+        t_low, t_high, t_low_, t_high_ = travel_time_bounds(params)
+        w_low, w_high, w_low_, w_high_ = band_start_bounds(params)
+        i, j = np.arange(r.shape[-1] - 1), np.arange(1, r.shape[-1])
+        low = w_low[..., i] + w_low_[..., i] - w_high[..., j] - w_high_[..., j] + t_low + t_low_
+        high = w_high[..., i] + w_high_[..., i] - w_low[..., j] - w_low_[..., j] + t_high + t_high_
+        # The binary delta terms l[i] delta[i] - l_[i] delta_[i] - l[j] delta[j] + l_[j] delta_[j] with left turns
+        low = np.where(p['leftturnleadlag'], low - l_[..., i] - l[..., j], low)
+        high = np.where(p['leftturnleadlag'], high + l[..., i] + l_[..., j], high)
+        rhs = np.where(p['leftturnleadlag'], r[..., j] - r[..., i] + tau_[..., i] + tau[..., j],
+                       0.5 * (r[..., j] + r_[..., j]) - 0.5 * (r[..., i] + r_[..., i]) + tau_[..., i] + tau[..., j])
+        regular = regular_inputs(params)  # the others are left free, as solvers handle such inputs unevenly
+        return (np.where(regular, np.ceil(low - rhs - bound_tolerance), -np.inf),
+                np.where(regular, np.floor(high - rhs + bound_tolerance), np.inf))
+
+
+def stack_params(params_list: Sequence[dict]) -> dict:
+    """The inputs of corridors with the same number of signals stacked along a first axis, for the bounds and
+    check_stacked"""
+    stacked = {'nSignals': int(params_list[0]['nSignals'])}
+    for key in stacked_scalars:
+        stacked[key] = np.array([[float(params[key])] for params in params_list])
+    for key in stacked_arrays:
+        stacked[key] = np.array([np.asarray(params[key], dtype=float) for params in params_list])
+    for key in stacked_flags:
+        stacked[key] = np.array([[bool(params[key])] for params in params_list])
+    return stacked
+
+
+def check_stacked(params: dict) -> Tuple[List[List[str]], List[List[str]]]:
+    """The reasons the stacked inputs (stack_params) of every corridor cannot have a solution, and warnings about
+    inputs that are odd but do not rule out a solution, found with array operations over all corridors at once. The
+    bounds are only checked for corridors with a cycle time range, and the offsets only for corridors with green
+    left for the bands."""
+    p = params
+    problems = [[] for _ in range(len(p['c_min']))]
+    warnings = [[] for _ in range(len(p['c_min']))]
+
+    def report(found: List[List[str]], mask: np.ndarray, message) -> None:
+        """Adds message(corridor, signals or segments) for every corridor (row) the mask is true anywhere"""
+        for row in np.flatnonzero(mask.any(axis=-1)):
+            found[row].append(message(row, np.flatnonzero(mask[row]).tolist()))
+
+    # z c_max >= 1 and z c_min <= 1 with z >= 0
+    report(problems, (p['c_max'] <= 0) | ((p['c_min'] > 0) & (p['c_min'] > p['c_max'])),
+           lambda row, _: f"Cycle time bounds c_min = {p['c_min'][row, 0]} and c_max = {p['c_max'][row, 0]} leave "
+                          f"no cycle time")
+    report(warnings, p['c_min'] <= 0,
+           lambda row, _: f"c_min = {p['c_min'][row, 0]} is not positive, the cycle time has no lower bound")
+    # d z <= v_max t and v_min t <= d z with z > 0 and t >= 0: a positive distance needs 0 < v_max and v_min <= v_max
+    positive = (np.diff(p['d'], axis=-1) > 0).any(axis=-1, keepdims=True) | \
+        (np.diff(p['d_'], axis=-1) > 0).any(axis=-1, keepdims=True)
+    report(problems, positive & ((p['v_max'] <= 0) | (p['v_max'] < p['v_min'])),
+           lambda row, _: f"Speed bounds v_min = {3.6 * p['v_min'][row, 0]:.4g} and v_max = "
+                          f"{3.6 * p['v_max'][row, 0]:.4g} km/h leave no travel time on positive distances")
+    report(warnings, p['v_min'] <= 0,
+           lambda row, _: f"v_min = {3.6 * p['v_min'][row, 0]:.4g} km/h is not positive, the travel times have no "
+                          f"upper bound")
+    for key in ['d', 'd_']:
+        report(warnings, np.diff(p[key], axis=-1) <= 0,
+               lambda row, segments: f'Segment distances {key} of segments {segments} are not positive')
+    for key in ['r', 'r_', 'l', 'l_', 'tau', 'tau_']:
+        report(warnings, (p[key] < 0) | (p[key] > 1),
+               lambda row, signals: f'{key} must be fractions of the cycle between 0 and 1, signals {signals} are not')
+    # A left turn crosses the through traffic of the opposite direction, so it should fit in its red
+    for direction, l, red in [('outbound', p['l'], p['r_']), ('inbound', p['l_'], p['r'])]:
+        report(warnings, p['leftturnleadlag'] & (l > red + bound_tolerance),
+               lambda row, signals: f'The {direction} left turn is longer than the red of the opposite direction at '
+                                    f'signals {signals}')
+    valid = np.array([not found for found in problems])[:, None]  # the bounds mean nothing for the others
+
+    w_low, w_high, w_low_, w_high_ = band_start_bounds(params)
+    for direction, low, high in [('outbound', w_low, w_high), ('inbound', w_low_, w_high_)]:
+        report(problems, valid & (low > high + bound_tolerance),
+               lambda row, signals: f'No green left for the {direction} band at signals {signals} after the red and '
+                                    f'queue clearance times')
+    valid &= np.array([not found for found in problems])[:, None]
+
+    low, high = offset_bounds(params)
+    report(problems, valid & (low > high),
+           lambda row, segments: f'No integer offset fits the travel times of segments {segments}')
+    report(problems, valid & p['m_max_1_flag'] & (low > 1),
+           lambda row, segments: f'The offsets of segments {segments} are more than 1 cycle, which m_max_1_flag does '
+                                 f'not allow')
+    report(problems, valid & p['mi_mj_max_1_flag'] & (low[:, :-1] + low[:, 1:] > 1),
+           lambda row, segments: f'The offsets of successive segments {segments} add up to more than 1 cycle, which '
+                                 f'mi_mj_max_1_flag does not allow')
+    return problems, warnings
+
+
+def check_batch(params_list: Sequence[dict]) -> Tuple[List[List[str]], List[List[str]]]:
+    """The reasons the inputs of every corridor cannot have a solution (an empty list for those without) and the
+    warnings about each. The corridors are checked together per number of signals, see check_stacked."""
+    problems: List[List[str]] = [[] for _ in params_list]
+    warnings: List[List[str]] = [[] for _ in params_list]
+    groups = dict()  # number of signals -> indices of the corridors
+    for index, params in enumerate(params_list):
+        groups.setdefault(int(params['nSignals']), []).append(index)
+    for indices in groups.values():
+        found, warned = check_stacked(stack_params([params_list[i] for i in indices]))
+        for index, corridor_problems, corridor_warnings in zip(indices, found, warned):
+            problems[index], warnings[index] = corridor_problems, corridor_warnings
+    return problems, warnings
+
+
+def check_inputs(params: dict) -> Tuple[List[str], List[str]]:
+    """The reasons the inputs cannot have a solution, found without solving, an empty list if there are none, and
+    warnings about inputs that are odd but are solved"""
+    problems, warnings = check_batch([params])
+    return problems[0], warnings[0]
@@ -1,28 +1,108 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
-from math import ceil, floor
+from math import ceil
+
+# matplotlib is imported by MaxbandPlot on first use, so processing results does not pay for it
+
+
+def prefix_sums(x: np.ndarray) -> np.ndarray:
+    """[0, x0, x0 + x1, ...] along the last axis"""
+    return np.concatenate([np.zeros(x.shape[:-1] + (1,)), np.cumsum(x, axis=-1)], axis=-1)
+
+
+def solution_arrays(inputs: dict, outputs: dict) -> dict:
+    """The inputs and outputs of one run as float arrays, the layout compute_timings takes"""
+    solution = dict()
+    solution['d'] = np.cumsum([0.0] + [float(d) for d in inputs['SegmentInputs']['outbound_d']])
+    solution['d_'] = np.cumsum([0.0] + [float(d_) for d_ in inputs['SegmentInputs']['inbound_d']])
+    for key, name in [('r', 'outbound_r'), ('r_', 'inbound_r'), ('l', 'outbound_l'), ('l_', 'inbound_l'),
+                      ('tau', 'outbound_tau'), ('tau_', 'inbound_tau')]:
+        solution[key] = np.array([float(value) for value in inputs['SignalInputs'][name]])
+    ## TODO: Ingtegrate Deltas as propor input, for now set to all zeros
+    solution['Deltas'] = np.zeros(len(solution['r']))
+    solution['leftturnleadlag'] = bool(inputs['Selections']['leftturnleadlag'])
+    solution['tau_sum_flag'] = bool(inputs['Selections']['tau_sum_flag'])
+    for key in ['OB_w', 'IB_w', 'OB_t', 'IB_t', 'OB_band', 'IB_band', 'inv_CT']:
+        solution[key] = np.array(outputs[key], dtype=float)
+    for key in ['OB_delta', 'IB_delta']:  # without left-turn optimization every left turn leads
+        solution[key] = np.array(outputs[key] if solution['leftturnleadlag'] else solution['Deltas'], dtype=float)
+    return solution
+
+
+def stack_solutions(solutions: list) -> dict:
+    """Stacks the solution_arrays of runs of corridors with the same number of signals into one batch"""
+    return {key: np.stack([solution[key] for solution in solutions]) for key in solutions[0]}
+
+
+def compute_timings(solution: dict) -> dict:
+    """Start and end of the bands, the red times and the left-turn times per signal [cycles], as arrays of shape
+    (..., nSignals, 2). The solution is one from solution_arrays, or a batch from stack_solutions, in which case the
+    leading axis is the run. The band timings are arrival / departure, the red and left-turn timings start / end.
+    The left-turn timings are only meaningful with left-turn optimization."""
+    r, r_, l, l_ = solution['r'], solution['r_'], solution['l'], solution['l_']
+    tau, tau_, Deltas = solution['tau'], solution['tau_'], solution['Deltas']
+    OB_w, IB_w, OB_t, IB_t = solution['OB_w'], solution['IB_w'], solution['OB_t'], solution['IB_t']
+    OB_band = np.asarray(solution['OB_band'])[..., None]
+    IB_band = np.asarray(solution['IB_band'])[..., None]
+    OB_delta, IB_delta = np.round(solution['OB_delta']), np.round(solution['IB_delta'])
+    leftturnleadlag = np.asarray(solution['leftturnleadlag'])[..., None]
+    tau_sum_flag = np.asarray(solution['tau_sum_flag'])[..., None]
+    first = np.s_[..., :1]
+    timings = dict()
+
+    # Outbound band start: departure i + 1 = departure i + travel time - queue clearance i + 1
+    origin = np.where(leftturnleadlag,
+                      l[first] * OB_delta[first] - l_[first] * IB_delta[first] + r[first] - 0.5 * r_[first],
+                      Deltas[first] + 0.5 * r[first]) + OB_w[first] + tau[first]
+    OB_departure = origin - np.cumsum(tau, axis=-1) + prefix_sums(OB_t)
+    timings['s_OB_b'] = np.stack([OB_departure + tau, OB_departure], axis=-1)
+
+    # Inbound band start: arrival i + 1 = arrival i - travel time + queue clearance i + 1
+    origin = -0.5 * r_[first] - IB_w[first] + tau_[first] - IB_band
+    IB_arrival = origin - prefix_sums(IB_t) + np.cumsum(tau_, axis=-1) - tau_[first]
+    timings['s_IB_b'] = np.stack([IB_arrival, IB_arrival - tau_], axis=-1)
+
+    # With tau_sum_flag the band ends after the queue clearances of all upstream signals
+    OB_tau_sum = np.cumsum(tau, axis=-1)  # sum(tau[:i + 1])
+    IB_tau_sum = prefix_sums(tau_)[..., -2::-1]  # sum(tau_[:nSignals - 1 - i])
+    timings['e_OB_b'] = np.where(tau_sum_flag[..., None], (OB_departure + OB_band + OB_tau_sum)[..., None],
+                                 timings['s_OB_b'] + OB_band[..., None])
+    timings['e_IB_b'] = np.where(tau_sum_flag[..., None],
+                                 (timings['s_IB_b'][..., 1] + IB_band + IB_tau_sum)[..., None],
+                                 timings['s_IB_b'] + IB_band[..., None])
+
+    OB_red_end = OB_departure - OB_w
+    timings['OB_red'] = np.stack([OB_red_end - r, OB_red_end], axis=-1)
+    IB_red_start = timings['e_IB_b'][..., 1] + IB_w - np.where(tau_sum_flag, IB_tau_sum, 0.0)
+    timings['IB_red'] = np.stack([IB_red_start, IB_red_start + r_], axis=-1)
+
+    # The outbound left turn is part of the inbound red time, before inbound green (delta 0) or after it (delta 1),
+    # the inbound left turn likewise part of the outbound red time
+    OB_left_start = np.where(OB_delta == 1, timings['IB_red'][..., 0], timings['IB_red'][..., 1] - l)
+    timings['OB_left'] = np.stack([OB_left_start, OB_left_start + l], axis=-1)
+    IB_left_start = np.where(IB_delta == 1, timings['OB_red'][..., 0], timings['OB_red'][..., 1] - l_)
+    timings['IB_left'] = np.stack([IB_left_start, IB_left_start + l_], axis=-1)
+    return timings
+
+
+def segment_speeds(t: np.ndarray, d: np.ndarray, inv_CT, decimals: int = 2) -> np.ndarray:
+    """Speeds [km/h] of the segments of one run, or of a batch of runs"""
+    return np.round(np.diff(d, axis=-1) * np.asarray(inv_CT)[..., None] / t * 3.6, decimals)
 
 
 class ProcessResults:
 
     def __init__(self, inputs, outputs):
         self.input_dict: dict = inputs
+        self.output_dict: dict = outputs
+        self.solution = solution_arrays(inputs, outputs)
         self.nSignals = int(self.input_dict['SingleInputs']['nsignals'])
-        self.d = np.array(np.cumsum([0.0] + [float(d) for d in self.input_dict['SegmentInputs']['outbound_d']]))
-        self.d_ = np.array(np.cumsum([0.0] + [float(d_) for d_ in self.input_dict['SegmentInputs']['inbound_d']]))
-        self.r = [float(r) for r in self.input_dict['SignalInputs']['outbound_r']]
-        self.r_ = [float(r_) for r_ in self.input_dict['SignalInputs']['inbound_r']]
-        self.l = [float(l) for l in self.input_dict['SignalInputs']['outbound_l']]
-        self.l_ = [float(l) for l in self.input_dict['SignalInputs']['inbound_l']]
-        ## TODO: Ingtegrate Deltas as propor input, for now set to all zeros
-        self.Deltas = np.zeros(self.nSignals)
-        self.tau: list = [float(tau) for tau in self.input_dict['SignalInputs']['outbound_tau']]
-        self.tau_: list = [float(tau_) for tau_ in self.input_dict['SignalInputs']['inbound_tau']]
-        self.leftturnleadlag = self.input_dict['Selections']['leftturnleadlag']
-        self.tau_sum_flag = self.input_dict['Selections']['tau_sum_flag']
+        self.d = self.solution['d']
+        self.d_ = self.solution['d_']
+        self.leftturnleadlag = self.solution['leftturnleadlag']
+        self.tau_sum_flag = self.solution['tau_sum_flag']
+        self.r, self.r_, self.l, self.l_ = (self.solution[key] for key in ['r', 'r_', 'l', 'l_'])
+        self.tau, self.tau_, self.Deltas = (self.solution[key] for key in ['tau', 'tau_', 'Deltas'])
 
-        self.output_dict: dict = outputs
         self.OB_band = self.output_dict['OB_band']
         self.IB_band = self.output_dict['IB_band']
         self.inv_CT = self.output_dict['inv_CT']
@@ -35,110 +115,21 @@ class ProcessResults:
             self.OB_delta = self.output_dict['OB_delta']
             self.IB_delta = self.output_dict['IB_delta']
 
-        self.s_OB_b = self.compute_OB_startband_timings()
-        self.s_IB_b = self.compute_IB_startband_timings()
-
-        self.e_OB_b = self.compute_OB_endband_timings()
-        self.e_IB_b = self.compute_IB_endband_timings()
-
-        self.OB_red = self.compute_OB_red_timings()
-        self.IB_red = self.compute_IB_red_timings()
-
-        if self.leftturnleadlag:
-            self.OB_left = self.compute_OB_leftturn_timings()
-            self.IB_left = self.compute_IB_leftturn_timings()
+        timings = compute_timings(self.solution)
+        self.s_OB_b = timings['s_OB_b']
+        self.s_IB_b = timings['s_IB_b']
+        self.e_OB_b = timings['e_OB_b']
+        self.e_IB_b = timings['e_IB_b']
+        self.OB_red = timings['OB_red']
+        self.IB_red = timings['IB_red']
+        self.OB_left = timings['OB_left'] if self.leftturnleadlag else None
+        self.IB_left = timings['IB_left'] if self.leftturnleadlag else None
 
         self.OB_speeds = self.get_segment_speeds(self.OB_t, self.d, 1)
         self.IB_speeds = self.get_segment_speeds(self.IB_t, self.d_, 1)
 
-    def get_OB_startband_origin(self) -> float:
-        if self.leftturnleadlag:
-            return self.l[0] * self.OB_delta[0] - self.l_[0] * self.IB_delta[0] + self.r[0] - 0.5 * self.r_[0] + self.OB_w[0] + self.tau[0]
-
-        if not self.leftturnleadlag:
-            return self.Deltas[0] + 0.5 * self.r[0] + self.OB_w[0] + self.tau[0]
-
-    def get_IB_startband_origin(self) -> float:
-        return -0.5 * self.r_[0] - self.IB_w[0] + self.tau_[0] - self.IB_band
-
-    def compute_OB_startband_timings(self) -> np.array:
-        s_OB_b = np.zeros((self.nSignals, 2))  # intersection nr, arrival / departure
-        s_OB_b[0, 0] = self.get_OB_startband_origin()
-        s_OB_b[0, 1] = s_OB_b[0, 0] - self.tau[0]
-        for i in range(self.nSignals - 1):
-            s_OB_b[i + 1, 0] = s_OB_b[i, 1] + self.OB_t[i]
-            s_OB_b[i + 1, 1] = s_OB_b[i + 1, 0] - self.tau[i + 1]
-        return s_OB_b
-
-    def compute_IB_startband_timings(self) -> np.array:
-        s_IB_b = np.zeros((self.nSignals, 2))  # intersection nr, arrival / departure
-        s_IB_b[0, 0] = self.get_IB_startband_origin()
-        s_IB_b[0, 1] = s_IB_b[0, 0] - self.tau_[0]
-        for i in range(self.nSignals - 1):
-            s_IB_b[i + 1, 1] = s_IB_b[i, 0] - self.IB_t[i]
-            s_IB_b[i + 1, 0] = s_IB_b[i + 1, 1] + self.tau_[i + 1]
-        return s_IB_b
-
-    def compute_OB_endband_timings(self) -> np.array:
-        e_OB_b = np.zeros((self.nSignals, 2))
-        if self.tau_sum_flag:
-            for i in range(self.nSignals):
-                e_OB_b[i, :] = self.s_OB_b[i, 1] + self.OB_band + np.sum(self.tau[:i + 1])
-        elif not self.tau_sum_flag:
-            e_OB_b = self.s_OB_b + self.OB_band
-        return e_OB_b
-
-    def compute_IB_endband_timings(self) -> np.array:
-        e_IB_b = np.zeros((self.nSignals, 2))
-        if self.tau_sum_flag:
-            for i in range(self.nSignals):
-                e_IB_b[i, :] = self.s_IB_b[i, 1] + self.IB_band + np.sum(self.tau_[:self.nSignals - 1 - i])
-        elif not self.tau_sum_flag:
-            e_IB_b = self.s_IB_b + self.IB_band
-        return e_IB_b
-
-    def compute_OB_red_timings(self) -> np.array:  # =end red
-        OB_red = np.zeros((self.nSignals, 2))  # intersection nr, start/end
-        for i in range(self.nSignals):
-            OB_red[i, 1] = self.s_OB_b[i, 1] - self.OB_w[i]
-            OB_red[i, 0] = OB_red[i, 1] - self.r[i]
-        return OB_red
-
-    def compute_IB_red_timings(self) -> np.array:  # =end red
-        IB_red = np.zeros((self.nSignals, 2))  # intersection nr, start/end
-        for i in range(self.nSignals):
-            if not self.tau_sum_flag:
-                IB_red[i, 0] = self.e_IB_b[i, 1] + self.IB_w[i]
-            elif self.tau_sum_flag:
-                IB_red[i, 0] = self.e_IB_b[i, 1] + self.IB_w[i] - np.sum(self.tau_[:self.nSignals - 1 - i])
-            IB_red[i, 1] = IB_red[i, 0] + self.r_[i]
-        return IB_red
-
-    def compute_OB_leftturn_timings(self) -> np.array:  # take note that outbound left turn is part of inbound red time
-        OB_left = np.zeros((self.nSignals, 2))
-        for i in range(self.nSignals):
-            if self.OB_delta[i] == 0:  # left turn before inbound green so ends at end of inbound red
-                OB_left[i, 1] = self.IB_red[i, 1]
-                OB_left[i, 0] = OB_left[i, 1] - self.l[i]
-            elif self.OB_delta[i] == 1:  # left turn after
-                OB_left[i, 0] = self.IB_red[i, 0]
-                OB_left[i, 1] = OB_left[i, 0] + self.l[i]
-        return OB_left
-
-    def compute_IB_leftturn_timings(self) -> np.array:  # take note that inbound left turn is part of outbound red time
-        IB_left = np.zeros((self.nSignals, 2))  # intersection nr, start/end
-        for i in range(self.nSignals):
-            if self.IB_delta[i] == 0:  # left turn before outbound green so ends at end of OB_red
-                IB_left[i, 1] = self.OB_red[i, 1]
-                IB_left[i, 0] = IB_left[i, 1] - self.l_[i]
-            elif self.IB_delta[i] == 1:  # left turn after outbound green so start at start of OB_red
-                IB_left[i, 0] = self.OB_red[i, 0]
-                IB_left[i, 1] = IB_left[i, 0] + self.l_[i]
-        return IB_left
-
-    def get_segment_speeds(self, t, d, decimals=2) -> np.array:
-        speeds = [round(((d[i + 1] - d[i]) * self.inv_CT / t[i]) * 3.6, decimals) for i in range(len(t))]
-        return speeds
+    def get_segment_speeds(self, t, d, decimals=2) -> list:
+        return segment_speeds(np.asarray(t, dtype=float), d, self.inv_CT, decimals).tolist()
 
     def get_processed_results_dict(self) -> dict:
         processed_results_dict = {}
@@ -155,63 +146,85 @@ class ProcessResults:
         return processed_results_dict
 
     # Function used to create the plot
-    def plot_MAXBAND(self, fig, intersection_names=None) -> plt.subplot:
-        newd = sorted(np.concatenate((self.d, self.d)))
-        newd_ = sorted(np.concatenate((self.d_, self.d_)))
-        max_nr_cycles = ceil(self.e_OB_b[-1, 0])
-        min_nr_cycles = floor(self.s_IB_b[-1, 1])
-        axx = fig.add_subplot(111)
-        axx.set_xlabel('Cycles')
+    def plot_MAXBAND(self, fig, intersection_names=None):
+        plot = MaxbandPlot(fig)
+        plot.update(self, intersection_names)
+        return plot.axx
+
+
+def interval_segments(intervals: np.ndarray, heights: np.ndarray, shifts: np.ndarray) -> np.ndarray:
+    """Horizontal segments (n * shifts, 2 points, x/y) of the [start, end] intervals per height, repeated for every
+    shift [cycles]"""
+    x = intervals[:, None, :] + shifts[None, :, None]  # signal, shift, start/end
+    y = np.broadcast_to(np.asarray(heights, dtype=float)[:, None, None], x.shape)
+    return np.stack([x, y], axis=-1).reshape(-1, 2, 2)
+
+
+class MaxbandPlot:
+    """The time-space diagram of a MAXBAND solution. Its artists are created once and updated in place by update(),
+    all red and left-turn intervals of a category are one LineCollection, so redrawing is cheap for long corridors."""
+
+    styles = {
+        'OB_band': dict(color='lightgreen'),
+        'IB_band': dict(color='darkgreen'),
+        'OB_red': dict(color='lightcoral', lw=1.3),
+        'IB_red': dict(color='darkred', lw=1.3, linestyle='dashed'),
+        'OB_left': dict(color='darkblue', lw=1.5),
+        'IB_left': dict(color='blue', lw=1.5, linestyle='dashed'),
+        'cycles': dict(color='black', lw=0.3)
+    }
+    labels = {'OB_band': 'Outbound band', 'IB_band': 'Inbound band', 'OB_red': 'Outbound red', 'IB_red': 'Inbound red',
+              'OB_left': 'Outbound left turn', 'IB_left': 'Inbound left turn'}
+
+    def __init__(self, fig):
+        from matplotlib.collections import LineCollection
+        self.axx = fig.add_subplot(111)
+        self.axx.set_xlabel('Cycles')
+        self.axx.set_title('Maxband_MILP LP2')
+        self.collections = dict()
+        for name, style in self.styles.items():
+            self.collections[name] = LineCollection([], **style)
+            self.axx.add_collection(self.collections[name])
+        self.collections['cycles'].set_transform(self.axx.get_xaxis_transform())  # x in cycles, y over the full axes
+
+    def update(self, PR: ProcessResults, intersection_names=None) -> None:
+        newd = np.repeat(PR.d, 2)
+        newd_ = np.repeat(PR.d_, 2)
+        max_nr_cycles = ceil(PR.e_OB_b[-1, 0])
+        collections = self.collections
+
+        collections['OB_band'].set_segments([np.column_stack([band.flatten() + s, newd])
+                                             for band in [PR.s_OB_b, PR.e_OB_b] for s in [0, 1]])
+        # flip because the inbound band is drawn in reverse
+        collections['IB_band'].set_segments([np.column_stack([np.flip(band, axis=1).flatten() + s, newd_])
+                                             for band in [PR.s_IB_b, PR.e_IB_b] for s in [3, 4, 5]])
+
+        outbound_shifts = -np.arange(-2, max_nr_cycles + 2)
+        inbound_shifts = np.arange(max_nr_cycles + 4)
+        collections['OB_red'].set_segments(interval_segments(PR.OB_red, PR.d, outbound_shifts))
+        collections['IB_red'].set_segments(interval_segments(PR.IB_red, PR.d_, inbound_shifts))
+        if PR.leftturnleadlag:
+            collections['OB_left'].set_segments(interval_segments(PR.OB_left, PR.d_, inbound_shifts))
+            collections['IB_left'].set_segments(interval_segments(PR.IB_left, PR.d, outbound_shifts))
+        else:
+            collections['OB_left'].set_segments([])
+            collections['IB_left'].set_segments([])
+        collections['cycles'].set_segments([[(i, 0), (i, 1)] for i in range(max_nr_cycles + 1)])
+
+        axx = self.axx
         axx.set_xlim(0, max_nr_cycles + 1)
         axx.set_xticks(np.arange(0, max_nr_cycles + 1, 1))
-        axx.plot(self.s_OB_b.flatten(), newd, color='lightgreen', label='Outbound band')
-        axx.plot(self.e_OB_b.flatten(), newd, color='lightgreen')
-        axx.plot(self.s_OB_b.flatten() + 1, newd, color='lightgreen')
-        axx.plot(self.e_OB_b.flatten() + 1, newd, color='lightgreen')
-        axx.plot(np.flip(self.s_IB_b, axis=1).flatten() + 3, newd_, color='darkgreen', label='Inbound band')
-        axx.plot(np.flip(self.e_IB_b, axis=1).flatten() + 3, newd_, color='darkgreen')  # flip because drawing in reverse
-        axx.plot(np.flip(self.s_IB_b, axis=1).flatten() + 4, newd_, color='darkgreen')
-        axx.plot(np.flip(self.e_IB_b, axis=1).flatten() + 4, newd_, color='darkgreen')
-        axx.plot(np.flip(self.s_IB_b, axis=1).flatten() + 5, newd_, color='darkgreen')
-        axx.plot(np.flip(self.e_IB_b, axis=1).flatten() + 5, newd_, color='darkgreen')
-        handles, labels = plt.gca().get_legend_handles_labels()
-        line1 = Line2D([0], [0], label='Outbound red', color='lightcoral')
-        line2 = Line2D([0], [0], ls='dashed', label='Inbound red', color='darkred')
-
-        # plot outbound red times
-        for j, dis in enumerate(self.d):
-            for s in range(-2, max_nr_cycles + 2):
-                axx.hlines(dis, self.OB_red[j, 0] - s, self.OB_red[j, 1] - s, color='lightcoral', lw=1.3)
-
-        # plot inbound red times
-        for k, dis_ in enumerate(self.d_):
-            for s in range(max_nr_cycles + 4):
-                axx.hlines(dis_, self.IB_red[k, 0] + s, self.IB_red[k, 1] + s, color='darkred', lw=1.3, linestyle='dashed')
-
-        if self.leftturnleadlag:
-            line3 = Line2D([0], [0], label='Outbound left turn', color='darkblue')
-            line4 = Line2D([0], [0], ls='dashed', label='Inbound left turn', color='blue')
-            handles.extend([line1, line2, line3, line4])
-            # plot outbound left turn times
-            for l, dis_ in enumerate(self.d_):
-                for s in range(max_nr_cycles + 4):
-                    axx.hlines(dis_, self.OB_left[l, 0] + s, self.OB_left[l, 1] + s, color='darkblue', lw=1.5)
-
-            # plot inbound left turn times
-            for m, dis in enumerate(self.d):
-                for s in range(-2, max_nr_cycles + 2):
-                    axx.hlines(dis, self.IB_left[m, 0] - s, self.IB_left[m, 1] - s, color='blue', lw=1.5, linestyle='dashed')
-
-        elif not self.leftturnleadlag:
-            handles.extend([line1, line2])
-        axx.legend(handles=handles)
-        axx.set_yticks(self.d)
+        heights = np.concatenate([PR.d, PR.d_])
+        margin = 0.05 * (heights.max() - heights.min())
+        axx.set_ylim(heights.min() - margin, heights.max() + margin)
+        axx.set_yticks(PR.d)
         if intersection_names is None:
-            axx.set_yticklabels([f'TLC_{i} - {dd} m' for i, dd in enumerate(self.d)])
+            axx.set_yticklabels([f'TLC_{i} - {dd} m' for i, dd in enumerate(PR.d)])
         elif intersection_names is not None:
-            axx.set_yticklabels([f'TLC_{intersection_names[i]} - {dd} m' for i, dd in enumerate(self.d)])
-        axx.set_title('Maxband_MILP LP2')
-        for i in range(max_nr_cycles + 1):
-            axx.axvline(i, color='black', lw=0.3)
+            axx.set_yticklabels([f'TLC_{intersection_names[i]} - {dd} m' for i, dd in enumerate(PR.d)])
 
-        return axx
+        from matplotlib.lines import Line2D
+        shown = ['OB_band', 'IB_band', 'OB_red', 'IB_red'] + (['OB_left', 'IB_left'] if PR.leftturnleadlag else [])
+        handles = [Line2D([0], [0], label=self.labels[name], color=self.styles[name]['color'],
+                          ls=self.styles[name].get('linestyle', 'solid')) for name in shown]
+        axx.legend(handles=handles)
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from Run_MAXBAND import constraint_flags, parse_inputs
+from Solver_Telemetry import proven_results
+
+# Only definite answers are cached, a run stopped on a time limit (0 or 2) might do better next time. CBC gives status
+# 1 for a run stopped on its time limit too, so a result in the telemetry must also prove the answer.
+cacheable_status = [1, -1, -2]
+
+
+def cacheable(status: int, telemetry: Optional[dict] = None) -> bool:
+    """Whether a solve result is definite, by its status and the result the solver reports in its telemetry"""
+    result = (telemetry or dict()).get('result')
+    return status in cacheable_status and (result is None or result in proven_results)
+
+
+def canonical_number(value) -> float:
+    """Normalizes a number so '0.50', '0.5' and 0.5000000000001 give the same key"""
+    return float(f'{float(value):.12g}')
+
+
+def canonical_key(input_dict: dict, namespace: str = '') -> str:
+    """Hash of the parsed numeric inputs and constraint flags, independent of how the numbers were written.
+    The namespace separates results that must not be shared, e.g. those of different solver backends."""
+    params = parse_inputs(input_dict)
+    canonical = {'namespace': namespace}
+    for key, value in params.items():
+        if key in constraint_flags:
+            canonical[key] = bool(value)
+        else:
+            canonical[key] = [canonical_number(v) for v in np.atleast_1d(value)]
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed cache of solve results, an in-memory LRU tier in front of an optional on-disk tier. The disk
+    tier keeps one JSON file per key and evicts the least recently used files when it grows beyond max_disk_bytes."""
+
+    def __init__(self, max_entries: int = 256, directory: Optional[str] = None, max_disk_bytes: int = 100_000_000):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.memory: OrderedDict = OrderedDict()  # key -> serialized result, so callers cannot modify cached results
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, input_dict: dict, namespace: str = '') -> str:
+        return canonical_key(input_dict, namespace)
+
+    def get(self, key: str) -> Optional[Tuple[dict, int]]:
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory.move_to_end(key)
+        elif self.directory is not None:
+            entry = self.read_disk(key)
+            if entry is not None:
+                self.store_memory(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        result = json.loads(entry)
+        return result['output_dict'], result['status']
+
+    def put(self, key: str, output_dict: dict, status: int, telemetry: Optional[dict] = None) -> None:
+        if not cacheable(status, telemetry):
+            return
+        entry = json.dumps({'output_dict': output_dict, 'status': status})
+        self.store_memory(key, entry)
+        if self.directory is not None:
+            self.write_disk(key, entry)
+
+    def store_memory(self, key: str, entry: str) -> None:
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    def read_disk(self, key: str) -> Optional[str]:
+        path = self.disk_path(key)
+        try:
+            with open(path) as f:
+                entry = f.read()
+            os.utime(path)  # mark as recently used for the eviction
+        except OSError:
+            return None
+        return entry
+
+    def write_disk(self, key: str, entry: str) -> None:
+        path = self.disk_path(key)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(entry)
+        os.replace(temp_path, path)  # atomic, other processes never read a half written file
+        self.evict_disk()
+
+    def evict_disk(self) -> None:
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.json'):
+                    os.remove(entry.path)
@@ -0,0 +1,272 @@
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Kinds of columns: a float per row (None is NaN), a bool, a string, a float array per row of varying length,
+# stored as the values of all rows plus the offsets of every row into them, or any other list per row (messages such
+# as telemetry.infeasible_inputs), stored as a JSON string per row
+column_kinds = ['float', 'bool', 'str', 'ragged', 'json']
+formats = ['npy', 'parquet']
+
+
+def flatten_record(record: dict, prefix: str = '') -> Dict[str, object]:
+    """Flattens a result record to columns, nested keys are joined with dots (outputs.OB_w, telemetry.phases.solve).
+    The inputs hold numbers as strings and are stored as numbers."""
+    columns = dict()
+    for key, value in record.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            columns.update(flatten_record(value, name + '.'))
+        elif name.startswith('inputs.') and isinstance(value, str):
+            columns[name] = float(value)
+        elif name.startswith('inputs.') and isinstance(value, list):
+            columns[name] = [float(v) for v in value]
+        else:
+            columns[name] = value
+    return columns
+
+
+def column_kind(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(value, str):
+        return 'str'
+    if isinstance(value, (list, tuple, np.ndarray)):
+        numeric = all(isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)) for v in value)
+        return 'ragged' if numeric else 'json'
+    return 'float'
+
+
+def column_array(values: list, kind: str) -> np.ndarray:
+    if kind == 'float':
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    if kind == 'bool':
+        return np.array([bool(value) for value in values], dtype=bool)
+    if kind == 'json':
+        return np.array(['' if value is None else json.dumps(np.asarray(value, dtype=object).tolist())
+                         for value in values], dtype=str)
+    return np.array(['' if value is None else value for value in values], dtype=str)
+
+
+def json_rows(strings) -> np.ndarray:
+    """The lists of a json column, an object array with None for rows without one"""
+    rows = np.empty(len(strings), dtype=object)
+    rows[:] = [json.loads(value) if value else None for value in strings]
+    return rows
+
+
+def ragged_arrays(values: list) -> tuple:
+    """Values and offsets of a ragged column, row i is values[offsets[i]:offsets[i + 1]], None an empty row"""
+    rows = [np.array([], dtype=float) if value is None else np.array(value, dtype=float) for value in values]
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(row) for row in rows])
+    return (np.concatenate(rows) if rows else np.array([], dtype=float)), offsets
+
+
+def missing_column(kind: str, rows: int):
+    """The column of a chunk without it"""
+    if kind == 'ragged':
+        return np.array([], dtype=float), np.zeros(rows + 1, dtype=np.int64)
+    if kind == 'json':
+        return json_rows([''] * rows)
+    return column_array([None] * rows, kind)
+
+
+class ResultStore:
+    """Columnar on-disk store of result records (inputs, outputs, status and telemetry of each run).
+
+    Records are buffered and written in chunks of chunk_size rows, so memory stays flat however many runs are
+    stored. With the npy format every chunk is a directory with one .npy file per column, read back memory-mapped;
+    with the parquet format (needs pyarrow) every chunk is a Parquet file. Any subset of the columns can be read
+    back without touching the others. Opening an existing store appends to it."""
+
+    def __init__(self, directory: str, chunk_size: int = 10000, fmt: str = 'npy'):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.schema_path = os.path.join(directory, 'schema.json')
+        self.buffer: List[Dict[str, object]] = []
+        os.makedirs(directory, exist_ok=True)
+        if os.path.isfile(self.schema_path):
+            with open(self.schema_path) as f:
+                schema = json.load(f)
+            self.format = schema['format']
+            self.kinds: Dict[str, str] = schema['columns']
+            self.chunks: List[dict] = schema['chunks']
+        else:
+            if fmt not in formats:
+                raise ValueError(f'Unknown store format {fmt}, choose one of {formats}')
+            self.format, self.kinds, self.chunks = fmt, dict(), []
+        if self.format == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError('The parquet store format requires pyarrow, install it with: pip install pyarrow')
+
+    def __len__(self) -> int:
+        return sum(chunk['rows'] for chunk in self.chunks) + len(self.buffer)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def append(self, record: dict) -> None:
+        self.buffer.append(flatten_record(record))
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def extend(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def close(self) -> None:
+        self.flush()
+
+    def chunk_kinds(self) -> Dict[str, str]:
+        """Kinds of the columns of the buffered rows, a column that only holds None in this chunk is left out"""
+        kinds = dict()
+        for row in self.buffer:
+            for name, value in row.items():
+                kind = column_kind(value)
+                if kind is None:
+                    continue
+                known = kinds.get(name, self.kinds.get(name))
+                if known == 'json' and kind == 'ragged':  # an empty list, or numbers, in a json column
+                    continue
+                if kind == 'json' and known == 'ragged' and name not in self.kinds:
+                    known = None  # the rows before in this chunk held empty lists or numbers
+                if known is not None and known != kind and {known, kind} != {'float', 'bool'}:
+                    raise ValueError(f'Column {name} holds {kind} values where earlier rows hold {known} values')
+                kinds[name] = 'float' if known == 'float' else kind  # bools in a float column are stored as 0 / 1
+        return kinds
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        kinds = self.chunk_kinds()
+        columns = {name: [row.get(name) for row in self.buffer] for name in kinds}
+        name = f'chunk_{len(self.chunks):05d}'
+        if self.format == 'npy':
+            self.write_npy(name, columns, kinds)
+        else:
+            self.write_parquet(name, columns, kinds)
+        self.chunks.append({'name': name, 'rows': len(self.buffer), 'columns': sorted(kinds)})
+        self.kinds.update(kinds)
+        self.buffer = []
+        schema = {'format': self.format, 'columns': self.kinds, 'chunks': self.chunks}
+        with open(self.schema_path + '.tmp', 'w') as f:
+            json.dump(schema, f, indent=1)
+        os.replace(self.schema_path + '.tmp', self.schema_path)  # a crash mid-write leaves the previous schema
+
+    def write_npy(self, name: str, columns: Dict[str, list], kinds: Dict[str, str]) -> None:
+        path = os.path.join(self.directory, name)
+        os.makedirs(path, exist_ok=True)
+        for column, values in columns.items():
+            if kinds[column] == 'ragged':
+                values, offsets = ragged_arrays(values)
+                np.save(os.path.join(path, column + '.offsets.npy'), offsets)
+                np.save(os.path.join(path, column + '.npy'), values)
+            else:
+                np.save(os.path.join(path, column + '.npy'), column_array(values, kinds[column]))
+
+    def write_parquet(self, name: str, columns: Dict[str, list], kinds: Dict[str, str]) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        arrays = dict()
+        for column, values in columns.items():
+            if kinds[column] == 'ragged':
+                arrays[column] = pa.array([None if value is None else [float(v) for v in value] for value in values],
+                                          type=pa.list_(pa.float64()))
+            else:
+                arrays[column] = pa.array(column_array(values, kinds[column]))
+        pq.write_table(pa.table(arrays), os.path.join(self.directory, name + '.parquet'))
+
+    def columns(self) -> Dict[str, str]:
+        """Column name -> kind of every column written so far"""
+        return dict(self.kinds)
+
+    def read_chunk(self, chunk: dict, columns: List[str]) -> Dict[str, object]:
+        """The columns of one chunk, a ragged column as (values, offsets)"""
+        present = [column for column in columns if column in chunk['columns']]
+        data = dict()
+        if self.format == 'npy':
+            path = os.path.join(self.directory, chunk['name'])
+            for column in present:
+                values = np.load(os.path.join(path, column + '.npy'), mmap_mode='r')
+                if self.kinds[column] == 'ragged':
+                    data[column] = values, np.load(os.path.join(path, column + '.offsets.npy'), mmap_mode='r')
+                elif self.kinds[column] == 'json':
+                    data[column] = json_rows(values)
+                else:
+                    data[column] = values
+        elif present:
+            import pyarrow.parquet as pq
+            table = pq.read_table(os.path.join(self.directory, chunk['name'] + '.parquet'), columns=present)
+            for column in present:
+                if self.kinds[column] == 'ragged':
+                    data[column] = ragged_arrays(table.column(column).to_pylist())
+                elif self.kinds[column] == 'json':
+                    data[column] = json_rows(table.column(column).to_pylist())
+                else:
+                    data[column] = table.column(column).to_numpy()
+        for column in columns:
+            if column not in data:
+                data[column] = missing_column(self.kinds[column], chunk['rows'])
+        return data
+
+    def iter_chunks(self, columns: Optional[List[str]] = None) -> Iterator[Dict[str, object]]:
+        """Yields the columns chunk by chunk, to analyse stores larger than memory"""
+        columns = self.check_columns(columns)
+        for chunk in self.chunks:
+            yield self.read_chunk(chunk, columns)
+
+    def check_columns(self, columns: Optional[List[str]]) -> List[str]:
+        if columns is None:
+            return list(self.kinds)
+        unknown = [column for column in columns if column not in self.kinds]
+        if unknown:
+            raise KeyError(f'Unknown columns {unknown}, the store has {sorted(self.kinds)}')
+        return list(columns)
+
+    def read(self, columns: Optional[List[str]] = None, flat: bool = False) -> Dict[str, object]:
+        """The written rows of the given columns (all by default) as arrays. A ragged column is an object array with
+        an array per row, or with flat its (values, offsets) pair, which is cheaper for vectorized analysis."""
+        columns = self.check_columns(columns)
+        chunks = list(self.iter_chunks(columns))
+        data = dict()
+        for column in columns:
+            if self.kinds[column] != 'ragged':
+                parts = [chunk[column] for chunk in chunks]
+                data[column] = np.concatenate(parts) if parts else column_array([], self.kinds[column])
+                continue
+            values, offsets, shift = [], [np.zeros(1, dtype=np.int64)], 0
+            for chunk in chunks:
+                chunk_values, chunk_offsets = chunk[column]
+                values.append(np.asarray(chunk_values))
+                offsets.append(np.asarray(chunk_offsets[1:]) + shift)
+                shift += len(chunk_values)
+            values = np.concatenate(values) if values else np.array([], dtype=float)
+            offsets = np.concatenate(offsets)
+            if flat:
+                data[column] = values, offsets
+            else:
+                rows = np.empty(len(offsets) - 1, dtype=object)
+                rows[:] = [values[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+                data[column] = rows
+        return data
+
+
+def store_results(records: Iterable[dict], store: ResultStore) -> Iterator[dict]:
+    """Passes the records on, appending each to the store on the way. The store is flushed when the records run
+    out."""
+    try:
+        for record in records:
+            store.append(record)
+            yield record
+    finally:
+        store.flush()
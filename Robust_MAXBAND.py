@@ -0,0 +1,205 @@
+import argparse
+import json
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from config import Config
+from Maxband_Matrix import MaxbandMatrix, solve_milp
+from Run_MAXBAND import constraint_flags, parse_inputs
+
+# The columns of the timing plan, one set shared by all scenarios: cycle time, travel times, loop integers and
+# left-turn patterns. The bands and their positions in the green (b, b_, w, w_) are per scenario.
+shared_columns = ['z', 't', 't_', 'm', 'delta', 'delta_']
+# The inputs the scenarios must have in common, they only differ in the signal timings (r, l, tau)
+corridor_inputs = ['nSignals', 'c_min', 'c_max', 'v_min', 'v_max', 'inv_dv_min', 'inv_dv_max', 'k', 'd', 'd_']
+objectives = ['expected', 'worst']
+
+
+def demand_scenarios(params: dict, count: int, spread: float = 0.15, seed: int = 0) -> List[dict]:
+    """Variations of the signal timings of a corridor, as from day-to-day demand: every red and queue clearance time
+    is scaled by a factor drawn uniformly from 1 -/+ spread, the first scenario is the corridor itself"""
+    rng = np.random.default_rng(seed)
+    scenarios = [params]
+    for _ in range(count - 1):
+        scenario = dict(params)
+        for key in ['r', 'r_', 'tau', 'tau_']:
+            values = np.asarray(params[key], dtype=float) * rng.uniform(1 - spread, 1 + spread, params['nSignals'])
+            scenario[key] = np.clip(values, 0.0, 0.9).tolist()
+        for left, red in [('l', 'r_'), ('l_', 'r')]:  # a left turn stays within the red of the opposite direction
+            scenario[left] = np.minimum(params[left], scenario[red]).tolist()
+        scenarios.append(scenario)
+    return scenarios
+
+
+class RobustMaxband:
+    """One timing plan for several demand scenarios of the same corridor, as one block-structured MILP.
+
+    The plan, the cycle time, travel times, left-turn patterns and the offsets between the signals, is shared. Every
+    scenario has its own MaxbandMatrix block with its own bands, which must fit the red and queue clearance times of
+    that scenario. The offset of signal j to signal i is the time from the end of the outbound red of i to the one of
+    j, w_i + t_i - w_j - tau_j as in Network_MAXBAND, the same in every scenario: one shared column per segment tied
+    to every block by an equality row. Rows that only hold shared columns (cycle time, speeds, left-turn patterns)
+    are the same for all scenarios and are kept once.
+
+    The objective is the expected bandwidth b + k * b_ over the scenarios (weights, equal by default) or, with
+    objective='worst', the bandwidth of the worst scenario. The constraint flags hold in every scenario, w_mono_flag
+    easily makes the shared plan infeasible when the queue clearance times vary."""
+
+    def __init__(self, scenarios: Sequence[dict], weights: Optional[Sequence[float]] = None,
+                 objective: str = 'expected'):
+        if objective not in objectives:
+            raise ValueError(f'Unknown objective {objective}, choose one of {objectives}')
+        if not scenarios:
+            raise ValueError('At least one scenario is needed')
+        for index, params in enumerate(scenarios[1:], 1):
+            for key in corridor_inputs + constraint_flags:
+                if not np.array_equal(params[key], scenarios[0][key]):
+                    raise ValueError(f'Scenario {index} differs from scenario 0 in {key}, the scenarios can only '
+                                     f'differ in the signal timings')
+        self.scenarios = list(scenarios)
+        self.objective = objective
+        weights = np.ones(len(scenarios)) if weights is None else np.asarray(weights, dtype=float)
+        self.weights = weights / weights.sum()
+        self.blocks = [MaxbandMatrix(params) for params in self.scenarios]
+        first = self.blocks[0]
+        self.nSegments = first.nSegments
+
+        # Global columns: the shared plan columns, the offsets, the worst-case bandwidth and then every block's own
+        shared = [name for name in shared_columns if name in first.columns]
+        self.shared_local = np.zeros(first.n_columns, dtype=bool)
+        for name in shared:
+            self.shared_local[first.columns[name]] = True
+        n_shared = int(self.shared_local.sum())
+        self.offset_columns = np.arange(n_shared, n_shared + self.nSegments)
+        self.worst_column = n_shared + self.nSegments
+        n_columns = self.worst_column + 1
+        self.column_maps = []
+        own = np.cumsum(~self.shared_local) - 1  # index of each own column among the block's own columns
+        shared_index = np.cumsum(self.shared_local) - 1
+        for block in self.blocks:
+            self.column_maps.append(np.where(self.shared_local, shared_index, n_columns + own))
+            n_columns += int((~self.shared_local).sum())
+        self.n_columns = n_columns
+        self.z_column = self.column_maps[0][first.columns['z'][0]]
+        self.build()
+
+    def build(self) -> None:
+        rows, cols, vals, rhs, senses = [], [], [], [], []
+        n_rows = 0
+        self.c = np.zeros(self.n_columns)
+        self.lower = np.zeros(self.n_columns)
+        self.upper = np.full(self.n_columns, np.inf)
+        self.integrality = np.zeros(self.n_columns)
+        shared = self.column_maps[0][self.shared_local]
+        self.lower[shared] = -np.inf
+        for index, (block, columns) in enumerate(zip(self.blocks, self.column_maps)):
+            A = block.A.tocoo()
+            keep = np.ones(block.n_rows, dtype=bool)
+            if index > 0:  # rows of shared columns only are kept from the first block
+                keep = abs(block.A) @ (~self.shared_local).astype(float) > 0
+            new_rows = np.cumsum(keep) - 1
+            entries = keep[A.row]
+            rows.append(new_rows[A.row[entries]] + n_rows)
+            cols.append(columns[A.col[entries]])
+            vals.append(A.data[entries])
+            rhs.append(block.rhs[keep])
+            senses.append(block.senses[keep])
+            n_rows += int(keep.sum())
+            # The presolve bounds on the shared offsets differ per scenario, the plan has to meet all of them
+            self.lower[columns] = np.where(self.shared_local, np.maximum(self.lower[columns], block.lower),
+                                           block.lower)
+            self.upper[columns] = np.where(self.shared_local, np.minimum(self.upper[columns], block.upper),
+                                           block.upper)
+            self.integrality[columns] = block.integrality
+            if self.objective == 'expected':
+                np.add.at(self.c, columns, self.weights[index] * block.c)
+
+            # Shared offsets: w_i + t_i - w_j - offset_i == tau_j for every segment
+            i, j = np.arange(self.nSegments), np.arange(1, block.nSignals)
+            for terms in [(block.col('w', i), 1.0), (block.col('t'), 1.0), (block.col('w', j), -1.0)]:
+                rows.append(np.arange(n_rows, n_rows + self.nSegments))
+                cols.append(columns[terms[0]])
+                vals.append(np.full(self.nSegments, terms[1]))
+            rows.append(np.arange(n_rows, n_rows + self.nSegments))
+            cols.append(self.offset_columns)
+            vals.append(np.full(self.nSegments, -1.0))
+            rhs.append(np.asarray(block.params['tau'], dtype=float)[j])
+            senses.append(np.full(self.nSegments, 'E'))
+            n_rows += self.nSegments
+
+            if self.objective == 'worst':  # worst <= b + k * b_ of this scenario
+                block_columns = np.flatnonzero(block.c)
+                rows.append(np.full(len(block_columns) + 1, n_rows))
+                cols.append(np.concatenate(([self.worst_column], columns[block_columns])))
+                vals.append(np.concatenate(([1.0], -block.c[block_columns])))
+                rhs.append(np.zeros(1))
+                senses.append(np.array(['L']))
+                n_rows += 1
+        self.lower[self.offset_columns] = -np.inf
+        if self.objective == 'worst':
+            self.c[self.worst_column] = 1
+        else:
+            self.upper[self.worst_column] = 0  # not used
+
+        self.n_rows = n_rows
+        self.A = sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                                   shape=(self.n_rows, self.n_columns))
+        self.rhs = np.concatenate(rhs)
+        self.senses = np.concatenate(senses)
+
+    def solve(self, time_limit: Optional[float] = None, info: Optional[dict] = None) -> Tuple[dict, int]:
+        """Returns {'scenarios': [output_dict per scenario], 'offsets': [...], 'inv_CT': z, 'expected_band': ...,
+        'worst_band': ...} and the status"""
+        x, status = solve_milp(self.c, self.A, self.senses, self.rhs, self.lower, self.upper, self.integrality,
+                               time_limit, info)
+        return self.get_results(x), status
+
+    def get_results(self, x: Optional[np.ndarray]) -> dict:
+        if x is None:
+            x = np.full(self.n_columns, np.nan)
+        outputs = [block.get_results(x[columns]) for block, columns in zip(self.blocks, self.column_maps)]
+        bands = np.array([block.c @ x[columns] for block, columns in zip(self.blocks, self.column_maps)])
+        return {'scenarios': outputs,
+                'offsets': [None if np.isnan(v) else float(v % 1) for v in x[self.offset_columns]],
+                'inv_CT': None if np.isnan(x[self.z_column]) else float(x[self.z_column]),
+                'scenario_bands': [None if np.isnan(v) else float(v) for v in bands],
+                'expected_band': None if np.isnan(bands).any() else float(self.weights @ bands),
+                'worst_band': None if np.isnan(bands).any() else float(bands.min())}
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Find one timing plan for several demand scenarios of a corridor.')
+    parser.add_argument('scenarios', nargs='+', help='Scenario .ini files of the same corridor, differing only in the '
+                                                     'red, left-turn and queue clearance fractions')
+    parser.add_argument('--objective', choices=objectives, default='expected',
+                        help='Maximize the expected bandwidth or the bandwidth of the worst scenario')
+    parser.add_argument('--weights', type=float, nargs='+', default=None, help='Probability of every scenario')
+    parser.add_argument('--time-limit', type=float, default=None, help='Solver time limit [s]')
+    parser.add_argument('-o', '--output', default='robust_results.json')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    scenarios = []
+    for path in args.scenarios:
+        inputs = Config(path).get_run_inputs()
+        if inputs is None:
+            return 1
+        scenarios.append(parse_inputs(inputs))
+    model = RobustMaxband(scenarios, args.weights, args.objective)
+    results, status = model.solve(args.time_limit)
+    with open(args.output, 'w') as f:
+        json.dump({'status': status, **results}, f, indent=2)
+    if results['inv_CT'] is not None:
+        print(f"{len(scenarios)} scenarios, cycle time {1 / results['inv_CT']:.1f} s, expected bandwidth "
+              f"{results['expected_band']:.4f}, worst {results['worst_band']:.4f} [cycles]")
+    print(f'Status {status}, results written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,201 +1,502 @@
 import pulp as lp
 import numpy as np
-from typing import Tuple
+from typing import Iterator, List, Optional, Tuple, Union
+from Presolve_MAXBAND import check_inputs, offset_bounds
+from Solver_Backends import CbcBackend, SolverBackend, get_backend
+from Solver_Telemetry import PhaseTimer, write_telemetry
 
-class RunMaxband():
+status_dict = {
+    2: 'Solution Found',  # Indicating that the problem is solvable, but potentially a local optimum
+    1: 'Optimal Solution Found',  # Global optimum, problem solved
+    0: 'No Solution Found',  # Still working on the problem
+    -1: 'No Solution Exists',  # The problem is infeasible
+    -2: 'Solution is Unbounded'  # The problem is unbounded
+}
 
-    def __init__(self, inputs):
-        self.input_dict = inputs
-        self.output_dict = {}
+constraint_flags = ['leftturnleadlag', 'lt_leadlag_flag', 'lt_leadlead_flag', 'lt_laglag_flag', 'mi_mj_max_1_flag',
+                    'm_max_1_flag', 'tau_cstr_flag', 'tau_sum_flag', 'w_0_flag', 'w_mono_flag']
 
-    def run_maxband(self) -> Tuple[dict, str]:
+# The constraint groups that depend on each numeric input, only these are rewritten when that input changes
+group_dependencies = {
+    'k': ['favored'],
+    'c_min': ['cycle'],
+    'c_max': ['cycle'],
+    'v_min': ['speed'],
+    'v_max': ['speed'],
+    'inv_dv_min': ['speed_diff'],
+    'inv_dv_max': ['speed_diff'],
+    'd': ['speed', 'speed_diff'],
+    'd_': ['speed', 'speed_diff'],
+    'r': ['bandwidth', 'offset'],
+    'r_': ['bandwidth', 'offset', 'start_band', 'start_offset'],
+    'l': ['offset'],
+    'l_': ['offset'],
+    'tau': ['bandwidth', 'offset', 'start_band'],
+    'tau_': ['bandwidth', 'offset'],
+}
+
+
+# The numeric inputs by kind, the signal timings are fractions of the cycle
+scalar_inputs = ['c_min', 'c_max', 'v_min', 'v_max', 'inv_dv_min', 'inv_dv_max', 'k']
+signal_timing_inputs = ['r', 'r_', 'l', 'l_', 'tau', 'tau_']
+
+
+def parse_inputs(input_dict: Union[dict, 'Corridor']) -> dict:
+    """Converts the (string) inputs of the GUI or a config file into the numbers the model is built from, a Corridor
+    is parsed already"""
+    if isinstance(input_dict, Corridor):
+        return input_dict.params()
+    params = dict()
+
+    # Single inputs
+    params['nSignals'] = int(input_dict['SingleInputs']['nsignals'])
+    params['c_min'] = float(input_dict['SingleInputs']['c_min'])
+    params['c_max'] = float(input_dict['SingleInputs']['c_max'])
+    params['v_min'] = float(input_dict['SingleInputs']['v_min'])/3.6  # convert km/h to m/s
+    params['v_max'] = float(input_dict['SingleInputs']['v_max'])/3.6  # convert km/h to m/s
+    params['inv_dv_min'] = float(input_dict['SingleInputs']['inv_dv_min'])
+    params['inv_dv_max'] = float(input_dict['SingleInputs']['inv_dv_max'])
+    params['k'] = float(input_dict['SingleInputs']['k'])
+
+    # Segment inputs
+    params['d'] = np.array(np.cumsum([0.0]+[float(d) for d in input_dict['SegmentInputs']['outbound_d']]))
+    params['d_'] = np.array(np.cumsum([0.0]+[float(d_) for d_ in input_dict['SegmentInputs']['inbound_d']]))
+    # Optional link volumes [veh/h], they weigh the link bands of the multiband model (Maxband_Matrix)
+    for key, name in [('outbound_volume', 'V'), ('inbound_volume', 'V_')]:
+        if key in input_dict['SegmentInputs']:
+            params[name] = np.array([float(v) for v in input_dict['SegmentInputs'][key]])
+
+    # Signal inputs
+    params['r'] = [float(r) for r in input_dict['SignalInputs']['outbound_r']]
+    params['r_'] = [float(r_) for r_ in input_dict['SignalInputs']['inbound_r']]
+    params['l'] = [float(l) for l in input_dict['SignalInputs']['outbound_l']]
+    params['l_'] = [float(l_) for l_ in input_dict['SignalInputs']['inbound_l']]
+    params['tau'] = [float(tau) for tau in input_dict['SignalInputs']['outbound_tau']]
+    params['tau_'] = [float(tau_) for tau_ in input_dict['SignalInputs']['inbound_tau']]
+
+    # cstr_flags
+    for flag in constraint_flags:
+        params[flag] = input_dict['Selections'][flag]
+    return params
+
+
+class Corridor:
+    """The parsed inputs of one arterial: the numbers as floats, the distances and signal timings as float arrays
+    and the constraint flags as bools. Parse the inputs once with from_inputs and pass the corridor wherever inputs
+    are taken (RunMaxband, parse_inputs, the result cache), nothing is parsed again."""
+    __slots__ = ['nSignals'] + scalar_inputs + ['d', 'd_'] + signal_timing_inputs + ['V', 'V_'] + constraint_flags
+
+    @classmethod
+    def from_inputs(cls, input_dict: dict) -> 'Corridor':
+        return cls.from_params(parse_inputs(input_dict))
+
+    @classmethod
+    def from_params(cls, params: dict) -> 'Corridor':
+        corridor = cls()
+        corridor.nSignals = int(params['nSignals'])
+        for key in scalar_inputs:
+            setattr(corridor, key, float(params[key]))
+        for key in ['d', 'd_'] + signal_timing_inputs:
+            setattr(corridor, key, np.array(params[key], dtype=float))
+        for key in ['V', 'V_']:
+            setattr(corridor, key, None if params.get(key) is None else np.array(params[key], dtype=float))
+        for key in constraint_flags:
+            setattr(corridor, key, bool(params[key]))
+        corridor.check_lengths()
+        return corridor
+
+    def check_lengths(self) -> None:
+        """Raises a ValueError if the distances, signal timings or volumes do not match the number of signals"""
+        if self.nSignals < 2:
+            raise ValueError(f'A corridor has at least 2 signals, not {self.nSignals}')
+        counts = {key: getattr(self, key).size - 1 for key in ['d', 'd_']}  # d holds 0 and the distances
+        counts.update({key: getattr(self, key).size for key in ['V', 'V_'] if getattr(self, key) is not None})
+        wrong = [f'{key} has {count} values for {self.nSignals - 1} segments' for key, count in counts.items()
+                 if count != self.nSignals - 1]
+        wrong += [f'{key} has {getattr(self, key).size} values for {self.nSignals} signals'
+                  for key in signal_timing_inputs if getattr(self, key).size != self.nSignals]
+        if wrong:
+            raise ValueError(f'The inputs do not fit the number of signals: {", ".join(wrong)}')
+
+    def params(self) -> dict:
+        """The inputs in the layout of parse_inputs"""
+        params = {'nSignals': self.nSignals}
+        params.update({key: getattr(self, key) for key in scalar_inputs})
+        params.update(d=self.d.copy(), d_=self.d_.copy())
+        params.update({key: getattr(self, key).tolist() for key in signal_timing_inputs})
+        params.update({key: getattr(self, key).copy() for key in ['V', 'V_'] if getattr(self, key) is not None})
+        params.update({key: getattr(self, key) for key in constraint_flags})
+        return params
+
+
+def set_constraint(constraint: lp.LpConstraint, coefficients: dict, sense: int, rhs: float) -> None:
+    """Overwrites the coefficients, sense and right-hand side of an existing constraint in place"""
+    expression = getattr(constraint, 'expr', constraint)  # PuLP >= 3 keeps the expression apart from the constraint
+    for variable, coefficient in coefficients.items():
+        expression[variable] = coefficient
+    constraint.sense = sense
+    constraint.constant = -rhs
+
+
+class MaxbandModel:
+    """The MAXBAND MILP of one arterial. It is built once, after which update() only rewrites the constraints that
+    depend on the changed inputs, so the same model can be re-solved for many parameter values."""
+
+    groups = ['favored', 'cycle', 'bandwidth', 'speed', 'speed_diff', 'offset', 'start_band', 'start_offset',
+              'left_turn', 'offset_limit']
+
+    def __init__(self, params: Union[dict, Corridor], presolve: bool = True):
+        if isinstance(params, Corridor):
+            params = params.params()
+        self.params = params
+        self.presolve = presolve  # bound the offsets, see Presolve_MAXBAND.offset_bounds
+        self.solver = None  # the solver resolve() keeps between solves
+        self.nSignals = params['nSignals']
+        self.nSegments = self.nSignals - 1
         # TODO: Create an input for the Deltas, for now they are all set to 0
-        Deltas = [0, 0, 0, 0, 0, 0, 0]
-
-        # Single inputs
-        nSignals = int(self.input_dict['SingleInputs']['nsignals'])
-        print(nSignals)
-        nSegments = nSignals - 1
-        c_min = float(self.input_dict['SingleInputs']['c_min'])
-        c_max = float(self.input_dict['SingleInputs']['c_max'])
-        v_min = float(self.input_dict['SingleInputs']['v_min'])/3.6  # convert km/h to m/s
-        v_max = float(self.input_dict['SingleInputs']['v_max'])/3.6  # convert km/h to m/s
-        inv_dv_min = float(self.input_dict['SingleInputs']['inv_dv_min'])
-        inv_dv_max = float(self.input_dict['SingleInputs']['inv_dv_max'])
-        k = float(self.input_dict['SingleInputs']['k'])
-
-        # Segment inputs
-        d = np.array(np.cumsum([0.0]+[float(d) for d in self.input_dict['SegmentInputs']['outbound_d']]))
-        d_ = np.array(np.cumsum([0.0]+[float(d_) for d_ in self.input_dict['SegmentInputs']['inbound_d']]))
-
-        # Signal inputs
-        r = [float(r) for r in self.input_dict['SignalInputs']['outbound_r']]
-        r_ = [float(r_) for r_ in self.input_dict['SignalInputs']['inbound_r']]
-        l = [float(l) for l in self.input_dict['SignalInputs']['outbound_l']]
-        l_ = [float(l_) for l_ in self.input_dict['SignalInputs']['inbound_l']]
-        tau = [float(tau) for tau in self.input_dict['SignalInputs']['outbound_tau']]
-        tau_ = [float(tau_) for tau_ in self.input_dict['SignalInputs']['inbound_tau']]
-
-        # cstr_flags
-        leftturnleadlag = self.input_dict['Selections']['leftturnleadlag']
-        lt_leadlag_flag = self.input_dict['Selections']['lt_leadlag_flag']
-        lt_leadlead_flag = self.input_dict['Selections']['lt_leadlead_flag']
-        lt_laglag_flag = self.input_dict['Selections']['lt_laglag_flag']
-        mi_mj_max_1_flag = self.input_dict['Selections']['mi_mj_max_1_flag']
-        m_max_1_flag = self.input_dict['Selections']['m_max_1_flag']
-        tau_cstr_flag = self.input_dict['Selections']['tau_cstr_flag']
-        tau_sum_flag = self.input_dict['Selections']['tau_sum_flag']
-        w_0_flag = self.input_dict['Selections']['w_0_flag']
-        w_mono_flag = self.input_dict['Selections']['w_mono_flag']
+        self.Deltas = [0] * self.nSignals
 
         # set up the coordination problem, either maximize +b or minimize -b
-        # set up the coordination problem, either maximize +b or minimize -b
-        coor = lp.LpProblem('Maxband', lp.LpMaximize)
+        self.coor = lp.LpProblem('Maxband', lp.LpMaximize)
 
         # Declare the variables, _is used for inbound direction
-        b = lp.LpVariable('b', lowBound=0, upBound=None, cat=lp.LpContinuous)  # Outbound bandwidth variable [cycles]
-        b_ = lp.LpVariable('b_', lowBound=0, upBound=None, cat=lp.LpContinuous)  # Inbound bandwidth variable [cycles]
-        z = lp.LpVariable('z', lowBound=0, upBound=None,
-                          cat=lp.LpContinuous)  # Cycle time inverse [1/s], inverse to keep constraints linear
-        t = lp.LpVariable.dicts('t', range(nSegments), lowBound=0, upBound=None,
-                                cat=lp.LpContinuous)  # Outbound time [cycles] between successive intersections
-        t_ = lp.LpVariable.dicts('t_', range(nSegments), lowBound=0, upBound=None,
-                                 cat=lp.LpContinuous)  # Inbound time [cycles] between successive intersections
-        w = lp.LpVariable.dicts('w', range(nSignals), lowBound=0, upBound=None,
-                                cat=lp.LpContinuous)  # Outbound time [cycles] from red to band
-        w_ = lp.LpVariable.dicts('w_', range(nSignals), lowBound=0, upBound=None,
-                                 cat=lp.LpContinuous)  # Inbound time [cycles] from red to band
-        m = lp.LpVariable.dicts('m', range(nSignals), lowBound=None, upBound=None,
-                                cat=lp.LpInteger)  # Offset [cycles] between intersections
-
-        if leftturnleadlag:
-            delta = lp.LpVariable.dicts('delta', range(nSignals), cat=lp.LpBinary)  # Outbound left-turn order
-            delta_ = lp.LpVariable.dicts('delta_', range(nSignals), cat=lp.LpBinary)  # inbound left-turn order
-
-        # Basic Problem contraints
+        self.b = lp.LpVariable('b', lowBound=0, upBound=None, cat=lp.LpContinuous)  # Outbound bandwidth variable [cycles]
+        self.b_ = lp.LpVariable('b_', lowBound=0, upBound=None, cat=lp.LpContinuous)  # Inbound bandwidth variable [cycles]
+        self.z = lp.LpVariable('z', lowBound=0, upBound=None,
+                               cat=lp.LpContinuous)  # Cycle time inverse [1/s], inverse to keep constraints linear
+        self.t = lp.LpVariable.dicts('t', range(self.nSegments), lowBound=0, upBound=None,
+                                     cat=lp.LpContinuous)  # Outbound time [cycles] between successive intersections
+        self.t_ = lp.LpVariable.dicts('t_', range(self.nSegments), lowBound=0, upBound=None,
+                                      cat=lp.LpContinuous)  # Inbound time [cycles] between successive intersections
+        self.w = lp.LpVariable.dicts('w', range(self.nSignals), lowBound=0, upBound=None,
+                                     cat=lp.LpContinuous)  # Outbound time [cycles] from red to band
+        self.w_ = lp.LpVariable.dicts('w_', range(self.nSignals), lowBound=0, upBound=None,
+                                      cat=lp.LpContinuous)  # Inbound time [cycles] from red to band
+        self.m = lp.LpVariable.dicts('m', range(self.nSignals), lowBound=None, upBound=None,
+                                     cat=lp.LpInteger)  # Offset [cycles] between intersections
+        if presolve:
+            self.set_offset_bounds()
+
+        if params['leftturnleadlag']:
+            self.delta = lp.LpVariable.dicts('delta', range(self.nSignals), cat=lp.LpBinary)  # Outbound left-turn order
+            self.delta_ = lp.LpVariable.dicts('delta_', range(self.nSignals), cat=lp.LpBinary)  # inbound left-turn order
+
         # Objective function
-        coor += b + k * b_, 'Maximize bandwidth'
+        self.coor += self.objective(), 'Maximize bandwidth'
+
+        self.constraints = dict()
+        self.group_constraints = dict()  # constraints per group, in the order their rows are generated
+        for group in self.groups:
+            self.group_constraints[group] = []
+            for name, coefficients, sense, rhs in getattr(self, group + '_rows')():
+                constraint = lp.LpConstraint(lp.LpAffineExpression(coefficients), sense=sense, name=name, rhs=rhs)
+                self.coor += constraint
+                self.constraints[name] = constraint
+                self.group_constraints[group].append(constraint)
+
+    def objective(self) -> lp.LpAffineExpression:
+        return self.b + self.params['k'] * self.b_
 
+    # Basic Problem contraints
+    def favored_rows(self) -> Iterator[tuple]:
         # Favored direction constraint
+        b, b_, k = self.b, self.b_, self.params['k']
         if k != 1:
-            coor += (1 - k) * b_ - (1 - k) * k * b >= 0, 'Favor bandwidth direction'
+            yield 'Favor bandwidth direction', {b_: 1 - k, b: -(1 - k) * k}, lp.LpConstraintGE, 0
         elif k == 1:
-            coor += b - b_ == 0, 'Equal bandwidths'
+            yield 'Equal bandwidths', {b: 1, b_: -1}, lp.LpConstraintEQ, 0
 
+    def cycle_rows(self) -> Iterator[tuple]:
         # Max. and Min. cycle time constraints, 'reversed logic' since z is the inverse of C (cycle time)
-        coor += c_max * z >= 1, 'Maximum cycle time'
-        coor += c_min * z <= 1, 'Minimum cycle time'
+        yield 'Maximum cycle time', {self.z: self.params['c_max']}, lp.LpConstraintGE, 1
+        yield 'Minimum cycle time', {self.z: self.params['c_min']}, lp.LpConstraintLE, 1
+
+    def bandwidth_rows(self) -> Iterator[tuple]:
+        p, b, b_, w, w_ = self.params, self.b, self.b_, self.w, self.w_
+        r, r_, tau, tau_ = p['r'], p['r_'], p['tau'], p['tau_']
 
         # Bandwidth constraints without requiring enough time for tau, tail of band could hit red
-        if not tau_cstr_flag and not tau_sum_flag:
-            for i in range(nSignals):
-                coor += w[i] + b <= 1 - r[i], 'Outbound Bandwidth constraint S' + str(i)
-                coor += w_[i] + b_ <= 1 - r_[i], 'Inbound Bandwidth constraint S' + str(i)
+        if not p['tau_cstr_flag'] and not p['tau_sum_flag']:
+            for i in range(self.nSignals):
+                yield 'Outbound Bandwidth constraint S' + str(i), {w[i]: 1, b: 1}, lp.LpConstraintLE, 1 - r[i]
+                yield 'Inbound Bandwidth constraint S' + str(i), {w_[i]: 1, b_: 1}, lp.LpConstraintLE, 1 - r_[i]
+
+        # Bandwidth constraints that require enough time for BOTH the band and queue clearance
+        if p['tau_cstr_flag']:
+            for i in range(self.nSignals):
+                yield 'Outbound Bandwidth queue clearance constraint S' + str(i), {w[i]: 1, b: 1}, \
+                    lp.LpConstraintLE, 1 - r[i] - tau[i]
+                yield 'Inbound Bandwidth constraint S' + str(i), {w_[i]: 1, b_: 1}, lp.LpConstraintLE, 1 - r_[i]
+                yield 'Inbound Bandwidth queue clearance constraint S' + str(i), {w_[i]: 1}, lp.LpConstraintGE, tau_[i]
 
+        # Bandwidth constraints that require enough time for BOTH the band and all previous queue clearances
+        if p['tau_sum_flag']:
+            tau_sum = np.cumsum(tau)  # tau_sum[i] = sum(tau[:i + 1])
+            tau_sum_ = np.concatenate(([0.0], np.cumsum(tau_)))  # tau_sum_[i] = sum(tau_[:i])
+            for i in range(self.nSignals):
+                yield 'Outbound Bandwidth sum tau constraint S' + str(i), {w[i]: 1, b: 1}, \
+                    lp.LpConstraintLE, 1 - r[i] - tau_sum[i]
+                if not p['tau_cstr_flag']:  # otherwise already added with the queue clearance constraints
+                    yield 'Inbound Bandwidth constraint S' + str(i), {w_[i]: 1, b_: 1}, lp.LpConstraintLE, 1 - r_[i]
+                yield 'Inbound Bandwidth sum tau constraint S' + str(i), {w_[i]: 1}, \
+                    lp.LpConstraintGE, tau_sum_[self.nSignals - 1 - i]
+
+    def speed_rows(self) -> Iterator[tuple]:
         # Min. and Max. speed constraints
-        for i in range(nSegments):
+        p, z, t, t_ = self.params, self.z, self.t, self.t_
+        d, d_, v_min, v_max = p['d'], p['d_'], p['v_min'], p['v_max']
+        for i in range(self.nSegments):
             dist = d[i + 1] - d[i]
             dist_ = d_[i + 1] - d_[i]
-            coor += dist * z - v_max * t[i] <= 0, 'Outbound Maximum speed A' + str(i)
-            coor += -dist * z + v_min * t[i] <= 0, 'Outbound Minimum speed A' + str(i)
-            coor += dist_ * z - v_max * t_[i] <= 0, 'Inbound Maximum speed A' + str(i)
-            coor += -dist_ * z + v_min * t_[i] <= 0, 'Inbound Minimum speed A' + str(i)
+            yield 'Outbound Maximum speed A' + str(i), {z: dist, t[i]: -v_max}, lp.LpConstraintLE, 0
+            yield 'Outbound Minimum speed A' + str(i), {z: -dist, t[i]: v_min}, lp.LpConstraintLE, 0
+            yield 'Inbound Maximum speed A' + str(i), {z: dist_, t_[i]: -v_max}, lp.LpConstraintLE, 0
+            yield 'Inbound Minimum speed A' + str(i), {z: -dist_, t_[i]: v_min}, lp.LpConstraintLE, 0
 
+    def speed_diff_rows(self) -> Iterator[tuple]:
         # Min. and Max. speed difference constraints
-        for i in range(nSegments - 1):
+        p, z, t, t_ = self.params, self.z, self.t, self.t_
+        d, d_, inv_dv_min, inv_dv_max = p['d'], p['d_'], p['inv_dv_min'], p['inv_dv_max']
+        for i in range(self.nSegments - 1):
             j = i + 1
             disti = d[i + 1] - d[i]
             distj = d[j + 1] - d[j]
             disti_ = d_[i + 1] - d_[i]
             distj_ = d_[j + 1] - d_[j]
-            coor += -disti * distj * inv_dv_max * z + distj * t[i] - disti * t[
-                j] <= 0, 'Outbound Max speed diff A' + str(i) + str(j)
-            coor += disti * distj * inv_dv_min * z + distj * t[i] - disti * t[
-                j] >= 0, 'Outbound Min speed diff A' + str(i) + str(j)
-            coor += -disti_ * distj_ * inv_dv_max * z + distj_ * t_[i] - disti_ * t_[
-                j] <= 0, 'Inbound Max speed diff A' + str(i) + str(j)
-            coor += disti_ * distj_ * inv_dv_min * z + distj_ * t_[i] - disti_ * t_[
-                j] >= 0, 'Inbound Min speed diff A' + str(i) + str(j)
+            yield f'Outbound Max speed diff A{i}_{j}', \
+                {z: -disti * distj * inv_dv_max, t[i]: distj, t[j]: -disti}, lp.LpConstraintLE, 0
+            yield f'Outbound Min speed diff A{i}_{j}', \
+                {z: disti * distj * inv_dv_min, t[i]: distj, t[j]: -disti}, lp.LpConstraintGE, 0
+            yield f'Inbound Max speed diff A{i}_{j}', \
+                {z: -disti_ * distj_ * inv_dv_max, t_[i]: distj_, t_[j]: -disti_}, lp.LpConstraintLE, 0
+            yield f'Inbound Min speed diff A{i}_{j}', \
+                {z: disti_ * distj_ * inv_dv_min, t_[i]: distj_, t_[j]: -disti_}, lp.LpConstraintGE, 0
 
+    def offset_rows(self) -> Iterator[tuple]:
         # Offset constraints
-        for i in range(nSegments):
+        p, w, w_, t, t_, m = self.params, self.w, self.w_, self.t, self.t_, self.m
+        r, r_, l, l_, tau, tau_ = p['r'], p['r_'], p['l'], p['l_'], p['tau'], p['tau_']
+        for i in range(self.nSegments):
             j = i + 1
-            if leftturnleadlag:
-                coor += w[i] + w_[i] - w[j] - w_[j] + t[i] + t_[i] + delta[i] * l[i] - delta_[i] * l_[i] - delta[j] * l[
-                    j] + delta_[j] * l_[j] - m[i] == r[j] - r[i] + tau_[i] + tau[j], 'Offset constraint A' + str(i)
-            elif not leftturnleadlag:
-                coor += w[i] + w_[i] - w[j] - w_[j] + t[i] + t_[i] + Deltas[i] - Deltas[j] - m[i] == 0.5 * (
-                            r[j] + r_[j]) - 0.5 * (r[i] + r_[i]) + (tau_[i] + tau[j]), 'Offset constraint A' + str(i)
-
-        # Additional constraints
-
-        # Bandwidth constraints that require enough time for BOTH the band and queue clearance
-        if tau_cstr_flag:
-            for i in range(nSignals):
-                coor += w[i] + b <= 1 - r[i] - tau[i], 'Outbound Bandwidth queue clearance constraint S' + str(i)
-                coor += w_[i] + b_ <= 1 - r_[i], 'Inbound Bandwidth constraint S' + str(i)
-                coor += w_[i] >= tau_[i], 'Inbound Bandwidth queue clearance constraint S' + str(i)
-
-        # Bandwidth constraints that require enough time for BOTH the band and all previous queue clearances
-        if tau_sum_flag:
-            for i in range(nSignals):
-                coor += w[i] + b <= 1 - r[i] - np.sum(tau[:i + 1]), 'Outbound Bandwidth sum tau constraint S' + str(i)
-                coor += w_[i] + b_ <= 1 - r_[i], 'Inbound Bandwidth constraint S' + str(i)
-                coor += w_[i] >= np.sum(tau_[:nSignals - 1 - i]), 'Inbound Bandwidth sum tau constraint S' + str(i)
+            coefficients = {w[i]: 1, w_[i]: 1, w[j]: -1, w_[j]: -1, t[i]: 1, t_[i]: 1, m[i]: -1}
+            if p['leftturnleadlag']:
+                coefficients.update({self.delta[i]: l[i], self.delta_[i]: -l_[i],
+                                     self.delta[j]: -l[j], self.delta_[j]: l_[j]})
+                yield 'Offset constraint A' + str(i), coefficients, lp.LpConstraintEQ, \
+                    r[j] - r[i] + tau_[i] + tau[j]
+            elif not p['leftturnleadlag']:
+                yield 'Offset constraint A' + str(i), coefficients, lp.LpConstraintEQ, \
+                    0.5 * (r[j] + r_[j]) - 0.5 * (r[i] + r_[i]) + (tau_[i] + tau[j]) - self.Deltas[i] + self.Deltas[j]
 
+    # Additional constraints
+    def start_band_rows(self) -> Iterator[tuple]:
         # Start band constraint requires that first second of green on first intersection is part of the band
         # Typically tau[0] = 0 (no queue clearance on the first intersection) If for some reason a more specific
         # starting time is desired, tau[0] can be specified to be any value, making it possible to start the band at
         # any specific time moment after red.
-        if w_0_flag:
-            coor += w[0] == tau[0], 'Outbound start band constraint'
-            coor += w_[nSignals - 1] == 1 - r_[nSignals - 1] - b_, 'Inbound start band constraint'
+        if self.params['w_0_flag']:
+            last = self.nSignals - 1
+            yield 'Outbound start band constraint', {self.w[0]: 1}, lp.LpConstraintEQ, self.params['tau'][0]
+            yield 'Inbound start band constraint', {self.w_[last]: 1, self.b_: 1}, \
+                lp.LpConstraintEQ, 1 - self.params['r_'][last]
 
+    def start_offset_rows(self) -> Iterator[tuple]:
         # Start offset constraints requires that distance from red to band be ever increasing downstream the arterial
-        if w_mono_flag:
-            for i in range(nSegments):
-                coor += w[i] - w[i + 1] <= 0, 'Outbound increasing start offset constraint ' + str(i)
-            for i in range(nSegments):
-                # coor += w_[i]-w_[i+1] <= 0, 'Inbound increasing start offset constraint '+str(i)
-                coor += w_[i + 1] - w_[i] >= r_[i] - r_[i + 1], 'Inbound increasing start offset constraint ' + str(i)
+        if self.params['w_mono_flag']:
+            w, w_, r_ = self.w, self.w_, self.params['r_']
+            for i in range(self.nSegments):
+                yield 'Outbound increasing start offset constraint ' + str(i), {w[i]: 1, w[i + 1]: -1}, \
+                    lp.LpConstraintLE, 0
+            for i in range(self.nSegments):
+                yield 'Inbound increasing start offset constraint ' + str(i), {w_[i + 1]: 1, w_[i]: -1}, \
+                    lp.LpConstraintGE, r_[i] - r_[i + 1]
 
+    def left_turn_rows(self) -> Iterator[tuple]:
         # Left-turn lead/lag constraints
         # Ensures only pattern 1 or 2 is selected, so lead-lag or lag-lead and NOT pattern 3 or 4: lead-lead or lag-lag
-        if lt_leadlag_flag:
-            for i in range(nSignals):
-                coor += delta[i] + delta_[i] == 1, 'Left-turn lead/lag S' + str(i)
+        if self.params['lt_leadlag_flag']:
+            for i in range(self.nSignals):
+                yield 'Left-turn lead/lag S' + str(i), {self.delta[i]: 1, self.delta_[i]: 1}, lp.LpConstraintEQ, 1
 
         # Makes sure that only pattern 3 or 4 can be selected so lead-lead or lag-lag
-        if lt_leadlead_flag:
-            for i in range(nSignals):
-                coor += delta[i] - delta_[i] == 0, 'Left-turn lead/lead S' + str(i)
+        if self.params['lt_leadlead_flag']:
+            for i in range(self.nSignals):
+                yield 'Left-turn lead/lead S' + str(i), {self.delta[i]: 1, self.delta_[i]: -1}, lp.LpConstraintEQ, 0
 
         # Makes sure that only 4 can be selected so only lag-lag
-        if lt_laglag_flag:
-            for i in range(nSignals):
-                coor += delta[i] + delta_[i] == 2, 'Left-turn lag/lag S' + str(i)
+        if self.params['lt_laglag_flag']:
+            for i in range(self.nSignals):
+                yield 'Left-turn lag/lag S' + str(i), {self.delta[i]: 1, self.delta_[i]: 1}, lp.LpConstraintEQ, 2
 
+    def offset_limit_rows(self) -> Iterator[tuple]:
         # Gerbens offset constraint: Maximum 1 cycle offset between successive TLC's
-        if mi_mj_max_1_flag:
-            for i in range(nSegments):
-                coor += m[i] + m[i + 1] <= 1, 'Gerbens offset contraint' + str(i)
-        if m_max_1_flag:
-            for i in range(nSignals):
-                coor += m[i] <= 1, 'Gerbens offset contraint' + str(i)
+        if self.params['mi_mj_max_1_flag']:
+            for i in range(self.nSegments):
+                yield 'Gerbens successive offset contraint' + str(i), {self.m[i]: 1, self.m[i + 1]: 1}, \
+                    lp.LpConstraintLE, 1
+        if self.params['m_max_1_flag']:
+            for i in range(self.nSignals):
+                yield 'Gerbens offset contraint' + str(i), {self.m[i]: 1}, lp.LpConstraintLE, 1
+
+    def update(self, params: Union[dict, Corridor]) -> List[str]:
+        """Rewrites the constraints affected by the inputs that differ from the current ones, returns the rewritten
+        groups. The number of signals and the constraint flags fix the model structure and cannot be updated."""
+        if isinstance(params, Corridor):
+            params = params.params()
+        for key in ['nSignals'] + constraint_flags:
+            if params[key] != self.params[key]:
+                raise ValueError(f'{key} changes the structure of the model, build a new MaxbandModel instead')
+        changed = [key for key in group_dependencies if not np.array_equal(params[key], self.params[key])]
+        self.params = params
+        groups = [group for group in self.groups if any(group in group_dependencies[key] for key in changed)]
+        for group in groups:
+            # Matched by position, a row can change its name (k crossing 1) but not its place in the group
+            for constraint, (_, coefficients, sense, rhs) in zip(self.group_constraints[group],
+                                                                 getattr(self, group + '_rows')()):
+                set_constraint(constraint, coefficients, sense, rhs)
+        if 'k' in changed:
+            self.coor.setObjective(self.objective())
+        if self.presolve:
+            self.set_offset_bounds()
+        return groups
+
+    def update_signal_timings(self, signal: Optional[int] = None, **timings) -> List[str]:
+        """Changes signal timings (r, r_, l, l_, tau, tau_) and rewrites the constraints that depend on them, returns
+        the rewritten groups. With a signal index each timing is a single fraction for that signal, without one an
+        array for all signals, e.g. update_signal_timings(3, r=0.55, r_=0.5)."""
+        params = dict(self.params)
+        for key, value in timings.items():
+            if key not in signal_timing_inputs:
+                raise ValueError(f'{key} is not a signal timing, choose from {signal_timing_inputs}')
+            values = list(params[key])
+            if signal is None:
+                if len(value) != self.nSignals:
+                    raise ValueError(f'{key} needs {self.nSignals} values, not {len(value)}')
+                values = [float(v) for v in value]
+            else:
+                values[signal] = float(value)
+            params[key] = values
+        return self.update(params)
+
+    def update_bounds(self, **bounds) -> List[str]:
+        """Changes single inputs (c_min, c_max, v_min, v_max, inv_dv_min, inv_dv_max, k) in the units of the GUI and
+        config files, speeds in km/h, and rewrites the constraints that depend on them, returns the rewritten groups"""
+        params = dict(self.params)
+        for key, value in bounds.items():
+            if key not in scalar_inputs:
+                raise ValueError(f'{key} is not a single input, choose from {scalar_inputs}')
+            params[key] = float(value) / 3.6 if key in ('v_min', 'v_max') else float(value)
+        return self.update(params)
+
+    def resolve(self, solver=None) -> Tuple[dict, int]:
+        """Solves the model as it is now, starting from the integer solution of the previous solve, and returns the
+        output_dict and status. Without a solver a CBC command with MIP start is kept on the model."""
+        if solver is None:
+            if self.solver is None:
+                self.solver = lp.PULP_CBC_CMD(msg=False, warmStart=True)
+            solver = self.solver
+        self.set_warm_start()
+        status = self.solve(solver)
+        return self.get_results(), status
 
-        coor.solve()
+    def set_offset_bounds(self) -> None:
+        low, high = offset_bounds(self.params)
+        for i in range(self.nSegments):  # without a travel time bound an offset has no bound either
+            self.m[i].lowBound = int(low[i]) if np.isfinite(low[i]) else None
+            self.m[i].upBound = int(high[i]) if np.isfinite(high[i]) else None
 
+    def integer_variables(self) -> List[lp.LpVariable]:
+        variables = list(self.m.values())
+        if self.params['leftturnleadlag']:
+            variables += list(self.delta.values()) + list(self.delta_.values())
+        return variables
+
+    def set_warm_start(self) -> None:
+        """Uses the integer solution of the previous solve (m, delta, delta_) as MIP start for the next one, requires
+        a solver created with warmStart=True"""
+        for variable in self.integer_variables():
+            if variable.varValue is not None:
+                variable.setInitialValue(round(variable.varValue), check=False)
+
+    def solve(self, solver=None) -> int:
+        return self.coor.solve(solver)
+
+    def get_results(self) -> dict:
         # Retracting results
-        self.output_dict['OB_w'] = [w[i].value() for i in range(nSignals)]
-        self.output_dict['IB_w'] = [w_[i].value() for i in range(nSignals)]
-        self.output_dict['OB_t'] = [t[i].value() for i in range(nSegments)]
-        self.output_dict['IB_t'] = [t_[i].value() for i in range(nSegments)]
-        self.output_dict['offsets'] = [m[i].value() for i in range(nSegments)]
-        self.output_dict['OB_band'] = b.value()
-        self.output_dict['IB_band'] = b_.value()
-        self.output_dict['inv_CT'] = z.value()
-        if leftturnleadlag:
-            self.output_dict['OB_delta'] = [delta[i].value() for i in range(nSignals)]
-            self.output_dict['IB_delta'] = [delta_[i].value() for i in range(nSignals)]
-
-        return self.output_dict, coor.status
+        output_dict = dict()
+        output_dict['OB_w'] = [self.w[i].value() for i in range(self.nSignals)]
+        output_dict['IB_w'] = [self.w_[i].value() for i in range(self.nSignals)]
+        output_dict['OB_t'] = [self.t[i].value() for i in range(self.nSegments)]
+        output_dict['IB_t'] = [self.t_[i].value() for i in range(self.nSegments)]
+        output_dict['offsets'] = [self.m[i].value() for i in range(self.nSegments)]
+        output_dict['OB_band'] = self.b.value()
+        output_dict['IB_band'] = self.b_.value()
+        output_dict['inv_CT'] = self.z.value()
+        if self.params['leftturnleadlag']:
+            output_dict['OB_delta'] = [self.delta[i].value() for i in range(self.nSignals)]
+            output_dict['IB_delta'] = [self.delta_[i].value() for i in range(self.nSignals)]
+        return output_dict
+
+
+class RunMaxband():
+
+    def __init__(self, inputs, solver=None, backend: Union[str, SolverBackend] = 'cbc', cache=None,
+                 telemetry_path: Optional[str] = None, input_warnings: Optional[List[str]] = None):
+        self.input_dict = inputs
+        self.output_dict = {}
+        self.solver = solver  # PuLP solver command for the cbc backend, None uses PuLP's default CBC
+        self.backend = backend  # name of a backend in Solver_Backends.backends or a SolverBackend instance
+        self.cache = cache  # Result_Cache.ResultCache, inputs solved before are answered without starting a solver
+        self.telemetry_path = telemetry_path  # JSON lines file the telemetry of every run is appended to
+        self.telemetry = {}  # phase timings and MIP progress of the last run, see Solver_Telemetry
+        # Warnings of inputs that passed Presolve_MAXBAND already (Batch_MAXBAND.validate_scenarios), given the inputs
+        # are not checked again
+        self.input_warnings = input_warnings
+
+    def get_backend(self) -> SolverBackend:
+        if isinstance(self.backend, SolverBackend):
+            return self.backend
+        if self.backend == 'cbc':
+            return CbcBackend(solver=self.solver or lp.LpSolverDefault)
+        return get_backend(self.backend)
+
+    def run_maxband(self) -> Tuple[dict, str]:
+        backend = self.get_backend()
+        timer = PhaseTimer()
+        self.telemetry = {'backend': backend.name, 'cache_hit': False}
+        if self.cache is not None:
+            with timer.phase('cache'):
+                key = self.cache.key(self.input_dict, backend.name)
+                cached = self.cache.get(key)
+            if cached is not None:
+                self.output_dict, status = cached
+                self.telemetry.update(cache_hit=True, status=status, phases=timer.phases)
+                self.emit_telemetry()
+                return self.output_dict, status
+
+        with timer.phase('parse'):
+            params = parse_inputs(self.input_dict)
+        if self.input_warnings is None:
+            with timer.phase('presolve'):
+                problems, warnings = check_inputs(params)
+        else:
+            problems, warnings = [], self.input_warnings
+        if warnings:
+            self.telemetry['input_warnings'] = warnings
+        if problems:  # the solver is not started for inputs without a solution
+            self.output_dict, status = dict(), -1
+            self.telemetry.update(nSignals=params['nSignals'], status=status, infeasible_inputs=problems,
+                                  phases=timer.phases)
+            self.emit_telemetry()
+            return self.output_dict, status
+        self.output_dict, status = backend.solve(params)
+        if self.cache is not None:
+            self.cache.put(key, self.output_dict, status, backend.telemetry)
+        self.telemetry.update(nSignals=params['nSignals'], status=status, **backend.telemetry)
+        self.telemetry['phases'] = {**timer.phases, **backend.telemetry.get('phases', {})}
+        self.emit_telemetry()
+        return self.output_dict, status
+
+    def emit_telemetry(self) -> None:
+        if self.telemetry_path is not None:
+            write_telemetry(self.telemetry_path, self.telemetry)
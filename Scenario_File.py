@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import sys
+from os.path import basename, join, splitext
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from config import Config
+from Run_MAXBAND import Corridor, constraint_flags
+
+# A scenario file holds one corridor per line as a JSON object with its name and the sections of the config files:
+# {"scenario": "almere", "SingleInputs": {"nsignals": 7, "c_min": 66, ...}, "SegmentInputs": {"outbound_d": [374,
+# ...], ...}, "SignalInputs": {...}, "Selections": {"leftturnleadlag": false, ...}}, with the numbers as numbers
+input_sections = ['SingleInputs', 'SegmentInputs', 'SignalInputs']
+
+
+def json_number(text) -> object:
+    """A number of the inputs as JSON number, integers stay integers"""
+    value = float(text)
+    return int(value) if value.is_integer() and '.' not in str(text) else value
+
+
+def inputs_record(name: str, inputs: dict) -> dict:
+    """The line of a corridor in a scenario file, from inputs in the layout of Config.get_run_inputs"""
+    return {'scenario': name,
+            'SingleInputs': {key: json_number(value) for key, value in inputs['SingleInputs'].items()},
+            'SegmentInputs': {key: [json_number(v) for v in values] for key, values in inputs['SegmentInputs'].items()},
+            'SignalInputs': {key: [json_number(v) for v in values] for key, values in inputs['SignalInputs'].items()},
+            'Selections': {flag: bool(inputs['Selections'].get(flag, False)) for flag in constraint_flags}}
+
+
+def record_inputs(record: dict) -> dict:
+    """The inputs of a corridor in the section layout of the config files (SingleInputs, SegmentInputs, SignalInputs
+    and Selections), numbers may be JSON numbers or strings. Flags left out of Selections are off."""
+    if not isinstance(record, dict):
+        raise ValueError('A corridor is a JSON object with the sections SingleInputs, SegmentInputs, SignalInputs and '
+                         'Selections')
+    missing = [section for section in input_sections if section not in record]
+    if missing:
+        raise ValueError(f'The corridor misses the sections {missing}')
+    try:
+        selections = dict.fromkeys(constraint_flags, False)
+        for flag, value in record.get('Selections', {}).items():
+            if isinstance(value, str):  # as configparser reads booleans
+                value = value.strip().lower() in ('1', 'yes', 'true', 'on')
+            selections[flag] = bool(value)
+        return {'SingleInputs': {key: str(value) for key, value in record['SingleInputs'].items()},
+                'SegmentInputs': {key: [str(v) for v in values] for key, values in record['SegmentInputs'].items()},
+                'SignalInputs': {key: [str(v) for v in values] for key, values in record['SignalInputs'].items()},
+                'Selections': selections}
+    except (AttributeError, TypeError):
+        raise ValueError('The sections of a corridor are JSON objects, the segment and signal inputs lists')
+
+
+def read_scenarios(path: str) -> Iterator[dict]:
+    """Streams the corridors of a scenario file, one line at a time. Every corridor is parsed into a Corridor, which
+    checks the numbers and list lengths, and yielded as {'scenario', 'path', 'inputs', 'corridor'}. A line that cannot
+    be parsed is yielded as {'scenario', 'path', 'status': None, 'error'} and reading goes on. The path of a corridor
+    is the file and line, path:line, which is unique where the names may not be."""
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = {'scenario': str(number), 'path': f'{path}:{number}'}
+            try:
+                data = json.loads(line)
+                if isinstance(data, dict):
+                    record['scenario'] = str(data.get('scenario', number))
+                inputs = record_inputs(data)
+                record['corridor'] = Corridor.from_inputs(inputs)
+            except (ValueError, KeyError) as e:  # JSONDecodeError is a ValueError
+                yield dict(record, status=None, error=f'{type(e).__name__}: {e}')
+                continue
+            record['inputs'] = inputs
+            yield record
+
+
+def write_scenarios(scenarios: Iterable[Tuple[str, dict]], path: str) -> int:
+    """Writes (name, inputs) pairs as a scenario file, returns the number written"""
+    count = 0
+    with open(path, 'w') as out:
+        for name, inputs in scenarios:
+            out.write(json.dumps(inputs_record(name, inputs), separators=(',', ':')) + '\n')
+            count += 1
+    return count
+
+
+def ini_to_scenarios(paths: Iterable[str], path: str) -> int:
+    """Collects .ini scenario files into one scenario file, named after the files"""
+    def scenarios():
+        for ini_path in paths:
+            inputs = Config(ini_path).get_run_inputs()
+            if inputs is None:
+                raise FileNotFoundError(f'Scenario file {ini_path} does not exist')
+            yield splitext(basename(ini_path))[0], inputs
+    return write_scenarios(scenarios(), path)
+
+
+def scenarios_to_ini(path: str, directory: str) -> List[str]:
+    """Writes every corridor of a scenario file as <scenario>.ini into the directory, returns the files written.
+    Corridors that cannot be parsed are skipped with a message."""
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for record in read_scenarios(path):
+        if 'error' in record:
+            print(f"Skipped {record['path']}: {record['error']}")
+            continue
+        ini_path = join(directory, f"{record['scenario']}.ini")
+        Config.write_config_file(ini_path, record['inputs'])
+        written.append(ini_path)
+    return written
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Convert between .ini scenario files and a JSON lines scenario file.')
+    parser.add_argument('source', help='Directory with .ini files or a manifest (to a scenario file), or a .jsonl '
+                                       'scenario file (to .ini files)')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Scenario file to write, or the directory for the .ini files')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from Batch_MAXBAND import find_scenario_files
+    args = parse_arguments(argv)
+    if args.source.endswith('.jsonl'):
+        written = scenarios_to_ini(args.source, args.output)
+        print(f'{len(written)} scenarios written to {args.output}')
+    else:
+        count = ini_to_scenarios(find_scenario_files(args.source), args.output)
+        print(f'{count} scenarios written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
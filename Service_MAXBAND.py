@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from typing import Dict, Optional, Tuple
+
+from Batch_MAXBAND import solve_scenario, threads_per_worker
+from Process_Results import ProcessResults
+from Result_Cache import ResultCache, canonical_key
+from Run_MAXBAND import Corridor, status_dict
+from Scenario_File import record_inputs
+from Solver_Backends import backends
+
+reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+max_body_bytes = 10_000_000
+
+
+def parsed_inputs(corridor: dict) -> dict:
+    """The inputs of a corridor of a request, parsed once here so that inputs with missing or malformed numbers are
+    answered with their error before they get to the service"""
+    inputs = record_inputs(corridor)
+    Corridor.from_inputs(inputs)
+    return inputs
+
+
+def result_timings(inputs: dict, outputs: dict) -> dict:
+    """The band, red and left-turn timings [cycles] and segment speeds [km/h] of ProcessResults as lists"""
+    processed = ProcessResults(inputs, outputs).get_processed_results_dict()
+    return {key: value.tolist() if hasattr(value, 'tolist') else value for key, value in processed.items()}
+
+
+def _solve_request(inputs: dict, threads: int, timeout: Optional[float], backend: str) -> dict:
+    # Runs in a worker process, the timings are computed there as well so the event loop only passes JSON on
+    record = solve_scenario('request', inputs, backend=backend, time_limit=timeout, threads=threads)
+    record.pop('scenario')
+    if record['status'] in (1, 2):
+        record['timings'] = result_timings(inputs, record['outputs'])
+    return record
+
+
+class SolveService:
+    """Solves corridors in a pool of worker processes for the HTTP server. Requests for inputs that are being solved
+    already wait for that solve instead of starting another one (coalescing); with a cache, inputs solved before are
+    answered from it."""
+
+    def __init__(self, workers: Optional[int] = None, backend: str = 'cbc', timeout: Optional[float] = None,
+                 cache: Optional[ResultCache] = None):
+        self.workers = workers or cpu_count() or 1
+        self.backend = backend
+        self.timeout = timeout
+        self.cache = cache
+        self.threads = threads_per_worker(self.workers)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.in_flight: Dict[str, asyncio.Future] = dict()
+        self.counts = dict.fromkeys(['requests', 'solved', 'coalesced', 'cache_hits', 'errors'], 0)
+
+    async def solve(self, inputs: dict) -> dict:
+        self.counts['requests'] += 1
+        key = canonical_key(inputs, self.backend)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.counts['cache_hits'] += 1
+                outputs, status = cached
+                record = {'status': status, 'status_text': status_dict.get(status, 'Undefined'), 'outputs': outputs,
+                          'cache_hit': True}
+                if status in (1, 2):
+                    record['timings'] = result_timings(inputs, outputs)
+                return record
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.counts['coalesced'] += 1
+            return dict(await self.result(future), coalesced=True)
+
+        future = asyncio.get_running_loop().run_in_executor(self.pool, _solve_request, inputs, self.threads,
+                                                            self.timeout, self.backend)
+        self.in_flight[key] = future
+        try:
+            record = await self.result(future)
+        finally:
+            if future.done():
+                del self.in_flight[key]
+            else:
+                future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        self.counts['solved'] += 1
+        if record.get('status') is None:
+            self.counts['errors'] += 1
+        elif self.cache is not None:
+            self.cache.put(key, record['outputs'], record['status'], record.get('telemetry'))
+        return dict(record, coalesced=False)
+
+    @staticmethod
+    async def result(future: asyncio.Future) -> dict:
+        try:
+            return await asyncio.shield(future)  # a client that goes away does not cancel the solve of the others
+        except Exception as e:  # the worker process died
+            return {'status': None, 'error': f'{type(e).__name__}: {e}'}
+
+    def status(self) -> dict:
+        return {'workers': self.workers, 'backend': self.backend, 'in_flight': len(self.in_flight), **self.counts}
+
+    def close(self) -> None:
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, dict, bytes]]:
+    """Method, path, headers (lower case names) and body of the next request on the connection, None once the client
+    has closed it"""
+    line = await reader.readline()
+    if not line:
+        return None
+    method, path, _ = line.decode('latin-1').split(' ', 2)
+    headers = dict()
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > max_body_bytes:
+        raise ValueError(f'Request body of {length} bytes is larger than {max_body_bytes}')
+    body = await reader.readexactly(length) if length else b''
+    return method, path.split('?')[0], headers, body
+
+
+def response_head(code: int, content_type: str, extra: str) -> bytes:
+    return (f'HTTP/1.1 {code} {reasons[code]}\r\nContent-Type: {content_type}\r\n{extra}\r\n').encode()
+
+
+async def send_json(writer: asyncio.StreamWriter, code: int, payload) -> None:
+    body = json.dumps(payload).encode()
+    writer.write(response_head(code, 'application/json', f'Content-Length: {len(body)}\r\n') + body)
+    await writer.drain()
+
+
+class SolveServer:
+    """Local HTTP/1.1 JSON front end of a SolveService, on asyncio and the standard library only.
+
+    POST /solve   a corridor, answered with its status, outputs, timings and telemetry
+    POST /batch   an object of named corridors (or a list), answered as a stream of JSON lines, one record per
+                  corridor in the order they finish
+    GET  /status  worker count and request counters
+    Connections are kept alive, so a client can send any number of requests over one."""
+
+    def __init__(self, service: SolveService, host: str = '127.0.0.1', port: int = 8765):
+        self.service = service
+        self.host = host
+        self.port = port
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except (ValueError, asyncio.IncompleteReadError) as e:
+                    await send_json(writer, 413 if 'larger' in str(e) else 400, {'error': str(e)})
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                await self.route(writer, method, path, body)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes) -> None:
+        if path == '/status':
+            await send_json(writer, 200, self.service.status())
+            return
+        if path not in ('/solve', '/batch'):
+            await send_json(writer, 404, {'error': f'Unknown path {path}, use /solve, /batch or /status'})
+            return
+        if method != 'POST':
+            await send_json(writer, 405, {'error': f'{path} takes POST requests'})
+            return
+        start = time.perf_counter()
+        try:
+            payload = json.loads(body)
+            if path == '/solve':
+                inputs = parsed_inputs(payload)
+            elif not isinstance(payload, (dict, list)):
+                raise ValueError('A batch is a JSON object of named corridors or a list of corridors')
+        except (ValueError, KeyError, TypeError) as e:
+            await send_json(writer, 400, {'error': f'{type(e).__name__}: {e}'})
+            return
+        if path == '/solve':
+            record = await self.service.solve(inputs)
+            record['service_s'] = time.perf_counter() - start
+            await send_json(writer, 200, record)
+            return
+        await self.stream(writer, dict(payload.items() if isinstance(payload, dict) else enumerate(payload)), start)
+
+    async def stream(self, writer: asyncio.StreamWriter, corridors: dict, start: float) -> None:
+        """Chunked JSON lines, every record is sent as soon as its corridor is solved. A corridor that is not valid
+        gets a record with its error, the others are solved."""
+        writer.write(response_head(200, 'application/x-ndjson', 'Transfer-Encoding: chunked\r\n'))
+
+        async def solve(name: str, corridor) -> dict:
+            try:
+                inputs = parsed_inputs(corridor)
+            except (ValueError, KeyError, TypeError) as e:
+                return {'scenario': name, 'status': None, 'error': f'{type(e).__name__}: {e}'}
+            return {'scenario': name, **await self.service.solve(inputs)}
+        for task in asyncio.as_completed([solve(str(name), corridor) for name, corridor in corridors.items()]):
+            record = await task
+            record['service_s'] = time.perf_counter() - start
+            line = (json.dumps(record) + '\n').encode()
+            writer.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+            await writer.drain()
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def serve(self) -> None:
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f'Serving MAXBAND on http://{self.host}:{self.port} with {self.service.workers} workers '
+              f'({self.service.backend})', flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+def parse_arguments(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Serve MAXBAND solves over HTTP/JSON on localhost.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1, local only)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('-b', '--backend', choices=list(backends), default='cbc', help='Solver backend (default: cbc)')
+    parser.add_argument('--timeout', type=float, default=None, help='Solver time limit per corridor [s]')
+    parser.add_argument('--cache', type=int, default=0, metavar='ENTRIES',
+                        help='Keep the results of this many corridors in memory (default: 0, no cache)')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = parse_arguments(argv)
+    cache = ResultCache(max_entries=args.cache) if args.cache > 0 else None
+    service = SolveService(args.workers, args.backend, args.timeout, cache)
+    try:
+        asyncio.run(SolveServer(service, args.host, args.port).serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
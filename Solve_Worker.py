@@ -0,0 +1,130 @@
+import multiprocessing
+import os
+import queue
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from Solver_Telemetry import parse_cbc_log
+
+
+class LiveLog:
+    """CBC buffers its log in blocks when it writes to a file, but per line when it writes to a terminal. Where
+    pseudo-terminals exist CBC is given one (solver_path) and a thread copies what it writes to the log file, so the
+    progress can be followed while it runs. Elsewhere CBC writes the file directly and it fills at the end."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.solver_path = path
+        self.thread = None
+        if hasattr(os, 'openpty'):
+            self.master, self.slave = os.openpty()
+            self.solver_path = os.ttyname(self.slave)
+            self.thread = threading.Thread(target=self.copy, daemon=True)
+            self.thread.start()
+
+    def copy(self) -> None:
+        with open(self.path, 'ab') as log:
+            while True:
+                try:
+                    data = os.read(self.master, 4096)
+                except OSError:  # the terminal is closed
+                    break
+                if not data:
+                    break
+                log.write(data)
+                log.flush()
+
+    def close(self) -> None:
+        if self.thread is not None:
+            os.close(self.slave)
+            self.thread.join(timeout=1)
+            os.close(self.master)
+
+
+def _solve(inputs: dict, log_path: str, results: multiprocessing.Queue) -> None:
+    # A process group of its own, so a cancel ends the CBC executable this process starts as well
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    import pulp as lp
+    from Run_MAXBAND import RunMaxband
+    log = LiveLog(log_path)
+    try:
+        runner = RunMaxband(inputs, solver=lp.PULP_CBC_CMD(msg=False, logPath=log.solver_path))
+        outputs, status = runner.run_maxband()
+        log.close()
+        with open(log_path) as f:
+            progress = parse_cbc_log(f.read())
+        progress.pop('solve_s')
+        runner.telemetry.update(progress)
+        results.put(('done', outputs, status, runner.telemetry))
+    except Exception as e:
+        results.put(('error', f'{type(e).__name__}: {e}'))
+
+
+class SolveWorker:
+    """Runs RunMaxband in a separate process so the caller (the GUI main loop) stays responsive. The caller polls
+    progress() and result(), and can cancel() the run, which ends the worker and its CBC process."""
+
+    def __init__(self, inputs: dict):
+        self.inputs = inputs
+        descriptor, self.log_path = tempfile.mkstemp(suffix='.log')
+        os.close(descriptor)
+        context = multiprocessing.get_context('spawn')  # a fork of a process running Tk is not safe
+        self.results = context.Queue()
+        self.process = context.Process(target=_solve, args=(inputs, self.log_path, self.results), daemon=True)
+        self.start_time = None
+        self.finished = None
+
+    def start(self) -> None:
+        self.start_time = time.perf_counter()
+        self.process.start()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_time
+
+    def progress(self) -> dict:
+        """Elapsed time [s] and the MIP progress CBC logged so far: incumbent objective, best bound and gap"""
+        try:
+            with open(self.log_path) as f:
+                progress = parse_cbc_log(f.read())
+        except OSError:
+            progress = dict()
+        progress['elapsed_s'] = self.elapsed()
+        return progress
+
+    def result(self) -> Optional[tuple]:
+        """None while running, then ('done', output_dict, status, telemetry) or ('error', message)"""
+        if self.finished is None:
+            alive = self.process.is_alive()
+            try:
+                # A process that has ended may still have its result in transit
+                self.finished = self.results.get_nowait() if alive else self.results.get(timeout=1)
+            except queue.Empty:
+                if alive:
+                    return None
+                self.finished = ('error', f'Solver process ended with exit code {self.process.exitcode}')
+            self.close()
+        return self.finished
+
+    def cancel(self) -> None:
+        if self.process.is_alive():
+            if os.name == 'nt':
+                subprocess.run(['taskkill', '/F', '/T', '/PID', str(self.process.pid)], capture_output=True)
+            else:
+                try:
+                    os.killpg(self.process.pid, signal.SIGTERM)
+                except (ProcessLookupError, PermissionError):
+                    self.process.terminate()  # still starting up, not yet in its own group
+            self.process.join(timeout=5)
+        self.finished = ('cancelled',)
+        self.close()
+
+    def close(self) -> None:
+        try:
+            os.remove(self.log_path)
+        except OSError:
+            pass
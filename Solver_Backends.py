@@ -0,0 +1,217 @@
+import copy
+import os
+import tempfile
+from typing import Optional, Tuple
+
+import pulp as lp
+import numpy as np
+
+from Solver_Telemetry import PhaseTimer, parse_cbc_log, phases
+
+
+class SolverBackend:
+    """Solves the MAXBAND MILP of parsed inputs (see Run_MAXBAND.parse_inputs), every backend returns the output_dict
+    and status that ProcessResults and the GUI consume. After a solve, telemetry holds the time per phase and the MIP
+    progress the solver reports (objective, best bound, gap, nodes), None where a solver does not report it."""
+    name = ''
+
+    def __init__(self, time_limit: Optional[float] = None, threads: Optional[int] = None, msg: bool = False):
+        self.time_limit = time_limit
+        self.threads = threads
+        self.msg = msg
+        self.telemetry = dict()
+
+    def solve(self, params: dict) -> Tuple[dict, int]:
+        raise NotImplementedError
+
+    def set_telemetry(self, timer: PhaseTimer, progress: dict) -> None:
+        progress = {**dict.fromkeys(['objective', 'best_bound', 'gap', 'nodes', 'incumbents', 'first_incumbent_s']),
+                    **progress}
+        progress.pop('solve_s', None)
+        self.telemetry = {'phases': {phase: timer.phases[phase] for phase in phases if phase in timer.phases},
+                          **progress}
+
+
+class CbcBackend(SolverBackend):
+    """PuLP model solved by the CBC executable, as a subprocess with MPS and solution files on disk"""
+    name = 'cbc'
+
+    def __init__(self, time_limit: Optional[float] = None, threads: Optional[int] = None, msg: bool = False,
+                 solver=None):
+        super().__init__(time_limit, threads, msg)
+        self.solver = solver or lp.PULP_CBC_CMD(msg=msg, timeLimit=time_limit, threads=threads)
+
+    def solve(self, params: dict) -> Tuple[dict, int]:
+        from Run_MAXBAND import MaxbandModel
+        timer = PhaseTimer()
+        with timer.phase('build'):
+            model = MaxbandModel(params)
+
+        # The log of the CBC executable is the only source of its MIP progress, it is written to a temporary file
+        # unless the solver already has a log file, and printed afterwards if the solver should show it (msg). The
+        # log file is set on a copy of the solver, which may be shared (lp.LpSolverDefault) by runs in other threads.
+        solver = copy.copy(self.solver)
+        options = getattr(solver, 'optionsDict', None)
+        log_path, temporary, msg = None, False, getattr(solver, 'msg', False)
+        if options is not None:
+            solver.optionsDict = options = dict(options)
+            log_path = options.get('logPath')
+            if log_path is None:
+                descriptor, log_path = tempfile.mkstemp(suffix='.log')
+                os.close(descriptor)
+                options['logPath'] = log_path
+                temporary = True
+                solver.msg = False  # PuLP warns when msg and logPath are both set
+        progress = dict()
+        try:
+            with timer.phase('solver_call'):
+                status = model.solve(solver)
+            if log_path is not None and os.path.isfile(log_path):  # not a terminal, see Solve_Worker.LiveLog
+                with open(log_path) as f:
+                    log = f.read()
+                progress = parse_cbc_log(log)
+                if temporary and msg:
+                    print(log)
+        finally:
+            if temporary:
+                os.remove(log_path)
+
+        with timer.phase('extract'):
+            outputs = model.get_results()
+        # Writing the MPS file, starting CBC and reading its solution file is the part of the call CBC does not time
+        solver_call = timer.phases.pop('solver_call')
+        solve_s = progress.get('solve_s')  # 0.00 s on small corridors is a time all the same
+        timer.phases['solve'] = min(solver_call if solve_s is None else solve_s, solver_call)
+        timer.phases['write_launch'] = solver_call - timer.phases['solve']
+        self.set_telemetry(timer, progress)
+        return outputs, status
+
+
+class HighsBackend(SolverBackend):
+    """Matrix model passed to HiGHS through its Python bindings, in-process and without temporary files"""
+    name = 'highs'
+
+    def __init__(self, time_limit: Optional[float] = None, threads: Optional[int] = None, msg: bool = False):
+        super().__init__(time_limit, threads, msg)
+        try:
+            import highspy
+        except ImportError:
+            raise ImportError('The highs backend requires highspy, install it with: pip install highspy')
+        self.highspy = highspy
+
+    def solve(self, params: dict) -> Tuple[dict, int]:
+        from Maxband_Matrix import MaxbandMatrix
+        highspy = self.highspy
+        timer = PhaseTimer()
+        with timer.phase('build'):
+            mat = MaxbandMatrix(params)
+            row_lower, row_upper = mat.row_bounds()
+
+        model = highspy.HighsLp()
+        model.num_col_ = mat.n_columns
+        model.num_row_ = mat.n_rows
+        model.sense_ = highspy.ObjSense.kMaximize
+        model.col_cost_ = mat.c
+        model.col_lower_ = mat.lower
+        model.col_upper_ = mat.upper
+        model.row_lower_ = row_lower
+        model.row_upper_ = row_upper
+        model.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+        model.a_matrix_.start_ = mat.A.indptr
+        model.a_matrix_.index_ = mat.A.indices
+        model.a_matrix_.value_ = mat.A.data
+        model.integrality_ = [highspy.HighsVarType.kInteger if integer else highspy.HighsVarType.kContinuous
+                              for integer in mat.integrality]
+
+        h = highspy.Highs()
+        h.setOptionValue('output_flag', self.msg)
+        if self.time_limit is not None:
+            h.setOptionValue('time_limit', float(self.time_limit))
+        if self.threads is not None:
+            h.setOptionValue('threads', int(self.threads))
+        with timer.phase('write_launch'):
+            h.passModel(model)
+        with timer.phase('solve'):
+            h.run()
+
+        model_status = h.getModelStatus()
+        solution = h.getSolution()
+        has_solution = solution.value_valid
+        if model_status == highspy.HighsModelStatus.kOptimal:
+            status = 1
+        elif model_status == highspy.HighsModelStatus.kInfeasible:
+            status = -1
+        elif model_status in (highspy.HighsModelStatus.kUnbounded, highspy.HighsModelStatus.kUnboundedOrInfeasible):
+            status = -2
+        else:
+            status = 2 if has_solution else 0  # stopped on a limit
+        x = np.array(solution.col_value) if has_solution else None
+        with timer.phase('extract'):
+            outputs = mat.get_results(x)
+        info = h.getInfo()
+        self.set_telemetry(timer, {'objective': info.objective_function_value if has_solution else None,
+                                   'best_bound': info.mip_dual_bound, 'gap': info.mip_gap,
+                                   'nodes': info.mip_node_count})
+        return outputs, status
+
+
+class ScipyBackend(SolverBackend):
+    """Matrix model solved by scipy.optimize.milp (HiGHS bundled with scipy), in-process"""
+    name = 'scipy'
+
+    def build(self, params: dict):
+        from Maxband_Matrix import MaxbandMatrix
+        return MaxbandMatrix(params)
+
+    def solve(self, params: dict) -> Tuple[dict, int]:
+        from Maxband_Matrix import solve_milp
+        timer = PhaseTimer()
+        with timer.phase('build'):
+            mat = self.build(params)
+        progress = dict()
+        with timer.phase('solve'):
+            x, status = solve_milp(mat.c, mat.A, mat.senses, mat.rhs, mat.lower, mat.upper, mat.integrality,
+                                   self.time_limit, progress)
+        with timer.phase('extract'):
+            outputs = mat.get_results(x)
+        self.set_telemetry(timer, progress)
+        return outputs, status
+
+
+class MultibandBackend(ScipyBackend):
+    """Multiband model, a band per link weighted by the link volumes (see Maxband_Matrix.MultibandMatrix), solved
+    like the scipy backend"""
+    name = 'multiband'
+
+    def build(self, params: dict):
+        from Maxband_Matrix import MultibandMatrix
+        return MultibandMatrix(params)
+
+
+class RollingBackend(SolverBackend):
+    """Long corridors solved by decomposition into overlapping sub-arterials, see Decompose_MAXBAND, the time limit
+    applies to the final polish of the full model"""
+    name = 'rolling'
+
+    def solve(self, params: dict) -> Tuple[dict, int]:
+        from Decompose_MAXBAND import RollingHorizonSolver
+        solver = RollingHorizonSolver(polish_time_limit=self.time_limit, threads=self.threads, msg=self.msg)
+        outputs, status = solver.solve(params)
+        self.telemetry = {'phases': {'solve': solver.report['total_s']}, **solver.report}
+        return outputs, status
+
+
+backends = {
+    'cbc': CbcBackend,
+    'highs': HighsBackend,
+    'scipy': ScipyBackend,
+    'multiband': MultibandBackend,
+    'rolling': RollingBackend
+}
+
+
+def get_backend(name: str = 'cbc', time_limit: Optional[float] = None, threads: Optional[int] = None,
+                msg: bool = False) -> SolverBackend:
+    if name not in backends:
+        raise ValueError(f'Unknown solver backend {name}, choose one of {list(backends)}')
+    return backends[name](time_limit=time_limit, threads=threads, msg=msg)
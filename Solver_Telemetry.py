@@ -0,0 +1,84 @@
+import json
+import re
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Phases of a run, in order: input parsing, the input checks of the presolve, model build, writing the model and
+# launching the solver, the solve itself and reading back the results
+phases = ['parse', 'presolve', 'build', 'write_launch', 'solve', 'extract']
+
+
+class PhaseTimer:
+    """Wall-clock time per phase [s], a phase entered more than once accumulates"""
+
+    def __init__(self):
+        self.phases = dict()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+# Results in a CBC log that prove the objective optimal or the case infeasible, CBC reports status 1 for a run
+# stopped on a limit as well
+proven_results = ['Optimal solution found', 'Problem proven infeasible', 'Linear relaxation infeasible']
+
+
+def relative_gap(objective: Optional[float], bound: Optional[float]) -> Optional[float]:
+    if objective is None or bound is None:
+        return None
+    return abs(bound - objective) / max(abs(objective), 1e-10)
+
+
+def parse_cbc_log(text: str) -> dict:
+    """MIP progress from a CBC log: result, objective, best bound, relative gap, nodes, number of incumbents, time to
+    the first incumbent and the solve time [s]. CBC minimizes internally, so the log values of a maximization are
+    negated; the summary at the end is in the original sense and is preferred where it is available. The log of a
+    solve that is still running gives the progress so far."""
+    telemetry = dict.fromkeys(['result', 'objective', 'best_bound', 'gap', 'nodes', 'incumbents',
+                               'first_incumbent_s', 'solve_s'])
+    incumbents = re.findall(r'Integer solution of (\S+) found .*\((\S+) seconds\)', text)
+    telemetry['incumbents'] = len(incumbents)
+    if incumbents:
+        telemetry['first_incumbent_s'] = float(incumbents[0][1])
+
+    sign = -1 if re.search(r'command line - .* -max ', text) else 1
+    bounds = re.findall(r'best possible (\S+?)[),]', text)
+    match = re.search(r'Result - (.+)', text)
+    if match:
+        telemetry['result'] = match.group(1).strip()
+    match = re.search(r'Objective value:\s+(\S+)', text)
+    if match:
+        telemetry['objective'] = float(match.group(1))
+    elif incumbents:  # a log of a solve still running, the last incumbent is the best one so far
+        telemetry['objective'] = sign * float(incumbents[-1][0])
+    match = re.search(r'(?:Upper|Lower) bound:\s+(\S+)', text)
+    if match:
+        telemetry['best_bound'] = float(match.group(1))
+    elif telemetry['result'] == 'Optimal solution found':
+        telemetry['best_bound'] = telemetry['objective']
+    elif bounds:
+        telemetry['best_bound'] = sign * float(bounds[-1])
+    else:  # before the first node only the LP relaxation bounds the objective
+        match = re.search(r'Continuous objective value is (\S+)', text)
+        if match:
+            telemetry['best_bound'] = float(match.group(1))
+    telemetry['gap'] = relative_gap(telemetry['objective'], telemetry['best_bound'])
+    match = re.search(r'Enumerated nodes:\s+(\d+)', text)
+    if match:
+        telemetry['nodes'] = int(match.group(1))
+    match = re.search(r'Time \(Wallclock seconds\):\s+(\S+)', text)
+    if match:
+        telemetry['solve_s'] = float(match.group(1))
+    return telemetry
+
+
+def write_telemetry(path: str, record: dict) -> None:
+    """Appends the record to a JSON lines file"""
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
@@ -0,0 +1,116 @@
+import argparse
+import csv
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pulp as lp
+
+from config import Config
+from Result_Store import ResultStore
+from Run_MAXBAND import MaxbandModel, parse_inputs
+
+sweep_parameters = ['c_min', 'c_max', 'v_min', 'v_max', 'k', 'inv_dv_min', 'inv_dv_max']
+
+
+def sweep_points(parameter: str, start: float, stop: float, step: float) -> List[Dict[str, float]]:
+    """Points from start up to and including stop, for a single parameter"""
+    if parameter not in sweep_parameters:
+        raise ValueError(f'Cannot sweep {parameter}, choose one of {sweep_parameters}')
+    values = np.arange(start, stop + 0.5 * step, step)
+    return [{parameter: round(float(value), 10)} for value in values]
+
+
+def point_inputs(inputs: dict, point: Dict[str, float]) -> dict:
+    """A copy of the inputs with the single inputs of the sweep point filled in"""
+    new_inputs = {section: dict(values) for section, values in inputs.items()}
+    for parameter, value in point.items():
+        new_inputs['SingleInputs'][parameter] = str(value)
+    return new_inputs
+
+
+def band_summary(outputs: dict, status: int) -> dict:
+    summary = {'status': status, 'OB_band': None, 'IB_band': None, 'cycle_time': None,
+               'OB_band_s': None, 'IB_band_s': None}
+    if status != 1:
+        return summary
+    summary['OB_band'] = outputs['OB_band']
+    summary['IB_band'] = outputs['IB_band']
+    summary['cycle_time'] = 1 / outputs['inv_CT']
+    summary['OB_band_s'] = outputs['OB_band'] / outputs['inv_CT']
+    summary['IB_band_s'] = outputs['IB_band'] / outputs['inv_CT']
+    return summary
+
+
+def run_sweep(inputs: dict, points: Sequence[Dict[str, float]], solver=None, reuse_model: bool = True,
+              store: Optional[ResultStore] = None) -> List[dict]:
+    """Solves the scenario for every sweep point and returns the bandwidth table, one row per point.
+
+    With reuse_model the model is built once and only the constraints that depend on the swept parameters are
+    rewritten between points, and the integer solution of the previous point is passed to CBC as MIP start. With a
+    store the inputs, full outputs, status and solve time of every point are appended to it."""
+    if solver is None:
+        solver = lp.PULP_CBC_CMD(msg=False, warmStart=reuse_model)
+    model = None
+    table = []
+    for point in points:
+        start_time = time.perf_counter()
+        params = parse_inputs(point_inputs(inputs, point))
+        if model is None or not reuse_model:
+            model = MaxbandModel(params)
+        else:
+            model.update(params)
+            model.set_warm_start()
+        status = model.solve(solver)
+        outputs = model.get_results()
+        row = dict(point)
+        row.update(band_summary(outputs, status))
+        table.append(row)
+        if store is not None:
+            store.append({'scenario': ','.join(f'{key}={value}' for key, value in point.items()), 'status': status,
+                          'inputs': point_inputs(inputs, point), 'outputs': outputs,
+                          'telemetry': {'total_s': time.perf_counter() - start_time}})
+    if store is not None:
+        store.flush()
+    return table
+
+
+def write_table(table: List[dict], path: str) -> None:
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(table[0]))
+        writer.writeheader()
+        writer.writerows(table)
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Sweep a single input of a MAXBAND scenario.')
+    parser.add_argument('scenario', help='Scenario .ini file with the base inputs')
+    parser.add_argument('-p', '--parameter', choices=sweep_parameters, required=True, help='Input to sweep')
+    parser.add_argument('--start', type=float, required=True)
+    parser.add_argument('--stop', type=float, required=True)
+    parser.add_argument('--step', type=float, required=True)
+    parser.add_argument('-o', '--output', default='sweep.csv', help='Bandwidth table (default: sweep.csv)')
+    parser.add_argument('--store', default=None, help='Also append the full results of every point to the columnar '
+                                                      'result store in this directory')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild and cold start the model for every point')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    inputs = Config(args.scenario).get_run_inputs()
+    if inputs is None:
+        return 1
+    points = sweep_points(args.parameter, args.start, args.stop, args.step)
+    start_time = time.perf_counter()
+    store = ResultStore(args.store) if args.store is not None else None
+    table = run_sweep(inputs, points, reuse_model=not args.rebuild, store=store)
+    elapsed = time.perf_counter() - start_time
+    write_table(table, args.output)
+    print(f'Solved {len(table)} points in {elapsed:.2f} s, table written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pulp as lp
+
+from config import Config
+from Result_Store import ResultStore, store_results
+from Run_MAXBAND import MaxbandModel, parse_inputs, status_dict
+
+# Movements of the volume data per signal and direction: the arterial through and left-turn movements, the traffic
+# turning into the arterial from the upstream cross street, which queues during red and sets tau, and the critical
+# cross-street movement, whose share of the cycle is not available to the arterial
+movements = ['through', 'left', 'turn_in', 'cross']
+directions = ['outbound', 'inbound']
+default_periods = [('night', '00:00', '06:00'), ('am_peak', '06:00', '09:00'), ('midday', '09:00', '15:00'),
+                   ('pm_peak', '15:00', '19:00'), ('evening', '19:00', '24:00')]
+
+
+def minute_of_day(clock: str) -> int:
+    hours, minutes = clock.split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def time_of_day(timestamp: str) -> int:
+    """Minute of the day of a timestamp such as 2024-05-01 07:15:00, 2024-05-01T07:15 or 07:15"""
+    return minute_of_day(timestamp.strip().replace('T', ' ').split(' ')[-1]) % 1440
+
+
+def parse_period(text: str) -> Tuple[str, str, str]:
+    """name=HH:MM-HH:MM, a period may wrap around midnight (night=22:00-06:00)"""
+    name, span = text.split('=')
+    start, end = span.split('-')
+    return name, start, end
+
+
+def period_lookup(periods: List[Tuple[str, str, str]]) -> List[Optional[int]]:
+    """The index of the period of every minute of the day, None for minutes outside all periods"""
+    lookup = [None] * 1440
+    for index, (_, start, end) in enumerate(periods):
+        start, end = minute_of_day(start), minute_of_day(end)
+        minutes = range(start, end) if start < end else list(range(start, 1440)) + list(range(0, end))
+        for minute in minutes:
+            lookup[minute] = index
+    return lookup
+
+
+def read_volumes(paths: Iterable[str]) -> Iterator[dict]:
+    """Streams the rows of volume CSV files with the columns time, signal, direction, movement, volume and optionally
+    saturation (saturation flow [veh/h]), one row per counting interval"""
+    for path in paths:
+        with open(path, newline='') as f:
+            yield from csv.DictReader(f)
+
+
+class VolumeTotals:
+    """Volume and saturation flow summed per period, signal, direction and movement over any number of days, so the
+    memory needed does not grow with the length of the data"""
+
+    def __init__(self, periods: List[Tuple[str, str, str]], interval: float = 900, saturation: float = 1800):
+        self.periods = periods
+        self.lookup = period_lookup(periods)
+        self.interval = interval
+        self.saturation = saturation
+        self.totals: Dict[tuple, list] = dict()  # (period, signal, direction, movement) -> [volume, saturation, rows]
+        self.rows = 0
+        self.skipped = 0
+
+    def add(self, row: dict) -> None:
+        period = self.lookup[time_of_day(row['time'])]
+        if period is None or row['movement'] not in movements:
+            self.skipped += 1
+            return
+        key = (period, int(row['signal']), row['direction'], row['movement'])
+        totals = self.totals.setdefault(key, [0.0, 0.0, 0])
+        totals[0] += float(row['volume'])
+        totals[1] += float(row.get('saturation') or self.saturation)
+        totals[2] += 1
+        self.rows += 1
+
+    def add_rows(self, rows: Iterable[dict]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def flow_ratios(self, period: int) -> Dict[Tuple[int, str, str], float]:
+        """Mean flow over mean saturation flow per (signal, direction, movement) of a period"""
+        ratios = dict()
+        for (index, signal, direction, movement), (volume, saturation, rows) in self.totals.items():
+            if index == period:
+                flow = volume * 3600 / (rows * self.interval)
+                ratios[(signal, direction, movement)] = flow / (saturation / rows)
+        return ratios
+
+
+def signal_timings(ratios: Dict[Tuple[int, str, str], float], nSignals: int, lost_fraction: float = 0.1) -> dict:
+    """Red, left-turn and queue clearance fractions of every signal from the flow ratios, in the SignalInputs layout.
+
+    The arterial phases run in two rings, outbound through with the inbound left turn and inbound through with the
+    outbound left turn. The cycle without lost time is split between the arterial and the cross street in proportion
+    to their critical flow ratios (Webster), and the arterial share within each ring in proportion to its two
+    movements. A queue of turning-in traffic builds up during red and clears at saturation flow, so tau is the
+    turn-in flow ratio times the red fraction."""
+    signal_inputs = {f'{direction}_{key}': [] for key in ['r', 'l', 'tau'] for direction in directions}
+    for i in range(nSignals):
+        y = {(direction, movement): ratios.get((i, direction, movement), 0.0)
+             for direction in directions for movement in movements}
+        rings = {'outbound': y[('outbound', 'through')] + y[('inbound', 'left')],
+                 'inbound': y[('inbound', 'through')] + y[('outbound', 'left')]}
+        arterial = max(rings.values())
+        cross = max(y[('outbound', 'cross')], y[('inbound', 'cross')])
+        if arterial + cross <= 0:
+            raise ValueError(f'No volumes for signal {i}')
+        arterial_green = (1 - lost_fraction) * arterial / (arterial + cross)
+        for direction, opposite in [('outbound', 'inbound'), ('inbound', 'outbound')]:
+            ring = rings[direction]
+            green = arterial_green * y[(direction, 'through')] / ring if ring > 0 else arterial_green
+            red = 1 - green
+            # The left turn of the opposite direction takes the rest of the arterial share in this ring
+            signal_inputs[f'{opposite}_l'].append(f'{arterial_green - green:.3f}')
+            signal_inputs[f'{direction}_r'].append(f'{red:.3f}')
+            signal_inputs[f'{direction}_tau'].append(f'{min(y[(direction, "turn_in")] * red, green):.3f}')
+    return signal_inputs
+
+
+def period_inputs(inputs: dict, signal_inputs: dict) -> dict:
+    new_inputs = {section: dict(values) for section, values in inputs.items()}
+    new_inputs['SignalInputs'] = signal_inputs
+    return new_inputs
+
+
+def generate_plans(inputs: dict, totals: VolumeTotals, lost_fraction: float = 0.1, solver=None,
+                   reuse_model: bool = True) -> Iterator[dict]:
+    """Solves the corridor of the base inputs for the signal timings of every period and yields a record per period.
+
+    All periods share the corridor, so with reuse_model the model is built once and only the constraints that depend
+    on the signal timings are rewritten between periods, with the integer solution of the previous period as MIP
+    start."""
+    if solver is None:
+        solver = lp.PULP_CBC_CMD(msg=False, warmStart=reuse_model)
+    nSignals = int(inputs['SingleInputs']['nsignals'])
+    model = None
+    for index, (name, start, end) in enumerate(totals.periods):
+        start_time = time.perf_counter()
+        record = {'scenario': name, 'period': f'{start}-{end}'}
+        try:
+            plan_inputs = period_inputs(inputs, signal_timings(totals.flow_ratios(index), nSignals, lost_fraction))
+        except ValueError as e:
+            record.update(status=None, error=f'{type(e).__name__}: {e}')
+            yield record
+            continue
+        params = parse_inputs(plan_inputs)
+        if model is None or not reuse_model:
+            model = MaxbandModel(params)
+        else:
+            model.update(params)
+            model.set_warm_start()
+        status = model.solve(solver)
+        record.update(status=status, status_text=status_dict.get(status, 'Undefined'), inputs=plan_inputs,
+                      outputs=model.get_results(), telemetry={'total_s': time.perf_counter() - start_time})
+        yield record
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Generate a timing plan per time-of-day period from interval volume '
+                                                 'data.')
+    parser.add_argument('scenario', help='Scenario .ini file of the corridor: distances, speeds, cycle time bounds '
+                                         'and constraint flags')
+    parser.add_argument('volumes', nargs='+', help='Volume CSV files (columns time, signal, direction, movement, '
+                                                   'volume and optionally saturation)')
+    parser.add_argument('-p', '--period', action='append', type=parse_period, default=None, metavar='NAME=HH:MM-HH:MM',
+                        help='Time-of-day period, repeat for every period (default: night, am_peak, midday, '
+                             'pm_peak, evening)')
+    parser.add_argument('--interval', type=float, default=900, help='Length of a counting interval [s] (default: 900)')
+    parser.add_argument('--saturation', type=float, default=1800,
+                        help='Saturation flow of rows without one [veh/h] (default: 1800)')
+    parser.add_argument('--lost-fraction', type=float, default=0.1, help='Lost time as fraction of the cycle')
+    parser.add_argument('-o', '--output', default='plans.jsonl', help='Plan per period (default: plans.jsonl)')
+    parser.add_argument('--store', default=None, help='Also append the plans to the columnar result store in this '
+                                                      'directory')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild and cold start the model for every period')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_arguments(argv)
+    inputs = Config(args.scenario).get_run_inputs()
+    if inputs is None:
+        return 1
+    totals = VolumeTotals(args.period or default_periods, args.interval, args.saturation)
+    totals.add_rows(read_volumes(args.volumes))
+    records = generate_plans(inputs, totals, args.lost_fraction, reuse_model=not args.rebuild)
+    if args.store is not None:
+        records = store_results(records, ResultStore(args.store))
+    with open(args.output, 'w') as out:
+        for record in records:
+            out.write(json.dumps(record) + '\n')
+            outputs = record.get('outputs') or {}
+            cycle = f"{1 / outputs['inv_CT']:.1f} s" if record['status'] == 1 else '-'
+            print(f"{record['scenario']} ({record['period']}): {record.get('status_text', record.get('error'))}, "
+                  f"cycle time {cycle}")
+    print(f'{totals.rows} volume rows ({totals.skipped} outside the periods), plans written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
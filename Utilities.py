@@ -19,9 +19,9 @@ tooltips = {
                  'either the inbound, or the outbound distances have to be specified in reverse.',
     'outbound_r': 'Fraction of the cycle unavailable for the outbound band [cycles].',
     'inbound_r': 'Fraction of the cycle unavailable for the inbound band [cycles].',
-    'outbound_l': 'Fraction of the cycle needed for the outbound left-turn [cycles]. Must be greater than the '
+    'outbound_l': 'Fraction of the cycle needed for the outbound left-turn [cycles]. Should not be greater than the '
                   'inbound red time of the same signal.',
-    'inbound_l': 'Fraction of the cycle needed for the inbound left-turn [cycles]. Must be greater than the '
+    'inbound_l': 'Fraction of the cycle needed for the inbound left-turn [cycles]. Should not be greater than the '
                   'outbound red time of the same signal.',
     'outbound_tau': 'Fraction of the cycle needed for outbound queue-clearance time [cycles].',
     'inbound_tau': 'Fraction of the cycle needed for inbound queue-clearance time [cycles].',
@@ -2,14 +2,23 @@ import configparser as configparser
 from os.path import exists
 from typing import Optional
 
+section_names = ['SingleInputs', 'SegmentInputs', 'SignalInputs', 'Selections']
+
+
+def parse_list_entry(value) -> list:
+    """Turns a stored list entry, e.g. "['374', '265']" or "374, 265", back into a list of strings"""
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [v.strip().strip("'\"") for v in str(value).strip().strip('[]').split(',') if v.strip()]
+
 
 class Config:
 
-    def __init__(self):
+    def __init__(self, path: str = 'config.ini'):
         self.config: configparser.ConfigParser = configparser.ConfigParser(empty_lines_in_values=False)
-        self.path: str = 'config.ini'
+        self.path: str = path
         self.exist = self.check_for_config_file()
-        self.section_names = ['SingleInputs', 'SegmentInputs', 'SignalInputs', 'Selections']
+        self.section_names = list(section_names)
         self.input_dict = self.read_config_into_dict()
 
     def check_for_config_file(self) -> bool:
@@ -38,6 +47,15 @@ class Config:
         with open(self.path, 'w') as configfile:
             self.config.write(configfile)
 
+    @staticmethod
+    def write_config_file(path: str, input_dict: dict) -> None:
+        """Writes inputs as a new config file, without reading the file first as a Config does"""
+        config = configparser.ConfigParser(empty_lines_in_values=False)
+        for section in section_names:
+            config[section] = input_dict[section]
+        with open(path, 'w') as configfile:
+            config.write(configfile)
+
     def get_single_input_config(self) -> dict:
         return dict(self.input_dict['SingleInputs'])
 
@@ -50,6 +68,19 @@ class Config:
     def get_selection_input_config(self) -> dict:
         return dict(self.input_dict['Selections'])
 
+    def get_run_inputs(self) -> Optional[dict]:
+        """Returns the inputs in the layout RunMaxband expects, with the segment and signal entries as lists"""
+        if self.input_dict is None:
+            return
+        run_inputs = dict()
+        run_inputs['SingleInputs'] = self.get_single_input_config()
+        run_inputs['SegmentInputs'] = {key: parse_list_entry(value)
+                                       for key, value in self.get_segment_input_config().items()}
+        run_inputs['SignalInputs'] = {key: parse_list_entry(value)
+                                      for key, value in self.get_signal_input_config().items()}
+        run_inputs['Selections'] = self.get_selection_input_config()
+        return run_inputs
+
 # Settings Almere
 # nsignals = 7
 # c_min = 66
@@ -1,11 +1,9 @@
-from MB_GUI import MaxbandGUI
-
-
 def main():
+    # Imported here, so the solver worker processes, which import this module as well, do not load the GUI
+    from MB_GUI import MaxbandGUI
     app = MaxbandGUI()
     app.mainloop()
 
 
 if __name__ == '__main__':
     main()
-